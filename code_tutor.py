@@ -1,675 +1,6034 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import io
-import contextlib
-import traceback
-import os
-from datetime import datetime
-import sys  # used for tracing
-
-# --- IDLE-style syntax highlighting ---
-from idlelib.colorizer import ColorDelegator
-from idlelib.percolator import Percolator
-
-
-class MiniNotebookApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Code Tutor")
-
-        # This dict will store variables/functions between runs (like a notebook)
-        self.execution_env = {}
-
-        self._build_ui()
-        self._create_menu()
-        self._bind_shortcuts()
-
-        # Handle window close (no save prompt)
-        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
-
-    # ---------------- UI BUILDING ----------------
-
-    def _build_ui(self):
-        self.root.geometry("500x500")
-
-        main_frame = ttk.Frame(self.root, padding=10)
-        main_frame.pack(fill=tk.BOTH, expand=True)
-
-        # Code label
-        code_label = ttk.Label(main_frame, text="Python code:")
-        code_label.pack(anchor="w")
-
-        # Code text area + scrollbar
-        code_frame = ttk.Frame(main_frame)
-        code_frame.pack(fill=tk.BOTH, expand=True)
-
-        # Main code Text widget
-        self.code_text = tk.Text(
-            code_frame,
-            height=15,
-            wrap="none",
-            font=("Consolas", 11),
-            undo=True,
-        )
-        self.code_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-        # Vertical scrollbar for code
-        self.code_scroll = ttk.Scrollbar(
-            code_frame, orient="vertical", command=self.code_text.yview
-        )
-        self.code_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-        self.code_text.configure(yscrollcommand=self.code_scroll.set)
-
-        # Attach IDLE syntax highlighter
-        Percolator(self.code_text).insertfilter(ColorDelegator())
-
-        # Track cursor movement for status bar
-        self.code_text.bind("<KeyRelease>", self.update_status)
-        self.code_text.bind("<ButtonRelease-1>", self.update_status)
-
-        # Tab inserts 4 spaces
-        self.code_text.bind("<Tab>", self.insert_tab_spaces)
-
-        # Buttons
-        btn_frame = ttk.Frame(main_frame)
-        btn_frame.pack(fill=tk.X, pady=(8, 4))
-
-        run_button = ttk.Button(btn_frame, text="Run (Ctrl+Enter)", command=self.run_code)
-        run_button.pack(side=tk.LEFT)
-
-        clear_out_button = ttk.Button(btn_frame, text="Clear Output", command=self.clear_output)
-        clear_out_button.pack(side=tk.LEFT, padx=(8, 0))
-
-        clear_code_button = ttk.Button(btn_frame, text="Clear Code", command=self.clear_code)
-        clear_code_button.pack(side=tk.LEFT, padx=(8, 0))
-
-        reset_env_button = ttk.Button(btn_frame, text="Reset Env", command=self.reset_environment)
-        reset_env_button.pack(side=tk.LEFT, padx=(8, 0))
-
-        # Explain Step-by-Step button (now always Kid-style)
-        explain_button = ttk.Button(
-            btn_frame,
-            text="Explain Step-by-Step",
-            command=self.explain_step_by_step
-        )
-        explain_button.pack(side=tk.LEFT, padx=(8, 0))
-
-        # Output label
-        out_label = ttk.Label(main_frame, text="Output:")
-        out_label.pack(anchor="w", pady=(8, 0))
-
-        # Output text area + scrollbar
-        out_frame = ttk.Frame(main_frame)
-        out_frame.pack(fill=tk.BOTH, expand=True)
-
-        self.output_text = tk.Text(
-            out_frame,
-            height=10,
-            wrap="none",
-            font=("Consolas", 11),
-            state="normal",
-            bg="white",
-            fg="black",
-            insertbackground="black",
-        )
-        self.output_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-        out_scroll = ttk.Scrollbar(
-            out_frame, orient="vertical", command=self.output_text.yview
-        )
-        out_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-        self.output_text.configure(yscrollcommand=out_scroll.set)
-
-        # Status bar (line/column, last run)
-        self.status_var = tk.StringVar()
-        self.status_var.set("Ln 1, Col 1")
-        status_bar = ttk.Label(main_frame, textvariable=self.status_var, anchor="w")
-        status_bar.pack(fill=tk.X, side=tk.BOTTOM, pady=(5, 0))
-
-        # Starter example in the code box
-        starter = (
-            "count = 0\n"
-            "for i in range(1, 5):\n"
-            "    count += i\n"
-            "print(count)\n"
-        )
-        self.code_text.insert("1.0", starter)
-        self.code_text.edit_reset()  # reset undo/redo stack
-
-    def _create_menu(self):
-        menubar = tk.Menu(self.root)
-
-        # File menu – only Exit now
-        file_menu = tk.Menu(menubar, tearoff=False)
-        file_menu.add_command(label="Exit", command=self.on_close)
-        menubar.add_cascade(label="File", menu=file_menu)
-
-        # Run menu
-        run_menu = tk.Menu(menubar, tearoff=False)
-        run_menu.add_command(label="Run", command=self.run_code, accelerator="Ctrl+Enter")
-        run_menu.add_command(
-            label="Run Selection", command=self.run_selection, accelerator="Shift+Enter"
-        )
-        run_menu.add_command(label="Reset Environment", command=self.reset_environment)
-        menubar.add_cascade(label="Run", menu=run_menu)
-
-        # Examples menu
-        examples_menu = tk.Menu(menubar, tearoff=False)
-        examples_menu.add_command(
-            label="Loop: Sum 1 to 4",
-            command=lambda: self.load_example("loop_sum"),
-        )
-        examples_menu.add_command(
-            label="Strings: basic operations",
-            command=lambda: self.load_example("string_ops"),
-        )
-        examples_menu.add_command(
-            label="Lists: average of numbers",
-            command=lambda: self.load_example("list_average"),
-        )
-        examples_menu.add_command(
-            label="Functions: greeting",
-            command=lambda: self.load_example("function_greet"),
-        )
-        examples_menu.add_command(
-            label="If/elif: grade checker",
-            command=lambda: self.load_example("grade_checker"),
-        )
-        examples_menu.add_separator()
-        examples_menu.add_command(
-            label="Dictionaries: word meanings",
-            command=lambda: self.load_example("dict_lookup"),
-        )
-        examples_menu.add_command(
-            label="While loop: countdown",
-            command=lambda: self.load_example("while_countdown"),
-        )
-        examples_menu.add_command(
-            label="List comprehension: squares",
-            command=lambda: self.load_example("list_comprehension"),
-        )
-        examples_menu.add_command(
-            label="Tuples: unpacking coordinates",
-            command=lambda: self.load_example("tuple_unpack"),
-        )
-        examples_menu.add_command(
-            label="Try/except: safe division",
-            command=lambda: self.load_example("try_except"),
-        )
-        menubar.add_cascade(label="Examples", menu=examples_menu)
-
-        self.root.config(menu=menubar)
-
-    def _bind_shortcuts(self):
-        # Only run-related shortcuts
-        self.root.bind("<Control-Return>", lambda e: self.run_code())
-        self.root.bind("<Shift-Return>", self._run_selection_event)
-
-    # ---------------- EDITOR BEHAVIOUR ----------------
-
-    def insert_tab_spaces(self, event):
-        """Insert 4 spaces when Tab is pressed."""
-        self.code_text.insert("insert", " " * 4)
-        return "break"   # Stop the default behaviour
-
-    def update_status(self, event=None, extra_info=""):
-        """Update the status bar with current line/column and optional extra info."""
-        try:
-            index = self.code_text.index("insert")
-            line, col = index.split(".")
-            # Column is zero-based internally; show as 1-based
-            text = f"Ln {int(line)}, Col {int(col) + 1}"
-            if extra_info:
-                text += " | " + extra_info
-            self.status_var.set(text)
-        except tk.TclError:
-            pass  # happens if widget not yet fully initialised
-
-    # ---------------- RUNNING CODE ----------------
-
-    def run_code(self):
-        """Run the entire code cell."""
-        code = self.code_text.get("1.0", tk.END)
-
-        buffer = io.StringIO()
-        with contextlib.redirect_stdout(buffer), contextlib.redirect_stderr(buffer):
-            try:
-                exec(code, self.execution_env)
-            except Exception:
-                traceback.print_exc()
-
-        output = buffer.getvalue()
-        if not output.strip():
-            output = "[No output]\n"
-
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.output_text.insert(tk.END, f"--- Run at {timestamp} ---\n")
-        self.output_text.insert(tk.END, output + "\n")
-        self.output_text.see(tk.END)
-
-        self.update_status(extra_info=f"Last run: {timestamp}")
-
-    def _run_selection_event(self, event):
-        self.run_selection()
-        return "break"
-
-    def run_selection(self):
-        """Run only the selected code, or the current line if nothing is selected."""
-        try:
-            code = self.code_text.get("sel.first", "sel.last")
-        except tk.TclError:
-            # No selection: run the current line
-            index = self.code_text.index("insert linestart")
-            end_index = self.code_text.index("insert lineend")
-            code = self.code_text.get(index, end_index) + "\n"
-
-        buffer = io.StringIO()
-        with contextlib.redirect_stdout(buffer), contextlib.redirect_stderr(buffer):
-            try:
-                exec(code, self.execution_env)
-            except Exception:
-                traceback.print_exc()
-
-        output = buffer.getvalue()
-        if not output.strip():
-            output = "[No output]\n"
-
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.output_text.insert(tk.END, f"--- Run selection at {timestamp} ---\n")
-        self.output_text.insert(tk.END, output + "\n")
-        self.output_text.see(tk.END)
-
-        self.update_status(extra_info=f"Last run: {timestamp}")
-
-    def reset_environment(self):
-        """Clear the execution environment (variables, functions, etc.)."""
-        self.execution_env.clear()
-        # Ensure builtins remain available
-        self.execution_env["__builtins__"] = __builtins__
-        self.update_status(extra_info="Environment reset")
-
-    # ---------------- STEP-BY-STEP EXPLANATION (always Kid-style) ----------------
-
-    def explain_step_by_step(self):
-        """Trace the code line-by-line and show kid-style explanation."""
-        code = self.code_text.get("1.0", tk.END)
-        if not code.strip():
-            messagebox.showinfo("No code", "There is no code to explain.")
-            return
-
-        code_lines = code.splitlines()
-        max_steps = 200  # safety: avoid infinite loops in explanations
-        buffer = io.StringIO()
-
-        # We'll store structured steps: lineno, line text, and locals (repr strings)
-        steps = []
-
-        def trace_fn(frame, event, arg):
-            nonlocal steps
-            # Only trace lines in this code snippet (filename <string>)
-            if event == "line" and frame.f_code.co_filename == "<string>":
-                lineno = frame.f_lineno
-                if 1 <= lineno <= len(code_lines):
-                    line_text = code_lines[lineno - 1].rstrip("\n")
-                else:
-                    line_text = ""
-
-                # Build a snapshot of locals (repr string for each)
-                locals_snapshot = {}
-                for name, value in frame.f_locals.items():
-                    if name.startswith("__") and name.endswith("__"):
-                        continue
-                    try:
-                        rep = repr(value)
-                    except Exception:
-                        rep = f"<unreprable {type(value).__name__}>"
-                    if len(rep) > 60:
-                        rep = rep[:57] + "..."
-                    locals_snapshot[name] = rep
-
-                steps.append(
-                    {
-                        "lineno": lineno,
-                        "line": line_text,
-                        "locals": locals_snapshot,
-                    }
-                )
-
-                if len(steps) >= max_steps:
-                    return None
-
-            return trace_fn
-
-        # Use a fresh environment just for explanation
-        env = {"__builtins__": __builtins__}
-        try:
-            compiled = compile(code, "<string>", "exec")
-        except SyntaxError as e:
-            self.output_text.insert(
-                tk.END,
-                f"--- Step-by-step (syntax error) ---\n{e}\n\n"
-            )
-            self.output_text.see(tk.END)
-            return
-
-        old_trace = sys.gettrace()
-        timestamp = datetime.now().strftime("%H:%M:%S")
-
-        with contextlib.redirect_stdout(buffer), contextlib.redirect_stderr(buffer):
-            try:
-                sys.settrace(trace_fn)
-                exec(compiled, env)
-            except Exception:
-                traceback.print_exc()
-            finally:
-                sys.settrace(old_trace)
-
-        printed_output = buffer.getvalue()
-
-        # Always use kid-style formatter
-        rendered_lines = self._format_kid_style(steps, env)
-
-        # Write everything into the output box
-        self.output_text.insert(tk.END, f"--- Step-by-step at {timestamp} ---\n")
-        if rendered_lines:
-            for line in rendered_lines:
-                self.output_text.insert(tk.END, line + "\n")
-        else:
-            self.output_text.insert(
-                tk.END,
-                "[No steps traced – the code may be empty or didn't execute any lines]\n"
-            )
-
-        if len(steps) >= max_steps:
-            self.output_text.insert(
-                tk.END,
-                f"\n[Stopped after {max_steps} steps to avoid a very long trace]\n"
-            )
-
-        if printed_output.strip():
-            self.output_text.insert(
-                tk.END,
-                "\n--- Printed output during explanation ---\n"
-            )
-            self.output_text.insert(tk.END, printed_output + "\n\n")
-        else:
-            self.output_text.insert(tk.END, "\n")
-
-        self.output_text.see(tk.END)
-        self.update_status(extra_info=f"Step-by-step at {timestamp}")
-
-    def _format_normal_style(self, steps):
-        """(Unused now) Simpler 'adult' mode: line numbers + locals, skipping repeated loop headers."""
-        lines = []
-        seen_loop_lines = set()
-
-        for s in steps:
-            lineno = s["lineno"]
-            line_text = s["line"]
-            locals_dict = s["locals"]
-            stripped = line_text.lstrip()
-
-            # For 'for' and 'while' lines, only show first time
-            if stripped.startswith(("for ", "while ")):
-                if lineno in seen_loop_lines:
-                    continue
-                seen_loop_lines.add(lineno)
-
-            if locals_dict:
-                locals_str = ", ".join(f"{k}={v}" for k, v in locals_dict.items())
-                lines.append(f"Line {lineno}: {line_text}\n    Locals: {locals_str}")
-            else:
-                lines.append(f"Line {lineno}: {line_text}")
-
-        return lines
-
-
-    def _format_kid_style(self, steps, env):
-        """
-        Kid-style mode:
-        - Talks in 'Step 1, Step 2...' language
-        - Only highlights variables that actually change (or appear/disappear)
-        - Uses the *next* step's locals as the 'after' state
-        - Numbers steps sequentially (no gaps)
-        - Skips noisy things like function objects (e.g. greet at 0x...)
-        """
-        lines = []
-        if not steps:
-            return lines
-
-        # Snapshot of final environment, in case we need it for the last step
-        final_env_snapshot = {}
-        for name, value in env.items():
-            if name.startswith("__") and name.endswith("__"):
-                continue
-            try:
-                rep = repr(value)
-            except Exception:
-                rep = f"<unreprable {type(value).__name__}>"
-            if len(rep) > 60:
-                rep = rep[:57] + "..."
-            final_env_snapshot[name] = rep
-
-        seen_loop_lines = set()
-
-        lines.append("We are going to walk through your code one step at a time.")
-
-        step_counter = 0  # we control the visible step numbers
-
-        for idx, s in enumerate(steps):
-            lineno = s["lineno"]
-            line_text = s["line"]
-            before_locals = s["locals"]
-            stripped = line_text.lstrip()
-
-            # Decide 'after' locals: next step's locals, or final env if this is last
-            if idx + 1 < len(steps):
-                after_locals = steps[idx + 1]["locals"]
-            else:
-                after_locals = final_env_snapshot
-
-            # Describe the line (with nice step numbers)
-            if stripped.startswith("for "):
-                if lineno in seen_loop_lines:
-                    # don't re-explain the same for-loop header
-                    continue
-                seen_loop_lines.add(lineno)
-                step_counter += 1
-                lines.append(
-                    f"\nStep {step_counter}: We set up a loop:\n"
-                    f"    {line_text}\n"
-                    "This means we will repeat the indented lines for each value."
-                )
-            elif stripped.startswith("while "):
-                if lineno in seen_loop_lines:
-                    continue
-                seen_loop_lines.add(lineno)
-                step_counter += 1
-                lines.append(
-                    f"\nStep {step_counter}: We set up a while-loop:\n"
-                    f"    {line_text}\n"
-                    "This means we will keep repeating while the condition is True."
-                )
-            else:
-                step_counter += 1
-                lines.append(f"\nStep {step_counter}: We run this line:\n    {line_text}")
-
-            # Build explanation of variables before/after
-            changed_bits = []
-            unchanged_bits = []
-
-            all_names = set(before_locals.keys()) | set(after_locals.keys())
-            for name in sorted(all_names):
-                before_val = before_locals.get(name)
-                after_val = after_locals.get(name)
-
-                # Skip noisy function objects like "<function greet at 0x...>"
-                if (before_val and before_val.startswith("<function")) or (
-                    after_val and after_val.startswith("<function")
-                ):
-                    continue
-
-                if before_val != after_val:
-                    # Something changed (or appeared/disappeared)
-                    if before_val is None and after_val is not None:
-                        changed_bits.append(f"{name} is now {after_val}")
-                    elif before_val is not None and after_val is None:
-                        changed_bits.append(f"{name} used to be {before_val} here")
-                    else:
-                        changed_bits.append(
-                            f"{name} goes from {before_val} to {after_val}"
-                        )
-                else:
-                    # Same value before and after – only used as fallback
-                    unchanged_bits.append(f"{name} is {after_val}")
-
-            # Keep it short: focus on changes, only a tiny bit of context
-            max_items = 3
-
-            if changed_bits:
-                changed_bits = changed_bits[:max_items]
-                lines.append("  After this step:")
-                for text in changed_bits:
-                    lines.append(f"    • {text}")
-            else:
-                # If nothing (interesting) changed, show up to 2 unchanged vars for context
-                if unchanged_bits:
-                    for text in unchanged_bits[:2]:
-                        lines.append(f"  Here we have: {text}")
-
-        return lines
-
-    # ---------------- EXAMPLES ----------------
-
-    def load_example(self, key: str):
-        """Load one of the predefined educational examples into the editor."""
-        examples = {
-            "loop_sum": (
-                "count = 0\n"
-                "for i in range(1, 5):\n"
-                "    count += i\n"
-                "print(\"Final count is\", count)\n"
-            ),
-            "string_ops": (
-                "text = \"Hello, world!\"\n"
-                "print(text)\n"
-                "print(text.upper())\n"
-                "print(text.lower())\n"
-                "print(text.replace(\"world\", \"Python\"))\n"
-                "print(\"Length of text:\", len(text))\n"
-            ),
-            "list_average": (
-                "numbers = [10, 20, 30, 40]\n"
-                "total = 0\n"
-                "for n in numbers:\n"
-                "    total += n\n"
-                "\n"
-                "average = total / len(numbers)\n"
-                "print(\"Numbers:\", numbers)\n"
-                "print(\"Total:\", total)\n"
-                "print(\"Average:\", average)\n"
-            ),
-            "function_greet": (
-                "def greet(name):\n"
-                "    message = f\"Hello, {name}!\"\n"
-                "    print(message)\n"
-                "    return message\n"
-                "\n"
-                "greet(\"Alice\")\n"
-                "greet(\"Bob\")\n"
-            ),
-            "grade_checker": (
-                "score = 73\n"
-                "\n"
-                "if score >= 80:\n"
-                "    grade = \"A\"\n"
-                "elif score >= 70:\n"
-                "    grade = \"B\"\n"
-                "elif score >= 60:\n"
-                "    grade = \"C\"\n"
-                "else:\n"
-                "    grade = \"D\"\n"
-                "\n"
-                "print(\"Score:\", score)\n"
-                "print(\"Grade:\", grade)\n"
-            ),
-            "dict_lookup": (
-                "words = {\n"
-                "    \"python\": \"a programming language\",\n"
-                "    \"loop\": \"a way to repeat code\",\n"
-                "    \"variable\": \"a named place to store a value\",\n"
-                "}\n"
-                "\n"
-                "key = \"loop\"\n"
-                "meaning = words.get(key, \"(not found)\")\n"
-                "print(f\"Word: {key}\")\n"
-                "print(f\"Meaning: {meaning}\")\n"
-            ),
-            "while_countdown": (
-                "n = 5\n"
-                "while n > 0:\n"
-                "    print(\"Counting down:\", n)\n"
-                "    n -= 1\n"
-                "print(\"Lift off!\")\n"
-            ),
-            "list_comprehension": (
-                "numbers = [1, 2, 3, 4, 5]\n"
-                "squares = [n * n for n in numbers]\n"
-                "print(\"Numbers:\", numbers)\n"
-                "print(\"Squares:\", squares)\n"
-            ),
-            "tuple_unpack": (
-                "point = (4, 7)\n"
-                "x, y = point\n"
-                "print(\"Point:\", point)\n"
-                "print(\"x coordinate:\", x)\n"
-                "print(\"y coordinate:\", y)\n"
-            ),
-            "try_except": (
-                "text = \"12\"  # try changing this to \"abc\" and run again\n"
-                "\n"
-                "try:\n"
-                "    number = int(text)\n"
-                "    result = 100 / number\n"
-                "    print(\"Text as int:\", number)\n"
-                "    print(\"100 divided by\", number, \"is\", result)\n"
-                "except ValueError:\n"
-                "    print(\"Cannot convert text to an integer.\")\n"
-                "except ZeroDivisionError:\n"
-                "    print(\"Cannot divide by zero.\")\n"
-            ),
-        }
-
-        code = examples.get(key)
-        if code is None:
-            return
-
-        # Replace editor contents with the chosen example
-        self.code_text.delete("1.0", tk.END)
-        self.code_text.insert("1.0", code)
-        self.code_text.edit_reset()
-        self.update_status()
-
-    # ---------------- CLEARING ----------------
-
-    def clear_output(self):
-        self.output_text.delete("1.0", tk.END)
-
-    def clear_code(self):
-        self.code_text.delete("1.0", tk.END)
-        self.update_status()
-
-    # ---------------- WINDOW CLOSE ----------------
-
-    def on_close(self):
-        self.root.destroy()
-
-
-def main():
-    root = tk.Tk()
-    app = MiniNotebookApp(root)
-    root.mainloop()
-
-
-if __name__ == "__main__":
-    main()
+import time
+_IMPORTS_STARTED = time.perf_counter()  # for --startup-profile
+
+import tkinter as tk
+from tkinter import ttk, messagebox
+import tkinter.font as tkfont
+import io
+import contextlib
+import os
+import sys  # used for tracing
+import builtins
+import types
+import multiprocessing
+import bisect
+import marshal
+import ast
+import re
+import keyword
+import queue
+import threading
+import _thread
+import argparse
+from multiprocessing.connection import wait as wait_for_connections
+import mmap
+import socket
+import signal
+from array import array
+from collections import deque, OrderedDict
+from itertools import compress, islice
+from operator import is_not
+
+# --- IDLE-style syntax highlighting ---
+from idlelib.delegator import Delegator
+from idlelib.percolator import Percolator
+
+# Modules only some paths need (traceback, json, hashlib, tempfile, the HTTP
+# server, the benchmark helpers...) are imported where they are used, so the
+# window comes up sooner.
+_IMPORTS_DONE = time.perf_counter()
+
+
+# ---------------- COMPILE CACHE ----------------
+
+class CompileCache:
+    """
+    LRU cache of compiled code objects keyed by a hash of the source and the
+    compile mode, shared by Run, Run Selection and Explain so unchanged code
+    is only parsed once. The live checker fills it from a background thread
+    while you type.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.prefilled = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(source, mode, filename):
+        import hashlib
+        digest = hashlib.blake2b(
+            source.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+        return (digest, mode, filename)
+
+    def compile(self, source, mode="exec", filename="<string>"):
+        """compile(source, filename, mode), reusing an earlier result when possible."""
+        key = self._key(source, mode, filename)
+        with self._lock:
+            code = self._entries.get(key)
+            if code is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return code
+            self.misses += 1
+
+        code = compile(source, filename, mode)
+        self._store(key, code)
+        return code
+
+    def add(self, source, code, mode="exec", filename="<string>"):
+        """Remember code that was compiled elsewhere (from an AST) for this source."""
+        self._store(self._key(source, mode, filename), code)
+        with self._lock:
+            self.prefilled += 1
+
+    def _store(self, key, code):
+        with self._lock:
+            self._entries[key] = code
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = f"{100 * self.hits / total:.0f}%" if total else "n/a"
+        return (
+            f"Hits: {self.hits}\nMisses: {self.misses}\nHit rate: {rate}\n"
+            f"Compiled while typing: {self.prefilled}\n"
+            f"Cached code objects: {len(self._entries)} of {self.maxsize}"
+        )
+
+
+# ---------------- SYNTAX HIGHLIGHTING ----------------
+
+_HIGHLIGHT_TAGS = ("KEYWORD", "BUILTIN", "STRING", "COMMENT", "DEFINITION")
+_KEYWORDS = frozenset(keyword.kwlist)
+_BUILTINS = frozenset(
+    name for name in dir(builtins) if not name.startswith("_") and name not in _KEYWORDS
+)
+_LEX_PATTERN = re.compile(
+    r"""
+      (?P<COMMENT>\#.*)
+    | (?P<TRIPLE>(?i:[rbuf]{0,2})(?:'''|\"\"\"))
+    | (?P<STRING>(?i:[rbuf]{0,2})
+        (?:'[^'\\\n]*(?:\\.[^'\\\n]*)*'?|"[^"\\\n]*(?:\\.[^"\\\n]*)*"?))
+    | (?P<NAME>[^\W\d]\w*)
+    | (?P<NUMBER>\d[\w.]*)
+    """,
+    re.VERBOSE,
+)
+
+
+def lex_python_line(line, state=None):
+    """
+    Colour spans for one line of Python: returns ([(tag, start, end), ...],
+    state). state is None, or the triple quote of a string that is still
+    open at the end of the line; pass it in for the next line.
+    """
+    spans = []
+    pos = 0
+    if state is not None:
+        close = _find_string_end(line, 0, state)
+        if close == -1:
+            return ([("STRING", 0, len(line))] if line else []), state
+        spans.append(("STRING", 0, close))
+        pos = close
+
+    after_def = False
+    for match in _LEX_PATTERN.finditer(line, pos):
+        kind = match.lastgroup
+        start, end = match.span()
+        if kind == "TRIPLE":
+            quote = match.group()[-3:]
+            close = _find_string_end(line, end, quote)
+            if close == -1:
+                spans.append(("STRING", start, len(line)))
+                return spans, quote
+            spans.append(("STRING", start, close))
+            # finditer can't skip ahead, so lex the rest as a fresh line
+            rest, state = lex_python_line(line[close:])
+            spans.extend((tag, a + close, b + close) for tag, a, b in rest)
+            return spans, state
+        if kind == "NAME":
+            word = match.group()
+            if after_def:
+                spans.append(("DEFINITION", start, end))
+            elif word in _KEYWORDS:
+                spans.append(("KEYWORD", start, end))
+            elif word in _BUILTINS:
+                spans.append(("BUILTIN", start, end))
+            after_def = word in ("def", "class")
+            continue
+        if kind in ("COMMENT", "STRING"):
+            spans.append((kind, start, end))
+        after_def = False
+    return spans, None
+
+
+def _find_string_end(line, pos, quote):
+    """Index just past the closing triple quote, or -1 if the string goes on."""
+    while True:
+        found = line.find(quote, pos)
+        if found == -1:
+            return -1
+        backslashes = 0
+        while found - backslashes - 1 >= pos and line[found - backslashes - 1] == "\\":
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return found + 3
+        pos = found + 1
+
+
+def _highlight_colours():
+    """Foreground colours from the user's IDLE theme, falling back to IDLE Classic."""
+    try:
+        from idlelib.config import idleConf
+        theme = idleConf.CurrentTheme()
+        return {
+            tag: idleConf.GetHighlight(theme, tag.lower())["foreground"]
+            for tag in _HIGHLIGHT_TAGS
+        }
+    except Exception:
+        return {
+            "KEYWORD": "#ff7700", "BUILTIN": "#900090", "STRING": "#00aa00",
+            "COMMENT": "#dd0000", "DEFINITION": "#0000ff",
+        }
+
+
+def _lex_lines(lines, entry_state, old_states, old_spans):
+    """
+    Background-thread work: re-lex lines until the lexer state going into a
+    line that hasn't changed matches the cached one, then stop.
+    """
+    new_spans = []
+    new_states = []
+    state = entry_state
+    for offset, line in enumerate(lines):
+        if offset and old_spans[offset] is not None and old_states[offset - 1] == state:
+            break  # everything below is still correct
+        spans, state = lex_python_line(line, state)
+        new_spans.append(spans)
+        new_states.append(state)
+    return new_spans, new_states
+
+
+class ViewportHighlighter(Delegator):
+    """
+    Percolator filter that colours the editor without holding up typing.
+
+    Token spans and end-of-line lexer states are cached per line. An edit
+    only marks the touched lines dirty; a background thread re-lexes from
+    there until the state converges, so a new triple quote recolours the
+    lines below it but an ordinary edit costs one line. Tk tags are only
+    applied to the lines currently on screen.
+    """
+
+    def __init__(self, text):
+        super().__init__()
+        self.text = text
+        # mirror of the widget's text, one entry per line (it may already
+        # hold code: the highlighter is attached after the first paint)
+        self.lines = text.get("1.0", "end-1c").split("\n")
+        self.states = [None] * len(self.lines)  # lexer state at the end of each line
+        self.spans = [None] * len(self.lines)  # cached spans per line (None = needs lexing)
+        self._version = 0
+        self._dirty_from = 0  # first line that needs re-lexing
+        self._job_running = False
+        self._paint_scheduled = False
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+
+        for tag, colour in _highlight_colours().items():
+            self.text.tag_configure(tag, foreground=colour)
+        self.text.tag_raise("sel")
+
+        threading.Thread(target=self._lex_worker, daemon=True).start()
+        self._submit()
+
+    # -- Percolator filter hooks --
+
+    def insert(self, index, chars, tags=None):
+        index = self.delegate.index(index)
+        total_before = self._line_total()
+        first = min(int(index.split(".")[0]), total_before)
+        self.delegate.insert(index, chars, tags)
+        self._lines_changed(first, first, total_before)
+
+    def delete(self, index1, index2=None):
+        index1 = self.delegate.index(index1)
+        if index2 is None:
+            index2 = index1 + "+1c"
+        total_before = self._line_total()
+        first = min(int(index1.split(".")[0]), total_before)
+        last = min(int(self.delegate.index(index2).split(".")[0]), total_before)
+        self.delegate.delete(index1, index2)
+        self._lines_changed(first, last, total_before)
+
+    # -- bookkeeping on the Tk thread --
+
+    def _line_total(self):
+        return int(self.delegate.index("end-1c").split(".")[0])
+
+    def _lines_changed(self, first, last, total_before):
+        """Lines first..last (1-based) were replaced: refresh the mirror and mark them dirty."""
+        new_last = last + self._line_total() - total_before
+        new_lines = self.delegate.get(f"{first}.0", f"{new_last}.end").split("\n")
+        self.lines[first - 1:last] = new_lines
+        # Keep the old state at the end of the block: it is what the cached
+        # lines below were lexed with, so it tells the lexer when to stop.
+        self.states[first - 1:last] = [None] * (len(new_lines) - 1) + [self.states[last - 1]]
+        self.spans[first - 1:last] = [None] * len(new_lines)
+        self._version += 1
+        if self._dirty_from is None or first - 1 < self._dirty_from:
+            self._dirty_from = first - 1
+        self._submit()
+
+    def _submit(self):
+        if self._job_running or self._dirty_from is None:
+            return
+        start = self._dirty_from
+        entry_state = self.states[start - 1] if start > 0 else None
+        self._jobs.put(
+            (self._version, start, self.lines[start:], entry_state,
+             self.states[start:], self.spans[start:])
+        )
+        self._job_running = True
+        self.text.after(5, self._collect)
+
+    def _collect(self):
+        try:
+            version, start, new_spans, new_states = self._results.get_nowait()
+        except queue.Empty:
+            self.text.after(5, self._collect)
+            return
+        self._job_running = False
+        if version == self._version:
+            stop = start + len(new_spans)
+            self.spans[start:stop] = new_spans
+            self.states[start:stop] = new_states
+            try:
+                self._dirty_from = self.spans.index(None, stop)  # an earlier edit further down
+            except ValueError:
+                self._dirty_from = None
+            self.schedule_paint()
+            self._submit()
+        else:
+            self._submit()  # edited meanwhile: lex again from the earliest dirty line
+
+    def _lex_worker(self):
+        while True:
+            version, start, lines, entry_state, old_states, old_spans = self._jobs.get()
+            new_spans, new_states = _lex_lines(lines, entry_state, old_states, old_spans)
+            self._results.put((version, start, new_spans, new_states))
+
+    # -- painting the visible lines --
+
+    def schedule_paint(self):
+        if not self._paint_scheduled:
+            self._paint_scheduled = True
+            self.text.after_idle(self._paint)
+
+    def _paint(self):
+        self._paint_scheduled = False
+        first = int(self.text.index("@0,0").split(".")[0])
+        last = int(self.text.index(f"@0,{self.text.winfo_height()}").split(".")[0])
+        last = min(last + 1, len(self.lines))
+
+        ranges = {tag: [] for tag in _HIGHLIGHT_TAGS}
+        for lineno in range(first, last + 1):
+            for tag, start, end in self.spans[lineno - 1] or ():
+                ranges[tag].extend((f"{lineno}.{start}", f"{lineno}.{end}"))
+        for tag, indexes in ranges.items():
+            self.text.tag_remove(tag, f"{first}.0", f"{last}.end")
+            if indexes:
+                self.text.tag_add(tag, *indexes)
+
+
+# ---------------- LIVE CHECKING ----------------
+
+# Check the code this long after the last edit
+CHECK_DELAY_MS = 400
+# Lines at the left margin that carry on the statement above them
+_CONTINUATION = re.compile(r"(?:else|elif|except|finally)\b|[)\]}]")
+_ALL_BUILTINS = frozenset(dir(builtins))
+
+
+def _top_level_blocks(source):
+    """
+    Split source into (first line index, text) pieces, roughly one per
+    top-level statement. A wrong guess only costs a full parse.
+    """
+    lines = source.splitlines(keepends=True)
+    blocks = []
+    start = 0
+    for index in range(1, len(lines)):
+        line = lines[index]
+        if not line[:1].strip() or line[0] == "#" or _CONTINUATION.match(line):
+            continue  # indented, blank, a comment, or the rest of a statement
+        if lines[start][0] == "@" or lines[index - 1].rstrip("\r\n").endswith("\\"):
+            continue  # a decorated def, or a continued line
+        blocks.append((start, "".join(lines[start:index])))
+        start = index
+    if lines:
+        blocks.append((start, "".join(lines[start:])))
+    return blocks
+
+
+def _block_names(tree):
+    """(names bound anywhere, [(name, line, start col, end col) read], star import?)."""
+    bound = set()
+    loads = []
+    star = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loads.append((node.id, node.lineno, node.col_offset, node.end_col_offset))
+            else:
+                bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.alias):
+            if node.name == "*":
+                star = True
+            else:
+                bound.add(node.asname or node.name.split(".")[0])
+        elif isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar)):
+            if node.name:
+                bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping):
+            if node.rest:
+                bound.add(node.rest)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+    return bound, loads, star
+
+
+class _ParsedBlock:
+    """One cached top-level block: its tree, and the line it is currently numbered from."""
+
+    def __init__(self, text):
+        self.error = None
+        self.tree = None
+        try:
+            self.tree = ast.parse(text, "<string>")
+        except (SyntaxError, ValueError) as e:
+            self.error = e
+            return
+        self.first_line = 0
+        self.bound, self.loads, self.star = _block_names(self.tree)
+
+
+class CheckResult:
+    """What a check found: error is None or (line, start col, end col, message)."""
+
+    def __init__(self, version, error=None, undefined=()):
+        self.version = version
+        self.error = error
+        self.undefined = undefined  # [(line, start col, end col), ...]
+
+
+class LiveChecker:
+    """
+    Parses the code on a background thread while you type, reusing the
+    parse of every top-level block that hasn't changed. Reports syntax
+    errors and names that are never defined, and puts the compiled code
+    in the compile cache so Run doesn't have to parse it again.
+    """
+
+    def __init__(self, compile_cache):
+        self.compile_cache = compile_cache
+        self._blocks = {}  # block text -> _ParsedBlock, from the last check
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        threading.Thread(target=self._check_worker, daemon=True).start()
+
+    def submit(self, version, source, known_names=()):
+        """Check source in the background; known_names are defined in the kernel already."""
+        self._jobs.put((version, source, frozenset(known_names)))
+
+    def poll(self):
+        """The newest finished CheckResult, or None."""
+        result = None
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                return result
+
+    def _check_worker(self):
+        while True:
+            job = self._jobs.get()
+            while not self._jobs.empty():
+                job = self._jobs.get()  # skip checks that are already out of date
+            try:
+                result = self.check(*job)
+            except Exception:
+                result = CheckResult(job[0])  # e.g. nested too deeply for the parser
+            self._results.put(result)
+
+    def check(self, version, source, known_names=()):
+        """Check source now, on this thread; returns a CheckResult."""
+        lines = source.splitlines()
+        tree, bound, loads, star = self._parse(source)
+        if isinstance(tree, Exception):
+            return CheckResult(version, error=_error_span(tree, lines))
+        try:
+            code = compile(tree, "<string>", "exec")
+        except (SyntaxError, ValueError) as e:  # e.g. 'return' outside a function
+            return CheckResult(version, error=_error_span(e, lines))
+        self.compile_cache.add(source, code)
+
+        if star:
+            return CheckResult(version)  # can't tell what 'import *' defined
+        known = bound.union(known_names, _ALL_BUILTINS)
+        undefined = []
+        for name, lineno, start, end in sorted(loads, key=lambda load: load[1:]):
+            if name not in known:
+                line = lines[lineno - 1].encode("utf-8")  # ast columns count bytes
+                undefined.append((
+                    lineno,
+                    len(line[:start].decode("utf-8", "replace")),
+                    len(line[:end].decode("utf-8", "replace")),
+                ))
+        return CheckResult(version, undefined=undefined)
+
+    def _parse(self, source):
+        """(module tree or the SyntaxError, bound names, loads, star import?)."""
+        body = []
+        bound = set()
+        loads = []
+        star = False
+        blocks = {}  # only this check's blocks are kept for the next one
+        for first_line, text in _top_level_blocks(source):
+            block = self._blocks.get(text)
+            if block is None or text in blocks:  # the same block twice needs its own tree
+                block = _ParsedBlock(text)
+            blocks.setdefault(text, block)
+            if block.error is not None:
+                break  # maybe a real error, maybe a bad split: the full parse decides
+            if block.first_line != first_line:
+                ast.increment_lineno(block.tree, first_line - block.first_line)
+                block.first_line = first_line
+            body.extend(block.tree.body)
+            bound |= block.bound
+            loads.extend(
+                (name, lineno + first_line, start, end) for name, lineno, start, end in block.loads
+            )
+            star = star or block.star
+        else:
+            self._blocks = blocks
+            return ast.Module(body=body, type_ignores=[]), bound, loads, star
+        self._blocks.update(blocks)  # keep the blocks below for when the error is fixed
+
+        try:
+            tree = ast.parse(source, "<string>")
+        except (SyntaxError, ValueError) as e:
+            return e, None, None, None
+        bound, loads, star = _block_names(tree)
+        return tree, bound, loads, star
+
+
+def _error_span(error, lines):
+    """(line, start col, end col, message) to underline for a SyntaxError."""
+    lineno = getattr(error, "lineno", None) or 1
+    line = lines[lineno - 1] if 0 < lineno <= len(lines) else ""
+    start = max((getattr(error, "offset", None) or 1) - 1, 0)
+    end = getattr(error, "end_offset", None) or 0
+    if getattr(error, "end_lineno", lineno) != lineno or end - 1 <= start:
+        end = len(line) + 1
+    start = min(start, max(len(line) - 1, 0))
+    end = max(min(end - 1, len(line)), start + 1)
+    message = getattr(error, "msg", None) or str(error)
+    return lineno, start, end, message
+
+
+# ---------------- EXECUTION KERNELS ----------------
+
+# Kernels are started from a clean server process where the platform has one,
+# so they never inherit the GUI's Tk state; otherwise they are spawned fresh.
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+# How often a kernel ships printed text to the app while code is running
+STREAM_FLUSH_CHARS = 8192
+STREAM_FLUSH_SECONDS = 0.05
+
+
+class RunBudgetExceeded(BaseException):
+    """
+    Raised in the user's code when a run uses up one of its RUN_BUDGETS. It
+    is a BaseException so an `except Exception:` in the code can't swallow it.
+    """
+
+    def __init__(self, budget):
+        super().__init__(budget)
+        self.budget = budget
+
+
+class _InterruptGate:
+    """
+    Decides what a Stop (SIGINT) does inside a kernel: while user code runs it
+    becomes a KeyboardInterrupt, so the code stops and the environment is
+    kept; between runs, or when the app meant it for a job that has already
+    finished, it is ignored. Inside hold() it waits until the block
+    ends, so a message half-sent to the app never gets cut off. Running out
+    of CPU time (SIGXCPU) is handled the same way, as RunBudgetExceeded.
+    """
+
+    def __init__(self):
+        self._armed = False
+        self._holds = 0
+        self._pending = None  # the exception a held signal will raise
+        self.job_id = None  # the request being served
+        self.target = None  # shared with the app: the job a Stop is for, 0 for any
+
+    def handler(self, signum, frame):
+        if self.target is not None and self.target.value not in (0, self.job_id):
+            return  # meant for a job that already finished
+        self._raise(KeyboardInterrupt())
+
+    def cpu_handler(self, signum, frame):
+        self._raise(RunBudgetExceeded("cpu_seconds"))
+
+    def _raise(self, exception):
+        if not self._armed:
+            return
+        if self._holds:
+            self._pending = exception
+            return
+        raise exception
+
+    @contextlib.contextmanager
+    def armed(self):
+        """Let Stop interrupt the code run inside this block."""
+        self._armed = True
+        self._pending = None
+        try:
+            yield
+        finally:
+            self._armed = False
+
+    @contextlib.contextmanager
+    def hold(self):
+        self._holds += 1
+        try:
+            yield
+        finally:
+            self._holds -= 1
+            if not self._holds and self._pending is not None and self._armed:
+                exception, self._pending = self._pending, None
+                raise exception
+
+
+_INTERRUPTS = _InterruptGate()
+
+
+class _StreamWriter(io.TextIOBase):
+    """File-like sink that sends printed text to the app in batches as it is produced."""
+
+    def __init__(self, conn, job_id):
+        self.conn = conn
+        self.job_id = job_id
+        self._parts = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self.chars_written = 0
+        self.limit = None  # the run's output budget, in characters
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        self._parts.append(text)
+        self._size += len(text)
+        self.chars_written += len(text)
+        if self.limit is not None and self.chars_written > self.limit:
+            self.limit = None  # so the error message can still be written
+            raise RunBudgetExceeded("output")
+        if (
+            self._size >= STREAM_FLUSH_CHARS
+            or time.monotonic() - self._last_flush >= STREAM_FLUSH_SECONDS
+        ):
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._parts:
+            data = "".join(self._parts)
+            self._parts = []
+            self._size = 0
+            with _INTERRUPTS.hold():
+                self.conn.send({"op": "stream", "id": self.job_id, "data": data})
+        self._last_flush = time.monotonic()
+
+
+class _HeldOutput(io.StringIO):
+    """What a traced run prints, kept back until it ends, and held to the run's output budget."""
+
+    def __init__(self):
+        super().__init__()
+        self.chars_written = 0
+        self.limit = None  # the run's output budget, in characters
+
+    def write(self, text):
+        written = super().write(text)
+        self.chars_written += written
+        if self.limit is not None and self.chars_written > self.limit:
+            self.limit = None  # so the message saying so can still be written
+            raise RunBudgetExceeded("output")
+        return written
+
+
+# Longest repr shown for a variable in explanations
+REPR_LIMIT = 60
+
+# Values of these types can't change in place, so a repr made once stays valid
+_IMMUTABLE_TYPES = frozenset(
+    {int, float, complex, bool, str, bytes, type(None), range, type,
+     type(len), type(lambda: None), type(sys)}
+)
+
+
+class _ReprBudgetSpent(Exception):
+    pass
+
+
+class _ReprWriter:
+    """Collects repr pieces and gives up as soon as more than the budget is written."""
+
+    def __init__(self, budget):
+        self.parts = []
+        self.remaining = budget
+
+    def write(self, text):
+        self.parts.append(text)
+        self.remaining -= len(text)
+        if self.remaining <= 0:
+            raise _ReprBudgetSpent
+
+
+def bounded_repr(value, limit=REPR_LIMIT):
+    """
+    repr() of a value cut to `limit` characters ("..." at the end if cut).
+    Built-in containers and strings are rendered piece by piece and stop as
+    soon as the limit is passed, so a million-element list costs no more
+    than a short one.
+    """
+    out = _ReprWriter(limit + 1)  # one extra character tells us it overflowed
+    try:
+        _write_repr(value, out, set())
+    except _ReprBudgetSpent:
+        pass
+    except Exception:
+        return f"<unreprable {type(value).__name__}>"
+    rep = "".join(out.parts)
+    if len(rep) > limit:
+        rep = rep[:limit - 3] + "..."
+    return rep
+
+
+def _write_repr(value, out, active):
+    kind = type(value)
+    if kind is str:
+        _write_str_repr(value, out)
+        return
+    if kind not in (list, tuple, dict, set, frozenset):
+        out.write(repr(value))
+        return
+
+    if id(value) in active:
+        out.write("{...}" if kind is dict else "[...]")  # self-containing container
+        return
+    active.add(id(value))
+
+    if kind is dict:
+        out.write("{")
+        for i, (key, item) in enumerate(value.items()):
+            if i:
+                out.write(", ")
+            _write_repr(key, out, active)
+            out.write(": ")
+            _write_repr(item, out, active)
+        out.write("}")
+    elif kind in (set, frozenset) and not value:
+        out.write(f"{kind.__name__}()")
+    else:
+        opener, closer = {
+            list: ("[", "]"),
+            tuple: ("(", ")"),
+            set: ("{", "}"),
+            frozenset: ("frozenset({", "})"),
+        }[kind]
+        out.write(opener)
+        for i, item in enumerate(value):
+            if i:
+                out.write(", ")
+            _write_repr(item, out, active)
+        if kind is tuple and len(value) == 1:
+            out.write(",")
+        out.write(closer)
+
+    active.discard(id(value))
+
+
+def _write_str_repr(value, out):
+    """Write repr(value) for a str, only escaping the part that can be shown."""
+    if len(value) <= out.remaining:
+        out.write(repr(value))
+        return
+    rep = repr(value[:out.remaining])
+    # repr picks its quote from the whole string, which the prefix may not show
+    wants_double = "'" in value and '"' not in value
+    if wants_double and rep[0] == "'":
+        rep = '"' + rep[1:-1] + '"'
+    elif not wants_double and rep[0] == '"':
+        rep = "'" + rep[1:-1].replace("'", "\\'") + "'"
+    out.write(rep)
+
+
+def _is_dunder(name):
+    return name.startswith("__") and name.endswith("__")
+
+
+def _line_text(code_lines, lineno):
+    if 1 <= lineno <= len(code_lines):
+        return code_lines[lineno - 1].rstrip("\n")
+    return ""
+
+
+def _iter_code_objects(code):
+    """A compiled snippet plus every function/class/comprehension body nested in it."""
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, type(code)):
+            yield from _iter_code_objects(const)
+
+
+# Namespaces with at least this many names are diffed with the fast path
+WIDE_NAMESPACE = 64
+
+
+class NamespaceDiff:
+    """
+    Remembers the bounded reprs of a namespace's values, and tells what
+    changed since the last look: (name, repr) pairs, repr None meaning
+    "gone". Unchanged immutable values are not even re-rendered.
+    """
+
+    def __init__(self):
+        self._view = {}  # name -> (value, repr) as of the latest look
+        self._repr_cache = {}  # id -> (value, repr) for immutable values
+        # The namespace as of the latest look, for the same-scope fast path
+        self._scope = None
+        self._keys = []
+        self._values = []
+        self._mutable = set()  # positions in _keys holding values that can change in place
+
+    def changes(self, namespace, scope=None):
+        """
+        Diff a namespace against the latest view, repr'ing only what may have
+        changed. scope is whatever owns the namespace (a frame, say); the same
+        scope again with only names added allows the fast path.
+        """
+        if len(namespace) < WIDE_NAMESPACE:
+            self._scope = None  # small enough that a plain loop is quickest
+            return self._full_changes(namespace)
+        keys = list(namespace)
+        values = list(namespace.values())
+        old_keys, old_values = self._keys, self._values
+        same_scope = scope is not None and scope is self._scope
+        self._scope, self._keys, self._values = scope, keys, values
+        if same_scope and len(keys) >= len(old_keys) and keys[:len(old_keys)] == old_keys:
+            return self._changes_in_place(keys, values, old_values)
+
+        # Another scope, or names went away: compare everything
+        self._mutable = {
+            index for index, value in enumerate(values) if type(value) not in _IMMUTABLE_TYPES
+        }
+        return self._full_changes(namespace)
+
+    def _changes_in_place(self, keys, values, old_values):
+        """
+        Fast path for a scope that only rebound or added names since the
+        last look: C-level identity checks find the rebound slots, so only
+        those, new names and mutable values get looked at in Python.
+        """
+        candidates = set(compress(range(len(old_values)), map(is_not, values, old_values)))
+        candidates.update(range(len(old_values), len(keys)))
+        candidates |= self._mutable
+        view = self._view
+        changes = []
+        for index in sorted(candidates):
+            name = keys[index]
+            if _is_dunder(name):
+                continue
+            value = values[index]
+            if type(value) in _IMMUTABLE_TYPES:
+                self._mutable.discard(index)
+            else:
+                self._mutable.add(index)
+            rep = self._repr(value)
+            entry = view.get(name)
+            if entry is None or entry[1] != rep:
+                changes.append((name, rep))
+            view[name] = (value, rep)
+        return tuple(changes)
+
+    def _full_changes(self, namespace):
+        view = self._view
+        changes = []
+        added = False
+        count = 0
+        for name, value in namespace.items():
+            if _is_dunder(name):
+                continue
+            count += 1
+            entry = view.get(name)
+            if entry is not None and entry[0] is value and type(value) in _IMMUTABLE_TYPES:
+                continue  # same immutable object: same repr
+            rep = self._repr(value)
+            if entry is None:
+                added = True
+                changes.append((name, rep))
+            elif entry[1] != rep:
+                changes.append((name, rep))
+            view[name] = (value, rep)
+
+        if added or count != len(view):
+            for name in [n for n in view if n not in namespace]:
+                del view[name]
+                changes.append((name, None))
+        return tuple(changes)
+
+    def _repr(self, value):
+        if type(value) not in _IMMUTABLE_TYPES:
+            return bounded_repr(value)  # may have been mutated: cheap, bounded re-render
+        cached = self._repr_cache.get(id(value))
+        if cached is not None and cached[0] is value:
+            return cached[1]
+        if len(self._repr_cache) > 10000:
+            self._repr_cache.clear()
+        rep = bounded_repr(value)
+        self._repr_cache[id(value)] = (value, rep)
+        return rep
+
+
+class StepTracer:
+    """
+    Records each line a snippet runs, with the locals at that point.
+
+    On Python 3.12+ it uses sys.monitoring, switching LINE events on only for
+    the snippet's own code objects, so library code the snippet calls costs
+    nothing extra. Older interpreters fall back to sys.settrace.
+    """
+
+    def __init__(self, max_steps, on_step):
+        self.max_steps = max_steps
+        # Each step is handed to on_step(step) as it happens, as (lineno,
+        # changes): changes lists only the (name, repr) pairs that differ from
+        # the previous step; repr None means "gone".
+        self.on_step = on_step
+        self.step_count = 0
+        self.final_changes = ()
+        self.error = None  # what the snippet raised, if it did
+        self._changes = NamespaceDiff().changes
+
+    @property
+    def finished(self):
+        return self.step_count >= self.max_steps
+
+    def run(self, compiled, env):
+        """Execute compiled code in env while tracing it."""
+        codes = set(_iter_code_objects(compiled))
+        if hasattr(sys, "monitoring"):
+            self._run_with_monitoring(compiled, env, codes)
+        else:
+            self._run_with_settrace(compiled, env, codes)
+
+    def finish(self, env):
+        """Changes that bring the last step's locals to how the environment ended up."""
+        self.final_changes = self._changes(env)
+        return self.final_changes
+
+    def _record(self, frame, lineno):
+        self.step_count += 1
+        self.on_step((lineno, self._changes(frame.f_locals, frame)))
+
+    def _run_with_monitoring(self, compiled, env, codes):
+        monitoring = sys.monitoring
+        tool_id = _claim_monitoring_tool()
+        if tool_id is None:
+            # Another debugger/profiler holds every tool slot
+            self._run_with_settrace(compiled, env, codes)
+            return
+
+        def on_line(code, lineno):
+            if self.finished:
+                return monitoring.DISABLE  # safety cap reached: stop firing here
+            self._record(sys._getframe(1), lineno)
+            return None
+
+        monitoring.register_callback(tool_id, monitoring.events.LINE, on_line)
+        monitoring.restart_events()  # undo DISABLEs left over from an earlier trace
+        for code in codes:
+            monitoring.set_local_events(tool_id, code, monitoring.events.LINE)
+        try:
+            exec(compiled, env)
+        except Exception as e:
+            self.error = e
+            sys.stderr.write(_format_user_traceback(e))
+        finally:
+            for code in codes:
+                monitoring.set_local_events(tool_id, code, 0)
+            monitoring.register_callback(tool_id, monitoring.events.LINE, None)
+            monitoring.free_tool_id(tool_id)
+
+    def _run_with_settrace(self, compiled, env, codes):
+        def local_trace(frame, event, arg):
+            if event == "line":
+                if self.finished:
+                    return None
+                self._record(frame, frame.f_lineno)
+            return local_trace
+
+        def global_trace(frame, event, arg):
+            # Only trace frames running the snippet's own code
+            if frame.f_code in codes and not self.finished:
+                return local_trace
+            return None
+
+        old_trace = sys.gettrace()
+        try:
+            sys.settrace(global_trace)
+            exec(compiled, env)
+        except Exception as e:
+            self.error = e
+            sys.stderr.write(_format_user_traceback(e))
+        finally:
+            sys.settrace(old_trace)
+
+
+class LineProfiler:
+    """
+    Per-line hit counts and time for a snippet's own code. Each line event
+    only bumps a counter and reads the clock; the time until the next line
+    event is charged to the line, so a call into untraced library code counts
+    against the line that made it.
+    """
+
+    def __init__(self):
+        self.hits = {}  # lineno -> times the line ran
+        self.times = {}  # lineno -> nanoseconds spent on the line
+        self.total_ns = 0
+        self._last_line = None
+        self._last_time = 0
+
+    def run(self, compiled, env):
+        """Execute compiled code in env while profiling it."""
+        codes = set(_iter_code_objects(compiled))
+        started = time.perf_counter_ns()
+        try:
+            if hasattr(sys, "monitoring"):
+                self._run_with_monitoring(compiled, env, codes)
+            else:
+                self._run_with_settrace(compiled, env, codes)
+        finally:
+            now = time.perf_counter_ns()
+            self._line_event(None, now)
+            self.total_ns = now - started
+
+    def _line_event(self, lineno, now):
+        last = self._last_line
+        if last is not None:
+            self.times[last] = self.times.get(last, 0) + now - self._last_time
+        if lineno is not None:
+            self.hits[lineno] = self.hits.get(lineno, 0) + 1
+        self._last_line = lineno
+        self._last_time = now
+
+    def _run_with_monitoring(self, compiled, env, codes):
+        monitoring = sys.monitoring
+        tool_id = _claim_monitoring_tool(monitoring.PROFILER_ID)
+        if tool_id is None:
+            self._run_with_settrace(compiled, env, codes)
+            return
+
+        clock = time.perf_counter_ns
+        line_event = self._line_event
+
+        def on_line(code, lineno):
+            line_event(lineno, clock())
+
+        monitoring.register_callback(tool_id, monitoring.events.LINE, on_line)
+        monitoring.restart_events()
+        for code in codes:
+            monitoring.set_local_events(tool_id, code, monitoring.events.LINE)
+        try:
+            exec(compiled, env)
+        finally:
+            for code in codes:
+                monitoring.set_local_events(tool_id, code, 0)
+            monitoring.register_callback(tool_id, monitoring.events.LINE, None)
+            monitoring.free_tool_id(tool_id)
+
+    def _run_with_settrace(self, compiled, env, codes):
+        clock = time.perf_counter_ns
+        line_event = self._line_event
+
+        def local_trace(frame, event, arg):
+            if event == "line":
+                line_event(frame.f_lineno, clock())
+            return local_trace
+
+        def global_trace(frame, event, arg):
+            return local_trace if frame.f_code in codes else None
+
+        old_trace = sys.gettrace()
+        sys.settrace(global_trace)
+        try:
+            exec(compiled, env)
+        finally:
+            sys.settrace(old_trace)
+
+
+def _claim_monitoring_tool(preferred=None):
+    """Grab a free sys.monitoring tool id (preferred slot first, debugger slot by default), or None."""
+    monitoring = sys.monitoring
+    if preferred is None:
+        preferred = monitoring.DEBUGGER_ID
+    for tool_id in (preferred, 3, 4):
+        if monitoring.get_tool(tool_id) is None:
+            monitoring.use_tool_id(tool_id, "code-tutor")
+            return tool_id
+    return None
+
+
+# ---------------- COLUMNAR TRACES ----------------
+
+# Step-through traces run much longer than explanations, but are packed tightly
+TRACE_MAX_STEPS = 200000
+TRACE_MEMORY_LIMIT = 64 * 1024 * 1024
+TRACE_KEYFRAME_INTERVAL = 512
+
+
+class ColumnarTrace:
+    """
+    A long trace packed into flat arrays: the line of every step, and every
+    step's changes as (name id, repr id) pairs into interned name and repr
+    tables. The full set of locals is kept every TRACE_KEYFRAME_INTERVAL
+    steps, so the locals at any step are rebuilt by replaying at most that
+    many steps' changes.
+    """
+
+    def __init__(self):
+        self.lines = array("i")  # 0 for the final "program finished" step
+        self.offsets = array("I", [0])  # step i's changes: [offsets[i], offsets[i + 1])
+        self.change_names = array("I")
+        self.change_reprs = array("i")  # -1: the name went away
+        self.names = []
+        self.reprs = []
+        self.keyframes = []  # array of name id, repr id pairs after steps 0, K, 2K, ...
+        self.truncated = False
+        self._name_ids = {}
+        self._repr_ids = {}
+        self._current = {}  # name id -> repr id after the latest step
+        self._text_bytes = 0
+
+    def __len__(self):
+        return len(self.lines)
+
+    def append(self, lineno, changes):
+        """Add one step as produced by StepTracer: (lineno, ((name, repr or None), ...))."""
+        current = self._current
+        for name, rep in changes:
+            name_id = self._intern(name, self.names, self._name_ids)
+            if rep is None:
+                repr_id = -1
+                current.pop(name_id, None)
+            else:
+                repr_id = self._intern(rep, self.reprs, self._repr_ids)
+                current[name_id] = repr_id
+            self.change_names.append(name_id)
+            self.change_reprs.append(repr_id)
+        self.lines.append(lineno or 0)
+        self.offsets.append(len(self.change_names))
+        if (len(self.lines) - 1) % TRACE_KEYFRAME_INTERVAL == 0:
+            keyframe = array("i")
+            for pair in current.items():
+                keyframe.extend(pair)
+            self.keyframes.append(keyframe)
+
+    def _intern(self, text, table, ids):
+        index = ids.get(text)
+        if index is None:
+            index = ids[text] = len(table)
+            table.append(text)
+            self._text_bytes += sys.getsizeof(text)
+        return index
+
+    def nbytes(self):
+        """Roughly how much memory the trace holds, interning tables included."""
+        arrays = [self.lines, self.offsets, self.change_names, self.change_reprs, *self.keyframes]
+        total = sum(a.itemsize * len(a) for a in arrays) + self._text_bytes
+        # Each interned string costs a list slot and a dict entry on top of itself
+        return total + 8 * (len(self.names) + len(self.reprs)) + sys.getsizeof(self._repr_ids)
+
+    def locals_at(self, step):
+        """[(name, repr), ...] in the order names first appeared, as of that step."""
+        first = step - step % TRACE_KEYFRAME_INTERVAL
+        keyframe = self.keyframes[first // TRACE_KEYFRAME_INTERVAL]
+        state = dict(zip(keyframe[::2], keyframe[1::2]))
+        start, stop = self.offsets[first + 1], self.offsets[step + 1]
+        for name_id, repr_id in zip(self.change_names[start:stop], self.change_reprs[start:stop]):
+            if repr_id < 0:
+                state.pop(name_id, None)
+            else:
+                state[name_id] = repr_id
+        return [(self.names[name_id], self.reprs[state[name_id]]) for name_id in sorted(state)]
+
+    def to_message(self):
+        """Plain arrays and lists, for sending through a kernel pipe."""
+        return {
+            "lines": self.lines,
+            "offsets": self.offsets,
+            "change_names": self.change_names,
+            "change_reprs": self.change_reprs,
+            "names": self.names,
+            "reprs": self.reprs,
+            "keyframes": self.keyframes,
+            "truncated": self.truncated,
+        }
+
+    @classmethod
+    def from_message(cls, message):
+        trace = cls()
+        for field, value in message.items():
+            setattr(trace, field, value)
+        return trace
+
+
+# ---------------- KID-STYLE EXPLANATIONS ----------------
+
+def kid_style_formatter(code_lines):
+    """
+    Kid-style explanation as a coroutine: prime it with next(), send() each
+    traced step (lineno, changes) as it arrives, and finally send
+    (None, final_changes). Each send returns the lines that are now complete.
+
+    - Talks in 'Step 1, Step 2...' language
+    - Only highlights variables that actually change (or appear/disappear)
+    - Uses the *next* step's locals as the 'after' state (so a step's lines
+      come out when the following step arrives)
+    - Numbers steps sequentially (no gaps)
+    - Skips noisy things like function objects (e.g. greet at 0x...)
+
+    Memory stays flat however many steps are sent, and work per step follows
+    the number of changes, not the number of variables.
+    """
+    lines = []
+    seen_loop_lines = set()
+    step_counter = 0  # we control the visible step numbers
+    before_locals = {}  # locals as the waiting step starts
+    names_in_order = []  # sorted names of before_locals, for the fallback
+    waiting = None  # the step that needs the next one's changes
+    started = False
+
+    while True:
+        lineno, after_changes = yield lines
+        lines = []
+
+        if waiting is not None:
+            step_counter = _describe_step(
+                lines, waiting, after_changes, code_lines, before_locals,
+                names_in_order, seen_loop_lines, step_counter,
+            )
+        if lineno is None:
+            waiting = None
+            continue
+
+        if not started:
+            started = True
+            lines.append("We are going to walk through your code one step at a time.")
+        waiting = lineno
+        for name, rep in after_changes:
+            if name not in before_locals:
+                bisect.insort(names_in_order, name)
+            if rep is None:
+                before_locals.pop(name, None)
+                names_in_order.remove(name)
+            else:
+                before_locals[name] = rep
+
+
+def _describe_step(lines, lineno, after_changes, code_lines, before_locals,
+                   names_in_order, seen_loop_lines, step_counter):
+    """Append one step's explanation to lines; returns the updated step counter."""
+    line_text = _line_text(code_lines, lineno)
+    stripped = line_text.lstrip()
+
+    # Describe the line (with nice step numbers)
+    if stripped.startswith("for "):
+        if lineno in seen_loop_lines:
+            # don't re-explain the same for-loop header
+            return step_counter
+        seen_loop_lines.add(lineno)
+        step_counter += 1
+        lines.append(
+            f"\nStep {step_counter}: We set up a loop:\n"
+            f"    {line_text}\n"
+            "This means we will repeat the indented lines for each value."
+        )
+    elif stripped.startswith("while "):
+        if lineno in seen_loop_lines:
+            return step_counter
+        seen_loop_lines.add(lineno)
+        step_counter += 1
+        lines.append(
+            f"\nStep {step_counter}: We set up a while-loop:\n"
+            f"    {line_text}\n"
+            "This means we will keep repeating while the condition is True."
+        )
+    else:
+        step_counter += 1
+        lines.append(f"\nStep {step_counter}: We run this line:\n    {line_text}")
+
+    # Build explanation of the variables that changed
+    changed_bits = []
+    changed_names = set()
+
+    for name, after_val in sorted(after_changes, key=lambda c: c[0]):
+        before_val = before_locals.get(name)
+        changed_names.add(name)
+
+        # Skip noisy function objects like "<function greet at 0x...>"
+        if (before_val and before_val.startswith("<function")) or (
+            after_val and after_val.startswith("<function")
+        ):
+            continue
+
+        if before_val is None and after_val is not None:
+            changed_bits.append(f"{name} is now {after_val}")
+        elif before_val is not None and after_val is None:
+            changed_bits.append(f"{name} used to be {before_val} here")
+        else:
+            changed_bits.append(f"{name} goes from {before_val} to {after_val}")
+
+    # Keep it short: focus on changes, only a tiny bit of context
+    max_items = 3
+
+    if changed_bits:
+        lines.append("  After this step:")
+        for text in changed_bits[:max_items]:
+            lines.append(f"    • {text}")
+    else:
+        # If nothing (interesting) changed, show up to 2 unchanged vars for context
+        shown = 0
+        for name in names_in_order:
+            if shown == 2:
+                break
+            value = before_locals[name]
+            if name in changed_names or value.startswith("<function"):
+                continue
+            lines.append(f"  Here we have: {name} is {value}")
+            shown += 1
+    return step_counter
+
+
+def format_kid_style(steps, final_changes, code_lines):
+    """All explanation lines for an already-collected list of steps."""
+    formatter = kid_style_formatter(code_lines)
+    next(formatter)
+    lines = []
+    for step in steps:
+        lines.extend(formatter.send(step))
+    lines.extend(formatter.send((None, final_changes)))
+    return lines
+
+
+# ---------------- INCREMENTAL RUNS ----------------
+
+# Builtins that never change their arguments (or anything else)
+_PURE_CALLS = frozenset({
+    "abs", "all", "any", "bool", "chr", "dict", "divmod", "enumerate", "float",
+    "format", "frozenset", "hash", "hex", "int", "isinstance", "issubclass", "len",
+    "list", "max", "min", "oct", "ord", "pow", "range", "repr", "reversed",
+    "round", "set", "sorted", "str", "sum", "tuple", "type", "zip",
+})
+# Calls that are there for what they do, not what they return
+_SIDE_EFFECT_CALLS = frozenset({
+    "print", "input", "open", "exec", "eval", "breakpoint", "next", "setattr",
+    "delattr", "globals", "vars", "locals", "__import__", "help", "exit", "quit",
+})
+# Modules whose functions answer differently (or do something) on every call
+_SIDE_EFFECT_MODULES = frozenset({
+    "random", "time", "datetime", "os", "sys", "secrets", "uuid", "subprocess",
+    "shutil", "socket", "threading",
+})
+# Values that can't be changed in place
+_VALUE_TYPES = (int, float, complex, bool, str, bytes, type(None), range, tuple, frozenset)
+
+_MISSING = object()  # "name not defined" in read/write snapshots
+
+
+def _root_name(node):
+    """The variable at the bottom of a.b[c].d, or None."""
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+class _Dependencies(ast.NodeVisitor):
+    """
+    What one top-level statement reads, (re)binds and may change in place.
+    Names inside function bodies only count as reads: the body runs later,
+    when the function is called.
+    """
+
+    def __init__(self):
+        self.reads = set()
+        self.writes = set()
+        self.mutates = set()  # variables whose object may be changed in place
+        self.calls = set()  # plain names called, e.g. f in f(x)
+        self.declared_global = set()
+        self.side_effects = False
+        self._nested = 0  # inside a def/lambda/class body
+        self._comprehensions = 0
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.reads.add(node.id)
+        elif not self._nested and not self._comprehensions:
+            self.writes.add(node.id)
+
+    def visit_NamedExpr(self, node):
+        if not self._nested:
+            self.writes.add(node.target.id)  # := binds outside comprehensions too
+        self.visit(node.value)
+
+    def _visit_body(self, body):
+        self._nested += 1
+        for child in body if isinstance(body, list) else [body]:
+            self.visit(child)
+        self._nested -= 1
+
+    def visit_FunctionDef(self, node):
+        if not self._nested:
+            self.writes.add(node.name)
+        for child in node.decorator_list:
+            self.visit(child)
+        self.visit(node.args)
+        if node.returns:
+            self.visit(node.returns)
+        self._visit_body(node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        self.visit(node.args)
+        self._visit_body(node.body)
+
+    def visit_ClassDef(self, node):
+        if not self._nested:
+            self.writes.add(node.name)
+        for child in node.decorator_list + node.bases + node.keywords:
+            self.visit(child)
+        self._visit_body(node.body)
+
+    def _visit_comprehension(self, node):
+        self._comprehensions += 1
+        self.generic_visit(node)
+        self._comprehensions -= 1
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _visit_comprehension
+
+    def visit_Import(self, node):
+        if not self._nested:
+            for alias in node.names:
+                if alias.name == "*":
+                    self.side_effects = True  # binds names we can't see
+                else:
+                    self.writes.add(alias.asname or alias.name.partition(".")[0])
+
+    visit_ImportFrom = visit_Import
+
+    def visit_Global(self, node):
+        self.declared_global.update(node.names)
+
+    def _visit_target(self, node):
+        if not self._nested and isinstance(node.ctx, (ast.Store, ast.Del)):
+            root = _root_name(node)
+            if root:
+                self.mutates.add(root)  # a.x = ... / a[i] = ...
+        self.generic_visit(node)
+
+    visit_Attribute = visit_Subscript = _visit_target
+
+    def visit_AugAssign(self, node):
+        if isinstance(node.target, ast.Name):
+            self.reads.add(node.target.id)  # x += 1 uses x before rebinding it
+            if not self._nested:
+                self.mutates.add(node.target.id)  # += on a list changes it in place
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if not self._nested:
+            func = node.func
+            pure = False
+            if isinstance(func, ast.Name):
+                self.calls.add(func.id)
+                pure = func.id in _PURE_CALLS
+                if func.id in _SIDE_EFFECT_CALLS:
+                    self.side_effects = True
+            else:
+                # a method may change its object, and so may a function
+                # fetched from a container: ops["add"](1)
+                root = _root_name(func.value if isinstance(func, ast.Attribute) else func)
+                if root:
+                    self.mutates.add(root)
+            if not pure:
+                # ...and any other function may change what it is given
+                for arg in node.args + [keyword.value for keyword in node.keywords]:
+                    if isinstance(arg, ast.Starred):
+                        arg = arg.value
+                    if isinstance(arg, ast.Name):
+                        self.mutates.add(arg.id)
+        self.generic_visit(node)
+
+
+def _function_effects(tree):
+    """
+    For each function defined at the top of the buffer, with def or as
+    name = lambda: the globals it rebinds, the globals it may change in
+    place, and whether it has side effects, including those of buffer
+    functions it calls.
+    """
+    effects = {}
+    calls = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            name, args, statements = node.name, node.args, node.body
+        elif (
+            isinstance(node, ast.Assign)
+            and isinstance(node.value, ast.Lambda)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+        ):
+            name, args, statements = node.targets[0].id, node.value.args, [node.value.body]
+        else:
+            continue
+        body = _Dependencies()
+        for child in statements:
+            body.visit(child)
+        params = {arg.arg for arg in ast.walk(args) if isinstance(arg, ast.arg)}
+        local = (body.writes | params) - body.declared_global
+        effects[name] = {
+            "writes": body.writes & body.declared_global,
+            "mutates": body.mutates - local,
+            "side_effects": body.side_effects,
+        }
+        calls[name] = body.calls
+
+    changed = True
+    while changed:
+        changed = False
+        for name, called in calls.items():
+            mine = effects[name]
+            for other in called & effects.keys():
+                theirs = effects[other]
+                if not (theirs["writes"] <= mine["writes"]
+                        and theirs["mutates"] <= mine["mutates"]
+                        and theirs["side_effects"] <= mine["side_effects"]):
+                    mine["writes"] |= theirs["writes"]
+                    mine["mutates"] |= theirs["mutates"]
+                    mine["side_effects"] |= theirs["side_effects"]
+                    changed = True
+    return effects
+
+
+def _statement_dependencies(stmt, functions):
+    deps = _Dependencies()
+    deps.visit(stmt)
+    for name in deps.calls & functions.keys():
+        deps.writes |= functions[name]["writes"]
+        deps.mutates |= functions[name]["mutates"]
+        deps.side_effects |= functions[name]["side_effects"]
+    if isinstance(stmt, ast.Expr):
+        deps.side_effects = True  # a bare expression only runs for its effect
+    return deps
+
+
+def _may_change(name, env):
+    """Could changing this variable in place matter? Not for numbers, strings and most modules."""
+    value = env.get(name, _MISSING)
+    if isinstance(value, type(sys)):
+        return value.__name__.partition(".")[0] in _SIDE_EFFECT_MODULES
+    return not isinstance(value, _VALUE_TYPES)
+
+
+def _may_change_through(value):
+    """
+    Could calling this change objects the buffer holds? Functions and
+    lambdas may change the globals they use, bound methods their object.
+    """
+    if isinstance(value, types.FunctionType):
+        return True
+    if isinstance(value, (types.MethodType, types.BuiltinMethodType)):
+        owner = value.__self__
+        return not isinstance(owner, (type(sys), type) + _VALUE_TYPES)
+    return False
+
+
+# Objects followed at most when working out what a change in place may reach
+REACH_BUDGET = 10_000
+
+
+def _reachable(values, budget=REACH_BUDGET, through_globals=True):
+    """
+    ids of the changeable objects reachable from values: their items and
+    attributes, the object a bound method belongs to, and the closure cells,
+    defaults and (with through_globals) globals a function uses. None if
+    there are more than budget objects to follow.
+    """
+    found = set()
+    seen = set()
+    stack = list(values)
+    while stack:
+        value = stack.pop()
+        if id(value) in seen or value is _MISSING or isinstance(value, (type(sys), type)):
+            continue
+        seen.add(id(value))
+        if len(seen) > budget:
+            return None
+        if isinstance(value, _VALUE_TYPES):
+            if isinstance(value, (tuple, frozenset)):
+                stack.extend(value)  # may still hold lists
+            continue
+        found.add(id(value))
+        if isinstance(value, types.FunctionType):
+            for code in _iter_code_objects(value.__code__) if through_globals else ():
+                stack.extend(value.__globals__[name] for name in code.co_names if name in value.__globals__)
+            for cell in value.__closure__ or ():
+                try:
+                    stack.append(cell.cell_contents)
+                except ValueError:
+                    pass  # not filled in yet
+            stack.extend(value.__defaults__ or ())
+            stack.extend((value.__kwdefaults__ or {}).values())
+        elif isinstance(value, (types.MethodType, types.BuiltinMethodType)):
+            stack.append(value.__self__)
+        stack.extend(_member_values(value))
+    return found
+
+
+def _reaches(values, changed):
+    """Does anything reachable from values belong to the changed ids?"""
+    if not changed:
+        return False
+    reachable = _reachable(values)
+    return reachable is None or not reachable.isdisjoint(changed)
+
+
+def _holders(env):
+    """
+    (id -> names of the variables in env that can reach that changeable
+    object, names with too much to follow). A function only holds its
+    closure cells and defaults here: the globals it uses are looked up by
+    name when it runs.
+    """
+    holders = {}
+    unknown = set()
+    for name, value in env.items():
+        if _is_dunder(name):
+            continue
+        reach = _reachable([value], through_globals=False)
+        if reach is None:
+            unknown.add(name)
+            continue
+        for object_id in reach:
+            holders.setdefault(object_id, set()).add(name)
+    return holders, unknown
+
+
+def _held_elsewhere(values, names, holders, unknown):
+    """Can a variable other than names reach a changeable object among values?"""
+    reach = _reachable(values, through_globals=False)
+    if not reach:
+        return reach is None
+    if unknown - names:
+        return True
+    return any(not holders.get(object_id, names) <= names for object_id in reach)
+
+
+class IncrementalRunner:
+    """
+    Runs a buffer one top-level statement at a time and remembers, for each
+    statement, the objects it read and the ones it left behind. Next time,
+    a statement whose inputs are the very same objects is skipped and its
+    results are put back instead, so only edited statements and the ones
+    depending on them run again.
+
+    Statements that print, do I/O, or may change an object in place always
+    run. Whatever they may have changed is remembered by identity, through
+    aliases, containers, bound methods and the globals of functions and
+    lambdas, and a statement that read or left behind one of those objects
+    runs again, because the cached copy has already been changed.
+
+    Nor is a statement reused while a variable left from before the run,
+    other than the ones it binds, still holds one of the changeable objects
+    it would put back: a plain run would make a fresh object that the old
+    variable doesn't share.
+    """
+
+    def __init__(self):
+        self._cache = {}  # (statement dump, occurrence) -> {"reads": ..., "writes": ...}
+        self._changed = set()  # ids of objects the last run may have changed in place
+
+    def forget(self):
+        """Drop everything remembered; the environment was changed some other way."""
+        self._cache = {}
+        self._changed = set()
+
+    def run(self, source, env, stream, filename="<string>"):
+        """Run source in env; returns (statements run, statements reused)."""
+        tree = ast.parse(source, filename)
+        functions = _function_effects(tree)
+
+        statements = []
+        occurrences = {}
+        tainted = set()  # names whose binding statement must run again
+        for stmt in tree.body:
+            dump = ast.dump(stmt)  # ignores line numbers, so moving code is free
+            occurrences[dump] = occurrences.get(dump, 0) + 1
+            deps = _statement_dependencies(stmt, functions)
+            tainted.update(name for name in deps.mutates if _may_change(name, env))
+            statements.append((stmt, (dump, occurrences[dump]), deps))
+
+        # What the last run changed in place, and what this one has so far;
+        # None once that is too much to follow, and nothing is reused
+        changed = set(self._changed) if self._changed is not None else None
+        changed_now = set()
+        env_before = dict(env)
+        holders = None  # _holders(env_before), made when first needed
+        new_cache = {}
+        ran = reused = 0
+        try:
+            for stmt, key, deps in statements:
+                changing = [name for name in deps.mutates if _may_change(name, env)]
+                changing += [
+                    name for name in deps.calls - functions.keys()
+                    if _may_change_through(env.get(name))
+                ]
+                volatile = deps.side_effects or bool(changing)
+                cached = self._cache.get(key)
+                reusable = (
+                    cached is not None
+                    and changed is not None
+                    and not volatile
+                    and not deps.writes & tainted
+                    and all(env.get(name, _MISSING) is value for name, value in cached["reads"].items())
+                    and not _reaches([*cached["reads"].values(), *cached["writes"].values()], changed)
+                )
+                if reusable:
+                    if holders is None:
+                        holders = _holders(env_before)
+                    reusable = not _held_elsewhere(cached["writes"].values(), deps.writes, *holders)
+                if reusable:
+                    for name, value in cached["writes"].items():
+                        if value is _MISSING:
+                            env.pop(name, None)
+                        else:
+                            env[name] = value
+                    new_cache[key] = cached
+                    reused += 1
+                    continue
+
+                reads = {name: env.get(name, _MISSING) for name in deps.reads}
+                before = [env.get(name, _MISSING) for name in changing]
+                printed_before = stream.chars_written
+                try:
+                    exec(compile(ast.Module([stmt], type_ignores=[]), filename, "exec"), env)
+                finally:
+                    if changing and changed is not None:
+                        # the objects named before and after the statement ran
+                        reach = _reachable(before + [env.get(name, _MISSING) for name in changing])
+                        if reach is None:
+                            changed = changed_now = None
+                        else:
+                            changed |= reach
+                            changed_now |= reach
+                ran += 1
+                if not volatile and stream.chars_written == printed_before:
+                    new_cache[key] = {
+                        "reads": reads,
+                        "writes": {name: env.get(name, _MISSING) for name in deps.writes},
+                    }
+        finally:
+            self._cache = new_cache
+            self._changed = changed_now
+        return ran, reused
+
+
+# What one run may use: seconds of CPU time, bytes of memory on top of what
+# the kernel already holds, characters printed, and how many calls deep
+# functions may go. Runs from the app can change or drop these.
+RUN_BUDGETS = {
+    "cpu_seconds": 60,
+    "memory": 1024 * 1024 * 1024,
+    "output": 20_000_000,
+    "recursion": 1000,
+}
+
+
+def _budget_message(budget, limit):
+    """A budget running out, explained for a kid."""
+    if budget == "cpu_seconds":
+        return (f"your program used all of its {limit} seconds of computer time. "
+                "Is there a loop that never ends?")
+    if budget == "memory":
+        return (f"your program tried to use more than {_format_size(limit)} of extra memory. "
+                "Is a list or a string growing too big?")
+    if budget == "output":
+        return (f"your program printed more than {limit:,} characters. "
+                "Is there a print() in a loop that never ends?")
+    return (f"a function called itself more than {limit:,} times without finishing. "
+            "Does it have a case where it stops?")
+
+
+def _stop_message(time_limit=None):
+    """What the output says after a run was stopped: by Stop, or by a time limit in seconds."""
+    if time_limit is None:
+        return "[Stopped]"
+    return f"[Stopped: the code ran longer than the {time_limit} s time limit]"
+
+
+def _format_user_traceback(exception):
+    """
+    The traceback of an exception raised in the user's code, without the
+    frames of this file (op_exec, the Stop handler, ...): what a kid sees
+    starts at their own code.
+    """
+    import traceback
+    report = traceback.TracebackException.from_exception(exception)
+    pending, seen = [report], set()
+    while pending:
+        part = pending.pop()
+        if id(part) in seen:
+            continue
+        seen.add(id(part))
+        part.stack = traceback.StackSummary.from_list(
+            [frame for frame in part.stack if frame.filename != _THIS_FILE]
+        )
+        pending.extend(p for p in (part.__cause__, part.__context__) if p is not None)
+        pending.extend(getattr(part, "exceptions", None) or ())  # an ExceptionGroup's members
+    return "".join(report.format())
+
+
+_THIS_FILE = _format_user_traceback.__code__.co_filename
+
+
+def _lower_rlimit(resource, which, limit):
+    """Lower a resource's soft limit; returns (which, old limits) to restore, or (None, None)."""
+    try:
+        old = resource.getrlimit(which)
+        hard = old[1]
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)  # only root could go above it
+        resource.setrlimit(which, (limit, hard))
+        return which, old
+    except (ValueError, OSError):
+        return None, None
+
+
+def _stack_depth():
+    frame = sys._getframe(1)
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def _proc_status_bytes(pid, field):
+    """A kB field of /proc/PID/status (Linux) in bytes, or None."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Start measuring peak memory afresh (Linux; elsewhere the peak is since the kernel began)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    """Peak resident memory of this process in bytes, or None."""
+    peak = _proc_status_bytes("self", "VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # macOS counts bytes, not kB
+
+
+# How often input() checks for the app's answer (a Stop can interrupt in between)
+INPUT_POLL_SECONDS = 0.05
+# The Variables panel loads a container's contents this many at a time
+WATCH_PAGE = 100
+# Ops that may change what the kernel's variables hold
+_ENV_CHANGING_OPS = frozenset({"exec", "exec_incremental", "profile", "load_env", "reset"})
+# Memory accounting: deep sizes stop counting after this many objects
+DEEP_SIZE_BUDGET = 200_000
+# The inspector lists at most this many of a variable's biggest parts
+DEEP_SIZE_PARTS = 20
+# Shared machinery a variable points at but doesn't own
+_NOT_OWNED = (type(os), type, type(len), type(_root_name))
+# Values that own nothing but themselves
+_ATOMIC = (int, float, complex, bool, str, bytes, type(None))
+
+
+def _members(value):
+    """(label, member) pairs an object owns: items, elements, attributes."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            label = bounded_repr(key, 40)
+            yield label, key
+            yield label, item
+    elif isinstance(value, (list, tuple, deque)):
+        yield from ((f"[{index}]", item) for index, item in enumerate(value))
+    elif isinstance(value, (set, frozenset)):
+        yield from (("{...}", item) for item in value)
+    else:
+        attributes = getattr(value, "__dict__", None)
+        if type(attributes) is dict:
+            yield from ((f".{name}", item) for name, item in attributes.items())
+        for name in getattr(type(value), "__slots__", ()):
+            if isinstance(name, str) and hasattr(value, name):
+                yield f".{name}", getattr(value, name)
+
+
+def _member_values(value):
+    """The members _members(value) yields, without the labels (which cost a repr each)."""
+    if isinstance(value, dict):
+        for item in value.items():
+            yield from item
+    elif isinstance(value, (list, tuple, deque, set, frozenset)):
+        yield from value
+    else:
+        attributes = getattr(value, "__dict__", None)
+        if type(attributes) is dict:
+            yield from attributes.values()
+        for name in getattr(type(value), "__slots__", ()):
+            if isinstance(name, str) and hasattr(value, name):
+                yield getattr(value, name)
+
+
+def _own_size(value):
+    """sys.getsizeof, plus the instance __dict__ that holds the attributes."""
+    size = sys.getsizeof(value, 0)
+    attributes = getattr(value, "__dict__", None)
+    if type(attributes) is dict:
+        size += sys.getsizeof(attributes)
+    return size
+
+
+def _watch_children(value):
+    """(label, child) pairs shown when a value is opened in the Variables panel."""
+    if isinstance(value, dict):
+        return ((bounded_repr(key, 30), item) for key, item in value.items())
+    if isinstance(value, (list, tuple, deque)):
+        return ((f"[{index}]", item) for index, item in enumerate(value))
+    if isinstance(value, (set, frozenset)):
+        return (("", item) for item in value)
+    if isinstance(value, _NOT_OWNED):
+        return iter(())
+    attributes = getattr(value, "__dict__", None)
+    if type(attributes) is dict:
+        return ((name, item) for name, item in attributes.items() if not _is_dunder(name))
+    return iter(())
+
+
+def _watch_row(value):
+    """(type name, repr, can be opened?) for one row of the Variables panel."""
+    if isinstance(value, (dict, list, tuple, deque, set, frozenset)):
+        openable = len(value) > 0
+    else:
+        openable = next(_watch_children(value), None) is not None
+    return type(value).__name__, bounded_repr(value), openable
+
+
+def _format_size(size):
+    """'512 bytes', '12.3 KB', '4.5 MB', '1.0 GB'."""
+    if size < 1024:
+        return f"{size} bytes"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    if size < 1024 * 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} MB"
+    return f"{size / (1024 * 1024 * 1024):.1f} GB"
+
+
+def deep_size(value, budget=DEEP_SIZE_BUDGET):
+    """
+    (total bytes, [(label, bytes), ...] biggest parts first, complete?) for
+    value and everything it owns. An object reachable twice counts once, in
+    the first part that reaches it. It stops after budget objects, however
+    deep they are, and the total is then a lower bound.
+    """
+    seen = {id(value)}
+    total = _own_size(value)
+    parts = {}
+    complete = True
+    members = () if isinstance(value, _ATOMIC) else _members(value)
+    for label, member in members:
+        if id(member) in seen or isinstance(member, _NOT_OWNED):
+            continue
+        seen.add(id(member))
+        if isinstance(member, _ATOMIC):
+            size = sys.getsizeof(member, 0)
+        else:
+            size = 0
+            stack = [member]
+            while stack and complete:
+                current = stack.pop()
+                size += _own_size(current)
+                if isinstance(current, _ATOMIC):
+                    continue
+                for child in _member_values(current):
+                    if id(child) not in seen and not isinstance(child, _NOT_OWNED):
+                        seen.add(id(child))
+                        stack.append(child)
+                        if len(seen) > budget:
+                            complete = False
+                            break
+        parts[label] = parts.get(label, 0) + size
+        total += size
+        if len(seen) > budget:
+            complete = False
+            break
+    biggest = sorted(parts.items(), key=lambda part: -part[1])[:DEEP_SIZE_PARTS]
+    return total, biggest, complete
+
+
+# Checkpoints: copy-on-write forks of a kernel, parked until they are restored
+CHECKPOINTS_SUPPORTED = sys.platform.startswith("linux") and hasattr(socket, "send_fds")
+CHECKPOINT_LIMIT = 5
+CHECKPOINT_MEMORY_LIMIT = 512 * 1024 * 1024  # memory held only by checkpoints
+
+
+class _Checkpoint:
+    """A parked fork of the kernel, and the socket that wakes it up."""
+
+    def __init__(self, checkpoint_id, label, pid, sock):
+        self.id = checkpoint_id
+        self.label = label
+        self.pid = pid
+        self.sock = sock
+
+
+def _private_memory(pid):
+    """Bytes of memory only this process holds (pages it shares with its fork family don't count)."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            return 1024 * sum(
+                int(line.split()[1])
+                for line in f
+                if line.startswith(("Private_Clean:", "Private_Dirty:"))
+            )
+    except OSError:
+        return 0
+
+
+def _kernel_main(conn, control=None, interrupt_target=None):
+    """Entry point of a kernel process: serve requests until the pipe closes."""
+    _INTERRUPTS.target = interrupt_target
+    signal.signal(signal.SIGINT, _INTERRUPTS.handler)
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _INTERRUPTS.cpu_handler)  # the run's CPU budget ran out
+    if control is not None:
+        threading.Thread(target=_control_loop, args=(control,), daemon=True).start()
+    _KernelWorker(conn).serve()
+
+
+def _control_loop(control):
+    """
+    Where there is no way to signal another process (Windows), Stop comes
+    down this pipe instead and is turned into a simulated SIGINT.
+    """
+    while True:
+        try:
+            request = control.recv()
+        except (EOFError, OSError):
+            return
+        if request == "interrupt":
+            _thread.interrupt_main()
+
+
+class _KernelWorker:
+    """Lives inside a kernel process and owns that kernel's execution_env."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        # This dict stores variables/functions between runs (like a notebook)
+        self.env = {}
+        self.incremental = IncrementalRunner()
+        # Server mode: other students' environments, parked by session name
+        self.sessions = {}
+        self._session = None
+        self.checkpoints = []  # oldest first
+        self._next_checkpoint_id = 1
+        self._children = set()  # checkpoint pids we forked and must reap
+        self.explain_cache = ExplanationCache()
+        # Deep sizes for the inspector: name -> ((id, shallow size), runs, result)
+        self._sizes = {}
+        self._runs = 0  # ops that may have changed the environment so far
+        self._watch = NamespaceDiff()  # what the app's Variables panel shows
+        # input() in the user's code asks the app, which shows an answer bar
+        self._input_stream = None  # the running job's output, while input() can be answered
+        self._deferred = deque()  # requests that arrived while input() waited
+        self._usage = {}  # what the latest run used; see _budgets
+        builtins.input = self._input
+
+    def serve(self):
+        while True:
+            try:
+                msg = self._deferred.popleft() if self._deferred else self.conn.recv()
+            except (EOFError, OSError):
+                break  # the app went away
+            if msg["op"] == "shutdown":
+                break
+            if msg["op"] == "input_reply":
+                continue  # an answer to an input() that was stopped meanwhile
+            self._switch_session(msg.get("session"))
+            _INTERRUPTS.job_id = msg["id"]
+            if msg.get("announce_start"):
+                self.conn.send({"op": "started", "id": msg["id"]})
+            started = time.process_time()
+            wall_started = time.perf_counter()
+            if msg["op"] in _ENV_CHANGING_OPS:
+                self._runs += 1
+                if msg["op"] != "exec_incremental":
+                    self.incremental.forget()  # other runs change objects it doesn't see
+            handler = getattr(self, "op_" + msg["op"])
+            reply = self._measured(handler, msg) if msg.get("measure_memory") else handler(msg)
+            if reply is None:
+                continue  # a restored checkpoint waking up; its restore was already answered
+            reply["cpu"] = time.process_time() - started
+            reply["wall"] = time.perf_counter() - wall_started
+            reply.setdefault("op", "done")
+            reply["id"] = msg["id"]
+            self.conn.send(reply)
+
+    def _measured(self, handler, msg):
+        """
+        Run an op under tracemalloc and add its memory use to the reply: the
+        peak, what it allocated that is still alive, and the kernel's size.
+        """
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            reply = handler(msg)
+            kept, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        if reply is not None:
+            reply["memory"] = {"peak": peak, "kept": kept, "resident": _process_memory(os.getpid())}
+        return reply
+
+    @contextlib.contextmanager
+    def _user_io(self, stream):
+        """Send the user's print()s to the app, and let their input()s ask it, during a run."""
+        self._input_stream = stream
+        try:
+            with contextlib.redirect_stdout(stream), contextlib.redirect_stderr(stream):
+                yield
+        finally:
+            self._input_stream = None
+
+    @contextlib.contextmanager
+    def _budgets(self, budgets, stream):
+        """
+        Hold the code run inside this block to budgets (see RUN_BUDGETS; a
+        missing or None budget is no limit), then note what it used in
+        self._usage. CPU and memory limits need POSIX resource limits;
+        elsewhere only the output and recursion ones apply.
+        """
+        budgets = budgets or {}
+        try:
+            import resource
+        except ImportError:
+            resource = None
+        restore = []  # (resource, old limits) to put back afterwards
+        if resource is not None and budgets.get("cpu_seconds") and hasattr(signal, "SIGXCPU"):
+            cpu_limit = int(time.process_time()) + 1 + budgets["cpu_seconds"]
+            restore.append(_lower_rlimit(resource, resource.RLIMIT_CPU, cpu_limit))
+        in_use = _proc_status_bytes("self", "VmSize")
+        if resource is not None and budgets.get("memory") and in_use is not None:
+            memory_limit = in_use + budgets["memory"]
+            restore.append(_lower_rlimit(resource, resource.RLIMIT_AS, memory_limit))
+        old_recursion_limit = sys.getrecursionlimit()
+        if budgets.get("recursion"):
+            sys.setrecursionlimit(_stack_depth() + budgets["recursion"])
+        stream.limit = budgets.get("output")
+        _reset_peak_rss()
+        try:
+            yield
+        finally:
+            stream.limit = None
+            sys.setrecursionlimit(old_recursion_limit)
+            for which, limits in restore:
+                if which is not None:
+                    resource.setrlimit(which, limits)
+            self._usage = {"peak_rss": _peak_rss(), "output": stream.chars_written, "budget": None}
+
+    def _report_error(self, msg):
+        """
+        Write the traceback of the exception being handled to the output and
+        return it; if it means a budget ran out, say so in plain words too.
+        """
+        exception = sys.exc_info()[1]
+        error = _format_user_traceback(exception)
+        budgets = msg.get("budgets") or {}
+        if isinstance(exception, RunBudgetExceeded):
+            budget = exception.budget
+        elif isinstance(exception, MemoryError) and budgets.get("memory"):
+            budget = "memory"
+        elif isinstance(exception, RecursionError) and budgets.get("recursion"):
+            budget = "recursion"
+        else:
+            budget = None
+        if budget is not None:
+            error += f"\n[Stopped: {_budget_message(budget, budgets[budget])}]\n"
+            self._usage["budget"] = budget
+        sys.stderr.write(error)
+        return error
+
+    @staticmethod
+    def _report_exit(exit):
+        """
+        sys.exit() or exit() in the user's code ends the run, not the kernel:
+        what was printed so far stands. Like Python, a message passed to it
+        is printed too. Returns the exit code, as Python would set it.
+        """
+        if exit.code is None:
+            return 0
+        if isinstance(exit.code, int):
+            return exit.code
+        sys.stderr.write(f"{exit.code}\n")
+        return 1
+
+    def _input(self, prompt=""):
+        """
+        builtins.input for the user's code: show the prompt, ask the app for
+        a line and wait for it. Stop still works while waiting; requests
+        that arrive meanwhile are served once the run is over.
+        """
+        stream = self._input_stream
+        if stream is None:
+            raise EOFError("input() can only be answered during Run")
+        sys.stdout.write(str(prompt))
+        sys.stdout.flush()
+        stream.flush()
+        with _INTERRUPTS.hold():
+            self.conn.send({"op": "input_request", "id": stream.job_id})
+        while True:
+            while not self.conn.poll(INPUT_POLL_SECONDS):
+                pass  # a Stop lands here as KeyboardInterrupt
+            with _INTERRUPTS.hold():
+                msg = self.conn.recv()
+            if msg["op"] == "input_reply":
+                break
+            self._deferred.append(msg)
+        if msg["text"] is None:
+            raise EOFError("EOF when reading a line")
+        return msg["text"]
+
+    def op_exec(self, msg):
+        """Run a piece of code in the persistent environment, streaming its output."""
+        stream = _StreamWriter(self.conn, msg["id"])
+        error = None
+        exit_code = 0
+        with self._user_io(stream):
+            try:
+                with _INTERRUPTS.armed(), self._budgets(msg.get("budgets"), stream):
+                    exec(marshal.loads(msg["code"]), self.env)
+            except SystemExit as exit:
+                exit_code = self._report_exit(exit)
+            except (Exception, KeyboardInterrupt, RunBudgetExceeded):
+                error = self._report_error(msg)
+        stream.flush()
+        return {
+            "error": error,
+            "exit_code": exit_code,
+            "names": list(self.env),
+            "usage": self._usage,
+        }
+
+    def op_exec_incremental(self, msg):
+        """Like op_exec, but statements whose inputs haven't changed are reused, not re-run."""
+        stream = _StreamWriter(self.conn, msg["id"])
+        error = None
+        exit_code = 0
+        ran = reused = 0
+        with self._user_io(stream):
+            try:
+                with _INTERRUPTS.armed(), self._budgets(msg.get("budgets"), stream):
+                    ran, reused = self.incremental.run(msg["source"], self.env, stream)
+            except SystemExit as exit:
+                exit_code = self._report_exit(exit)
+            except (Exception, KeyboardInterrupt, RunBudgetExceeded):
+                error = self._report_error(msg)
+        stream.flush()
+        return {
+            "error": error,
+            "exit_code": exit_code,
+            "ran": ran,
+            "reused": reused,
+            "names": list(self.env),
+            "usage": self._usage,
+        }
+
+    def op_profile(self, msg):
+        """Like op_exec, but also count hits and time per line of the code."""
+        stream = _StreamWriter(self.conn, msg["id"])
+        profiler = LineProfiler()
+        error = None
+        exit_code = 0
+        with self._user_io(stream):
+            try:
+                with _INTERRUPTS.armed(), self._budgets(msg.get("budgets"), stream):
+                    profiler.run(marshal.loads(msg["code"]), self.env)
+            except SystemExit as exit:
+                exit_code = self._report_exit(exit)
+            except (Exception, KeyboardInterrupt, RunBudgetExceeded):
+                error = self._report_error(msg)
+        stream.flush()
+        return {
+            "error": error,
+            "exit_code": exit_code,
+            "hits": profiler.hits,
+            "times": profiler.times,
+            "total_ns": profiler.total_ns,
+            "names": list(self.env),
+            "usage": self._usage,
+        }
+
+    def _switch_session(self, name):
+        """Make a session's environment the current one (None: this kernel's own)."""
+        if name == self._session:
+            return
+        self.sessions[self._session] = (self.env, self.incremental)
+        self.env, self.incremental = self.sessions.pop(name, None) or ({}, IncrementalRunner())
+        self._session = name
+        self._sizes = {}
+
+    def op_drop_session(self, msg):
+        """Forget a session that has ended."""
+        self.sessions.pop(msg["name"], None)
+        return {}
+
+    def op_reset(self, msg):
+        """Start over with an empty environment (the batch runner reuses kernels)."""
+        self.env = {}
+        self.incremental = IncrementalRunner()
+        return {}
+
+    def op_save_env(self, msg):
+        """Pickle whatever variables can be pickled to msg["path"], for the next session."""
+        import pickle
+        saved = {}
+        skipped = []
+        size = 0
+        for name, value in self.env.items():
+            if _is_dunder(name):
+                continue
+            try:
+                if isinstance(value, type(os)):
+                    data = pickle.dumps(("module", value.__name__))  # re-imported on load
+                else:
+                    data = pickle.dumps(("value", value), pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                skipped.append(name)  # functions, open files, ...
+                continue
+            size += len(data)
+            if size > AUTOSAVE_ENV_LIMIT:
+                skipped.append(name)
+                continue
+            saved[name] = data
+        temp_path = msg["path"] + ".tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                pickle.dump(saved, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, msg["path"])
+        except OSError as e:
+            return {"error": str(e)}
+        return {"saved": len(saved), "skipped": skipped}
+
+    def op_load_env(self, msg):
+        """Put back the variables op_save_env wrote; ones that won't load are left out."""
+        import importlib
+        import pickle
+        try:
+            with open(msg["path"], "rb") as f:
+                saved = pickle.load(f)
+        except Exception as e:
+            return {"error": str(e)}
+        loaded = []
+        for name, data in saved.items():
+            try:
+                kind, value = pickle.loads(data)
+                self.env[name] = importlib.import_module(value) if kind == "module" else value
+            except Exception:
+                continue
+            loaded.append(name)
+        return {"loaded": loaded, "names": list(self.env)}
+
+    def op_watch(self, msg):
+        """
+        What changed in the environment since the Variables panel last
+        looked: (name, type name, repr, can be opened?), or (name, None,
+        None, False) for names that went away. msg["full"] starts over.
+        """
+        if msg.get("full"):
+            self._watch = NamespaceDiff()
+        changes = []
+        for name, rep in self._watch.changes(self.env, self.env):
+            if rep is None:
+                changes.append((name, None, None, False))
+            else:
+                type_name, _, openable = _watch_row(self.env[name])
+                changes.append((name, type_name, rep, openable))
+        return {"changes": changes}
+
+    def op_watch_items(self, msg):
+        """
+        One page of what a value in the Variables panel holds. The value is
+        found by msg["path"]: a variable name, then the positions of the
+        children opened below it.
+        """
+        name, *positions = msg["path"]
+        try:
+            value = self.env[name]
+            for position in positions:
+                value = next(islice(_watch_children(value), position, None))[1]
+            start = msg["start"]
+            page = list(islice(_watch_children(value), start, start + WATCH_PAGE + 1))
+            items = [(label, *_watch_row(item)) for label, item in page[:WATCH_PAGE]]
+        except Exception:
+            return {"path": msg["path"], "start": msg["start"], "items": [], "more": False}
+        return {"path": msg["path"], "start": start, "items": items, "more": len(page) > WATCH_PAGE}
+
+    def op_env_list(self, msg):
+        """The variables with their type and own size; op_env_sizes measures what they hold."""
+        entries = [
+            (name, type(value).__name__, sys.getsizeof(value, 0))
+            for name, value in self.env.items()
+            if not _is_dunder(name)
+        ]
+        return {"entries": entries, "resident": _process_memory(os.getpid())}
+
+    def op_env_sizes(self, msg):
+        """
+        Deep sizes of the named variables. A size is reused while the same
+        object is bound and unchanged: nothing has run since it was measured,
+        or it is a value that can't change anyway.
+        """
+        sizes = {}
+        for name in msg["names"]:
+            value = self.env.get(name, _MISSING)
+            if value is _MISSING:
+                continue
+            fingerprint = (id(value), sys.getsizeof(value, 0))
+            cached = self._sizes.get(name)
+            if cached is not None and cached[0] == fingerprint and (
+                cached[1] == self._runs or isinstance(value, _ATOMIC)
+            ):
+                sizes[name] = cached[2]
+                continue
+            try:
+                result = deep_size(value)
+            except Exception:
+                result = None  # a __getattr__ or __repr__ that fights back
+            self._sizes[name] = (fingerprint, self._runs, result)
+            sizes[name] = result
+        return {"sizes": sizes}
+
+    def op_trace(self, msg):
+        """
+        Trace code in a fresh environment into a ColumnarTrace for the step
+        scrubber. Stops early if the trace outgrows its memory budget.
+        """
+        return self._trace(msg["source"], marshal.loads(msg["code"]), msg["max_steps"], msg.get("budgets"))
+
+    def _trace(self, source, compiled, max_steps, budgets=None):
+        key = None
+        if _repeatable(compiled):
+            key = self.explain_cache.key("trace", source, max_steps)
+            cached = self.explain_cache.get(key)
+            if cached is not None:
+                return {**cached, "interrupted": False, "cached": True}
+        trace = ColumnarTrace()
+
+        def on_step(step):
+            with _INTERRUPTS.hold():
+                trace.append(*step)
+                if len(trace) % 4096 == 0 and trace.nbytes() > TRACE_MEMORY_LIMIT:
+                    trace.truncated = True
+                    tracer.max_steps = tracer.step_count  # stops the trace
+
+        env = {"__builtins__": builtins}
+        printed = _HeldOutput()
+        tracer = StepTracer(max_steps, on_step)
+        interrupted = self._run_traced(tracer, compiled, env, printed, budgets)
+        trace.truncated = trace.truncated or tracer.finished or interrupted
+        trace.append(0, tracer.finish(env))  # the program's end state
+        result = {"trace": trace.to_message(), "printed": printed.getvalue()}
+        if key is not None and not interrupted and trace.nbytes() < EXPLAIN_CACHE_LIMIT // 4:
+            self.explain_cache.put(key, result)
+        return {**result, "interrupted": interrupted}
+
+    def _run_traced(self, tracer, compiled, env, printed, budgets=None):
+        """
+        Run a tracer with Stop armed and held to the same budgets as a run;
+        True if it was stopped, or a budget ran out.
+        """
+        budgets = budgets or {}
+        with contextlib.redirect_stdout(printed), contextlib.redirect_stderr(printed):
+            try:
+                with _INTERRUPTS.armed(), self._budgets(budgets, printed):
+                    tracer.run(compiled, env)
+            except SystemExit as exit:
+                self._report_exit(exit)  # the program ended itself; the kernel carries on
+                return False
+            except KeyboardInterrupt:
+                return True
+            except RunBudgetExceeded as exceeded:
+                budget = exceeded.budget
+            else:
+                # the snippet's own errors were caught and printed by the tracer
+                if isinstance(tracer.error, MemoryError) and budgets.get("memory"):
+                    budget = "memory"
+                elif isinstance(tracer.error, RecursionError) and budgets.get("recursion"):
+                    budget = "recursion"
+                else:
+                    return False
+            self._usage["budget"] = budget
+            printed.write(f"\n[Stopped: {_budget_message(budget, budgets[budget])}]\n")
+        # Cut short by a budget: the result depends on the limits, so it isn't cached
+        return True
+
+    # -- checkpoints --
+
+    def op_checkpoint(self, msg):
+        """
+        Park a copy-on-write fork of this kernel. The fork shares every page
+        with us until one side changes it, so keeping a few is cheap.
+        """
+        if not CHECKPOINTS_SUPPORTED:
+            return {"error": "Checkpoints need Linux", "checkpoints": []}
+        ours, theirs = socket.socketpair()
+        checkpoint_id = self._next_checkpoint_id
+        self._next_checkpoint_id += 1
+        label = msg.get("label", "")
+        pid = os.fork()
+        if pid == 0:
+            # The checkpoint: hold no other checkpoint's socket, so each one
+            # sees EOF as soon as the active kernel lets go of it.
+            ours.close()
+            for checkpoint in self.checkpoints:
+                checkpoint.sock.close()
+            self.checkpoints = []
+            self._children = set()
+            self._wait_as_checkpoint(theirs, checkpoint_id, label)
+            return None  # restored: carry on serving as the active kernel
+
+        theirs.close()
+        self._children.add(pid)
+        self.checkpoints.append(_Checkpoint(checkpoint_id, label, pid, ours))
+        self._evict_checkpoints()
+        return {"checkpoint": checkpoint_id, "checkpoints": self._checkpoint_listing()}
+
+    def op_restore(self, msg):
+        """
+        Hand the pipe to a checkpoint and exit. The checkpoint forks a live
+        copy of itself that takes over, so the same checkpoint can be
+        restored again later.
+        """
+        import json
+        target = next((c for c in self.checkpoints if c.id == msg["checkpoint"]), None)
+        if target is None:
+            return {"error": "That checkpoint is gone", "checkpoints": self._checkpoint_listing()}
+        others = [c for c in self.checkpoints if c is not target]
+        state = {
+            "checkpoints": [[c.id, c.label, c.pid] for c in others],
+            "next_id": self._next_checkpoint_id,
+        }
+        # The other checkpoints' sockets travel along, so the new kernel can
+        # restore or evict them too.
+        socket.send_fds(target.sock, [json.dumps(state).encode()], [c.sock.fileno() for c in others])
+        new_pid = int(target.sock.recv(64) or 0)
+        if not new_pid:
+            return {"error": "The checkpoint did not wake up", "checkpoints": self._checkpoint_listing()}
+        self.conn.send({
+            "op": "done",
+            "id": msg["id"],
+            "kernel_pid": new_pid,
+            "restored": target.id,
+            "checkpoints": self._checkpoint_listing(),
+        })
+        os._exit(0)  # closing our sockets tells the new kernel to start
+
+    def _wait_as_checkpoint(self, sock, checkpoint_id, label):
+        """Sleep until restored; returns only in the fork that becomes the active kernel."""
+        import json
+        while True:
+            try:
+                data, fds, _flags, _addr = socket.recv_fds(sock, 1 << 16, CHECKPOINT_LIMIT + 1)
+            except OSError:
+                data = b""
+            if not data:
+                os._exit(0)  # evicted, or the active kernel went away
+            state = json.loads(data)
+            ours, theirs = socket.socketpair()
+            pid = os.fork()
+            if pid == 0:
+                sock.close()
+                theirs.close()
+                ours.recv(1)  # wait until the old kernel has let go of the pipe
+                self.checkpoints = [
+                    _Checkpoint(other_id, other_label, other_pid, socket.socket(fileno=fd))
+                    for (other_id, other_label, other_pid), fd in zip(state["checkpoints"], fds)
+                ]
+                self.checkpoints.append(_Checkpoint(checkpoint_id, label, os.getppid(), ours))
+                self.checkpoints.sort(key=lambda c: c.id)
+                self._next_checkpoint_id = state["next_id"]
+                self._children = set()
+                return
+
+            # Still the checkpoint: report the new kernel, and let it start
+            # once the old one has gone.
+            for fd in fds:
+                os.close(fd)
+            ours.close()
+            sock.send(str(pid).encode())
+            sock.recv(1)
+            theirs.send(b"g")
+            sock.close()
+            sock = theirs
+
+    def _evict_checkpoints(self):
+        """Drop the oldest checkpoints while there are too many or they hold too much memory."""
+        while len(self.checkpoints) > 1 and (
+            len(self.checkpoints) > CHECKPOINT_LIMIT
+            or sum(_private_memory(c.pid) for c in self.checkpoints) > CHECKPOINT_MEMORY_LIMIT
+        ):
+            self.checkpoints.pop(0).sock.close()  # EOF makes it exit
+        self._reap()
+
+    def _reap(self):
+        for pid in list(self._children):
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0] == 0:
+                    continue
+            except ChildProcessError:
+                pass
+            self._children.discard(pid)
+
+    def _checkpoint_listing(self):
+        return [
+            {"id": c.id, "label": c.label, "memory": _private_memory(c.pid)}
+            for c in self.checkpoints
+        ]
+
+    def op_explain(self, msg):
+        """
+        Trace code line-by-line in a fresh environment (not the notebook one),
+        streaming the kid-style explanation to the app while it runs.
+        """
+        explanation = _StreamWriter(self.conn, msg["id"])
+        result = self._explain(
+            msg["source"], marshal.loads(msg["code"]), msg["max_steps"], explanation, msg.get("budgets")
+        )
+        explanation.flush()
+        return result
+
+    def _explain(self, source, compiled, max_steps, explanation, budgets=None):
+        """Write the explanation to a stream, straight from the cache when it can."""
+        key = None
+        if _repeatable(compiled):
+            key = self.explain_cache.key("explain", source, max_steps)
+            cached = self.explain_cache.get(key)
+            if cached is not None:
+                explanation.write(cached["explanation"])
+                return {**cached["result"], "interrupted": False, "cached": True}
+        written = []
+        formatter = kid_style_formatter(source.splitlines())
+        next(formatter)
+        format_seconds = 0.0  # of the run, the time spent writing the explanation
+
+        def on_step(step):
+            nonlocal format_seconds
+            with _INTERRUPTS.hold():  # never stop halfway through a step's lines
+                started = time.perf_counter()
+                lines = formatter.send(step)
+                format_seconds += time.perf_counter() - started
+                for line in lines:
+                    explanation.write(line + "\n")
+                    written.append(line + "\n")
+
+        env = {"__builtins__": builtins}
+        # Printed text is shown after the explanation, so it is kept back here
+        printed = _HeldOutput()
+        tracer = StepTracer(max_steps, on_step)
+        interrupted = self._run_traced(tracer, compiled, env, printed, budgets)
+        on_step((None, tracer.finish(env)))
+        result = {"step_count": tracer.step_count, "printed": printed.getvalue()}
+        if key is not None and not interrupted:
+            self.explain_cache.put(key, {"explanation": "".join(written), "result": result})
+        return {**result, "interrupted": interrupted, "format_seconds": format_seconds}
+
+    def op_warm_explanations(self, msg):
+        """Cache the explanation and trace of each source (the Examples) ahead of time."""
+        for source in msg["sources"]:
+            compiled = compile(source, "<string>", "exec")
+            with contextlib.redirect_stdout(io.StringIO()):  # nothing reaches the app
+                self._explain(source, compiled, msg["explain_steps"], io.StringIO(), RUN_BUDGETS)
+                self._trace(source, compiled, msg["trace_steps"], RUN_BUDGETS)
+        return {}
+
+
+class Kernel:
+    """Handle on one kernel process, talked to over a duplex pipe."""
+
+    def __init__(self):
+        self.conn, child_conn = _MP_CONTEXT.Pipe()
+        # Without signals, Stop needs a pipe of its own that a kernel thread
+        # watches while the main thread is busy running code
+        self._control = child_control = None
+        if os.name == "nt":
+            self._control, child_control = _MP_CONTEXT.Pipe()
+        # Which job an interrupt is meant for (0: whichever is running)
+        self._interrupt_target = _MP_CONTEXT.RawValue("q", 0)
+        self.process = _MP_CONTEXT.Process(
+            target=_kernel_main, args=(child_conn, child_control, self._interrupt_target), daemon=True
+        )
+        self.process.start()
+        child_conn.close()  # the child holds its own copy
+        if child_control is not None:
+            child_control.close()
+        self.pid = self.process.pid  # changes when a checkpoint is restored
+        self._next_id = 0
+        self._closed = False
+
+    def submit(self, op, **fields):
+        """Send a request and return its job id; the reply arrives via poll()."""
+        self._next_id += 1
+        fields.update(op=op, id=self._next_id)
+        self.conn.send(fields)
+        return self._next_id
+
+    def poll(self, limit=None):
+        """Return messages that have already arrived (at most limit), without blocking."""
+        messages = []
+        try:
+            while (limit is None or len(messages) < limit) and self.conn.poll():
+                msg = self.conn.recv()
+                if "kernel_pid" in msg:
+                    self.pid = msg["kernel_pid"]  # a checkpoint took over
+                messages.append(msg)
+        except (EOFError, OSError):
+            self._closed = True  # kernel died; the caller sees no reply
+        return messages
+
+    def answer(self, job_id, text):
+        """Answer an input_request from job_id; text None makes input() raise EOFError."""
+        try:
+            self.conn.send({"op": "input_reply", "id": job_id, "text": text})
+        except OSError:
+            self._closed = True
+
+    def interrupt(self, job_id=None):
+        """
+        Stop the code that is running with a KeyboardInterrupt; the environment
+        is kept. With a job_id, only that job is stopped: if the kernel has
+        moved on to another by the time the interrupt lands, it is ignored.
+        """
+        self._interrupt_target.value = job_id or 0
+        try:
+            if self._control is not None:
+                self._control.send("interrupt")
+            else:
+                os.kill(self.pid, signal.SIGINT)
+        except OSError:
+            pass  # already gone
+
+    def is_alive(self):
+        if self._closed:
+            return False
+        if self.pid == self.process.pid:
+            if self.process.is_alive():
+                return True
+        else:
+            try:
+                os.kill(self.pid, 0)
+                return True
+            except OSError:
+                pass
+        # The old kernel may have exited right after handing over to a
+        # checkpoint, with the new pid still waiting in the pipe
+        try:
+            return self.conn.poll()
+        except OSError:
+            return False
+
+    def shutdown(self):
+        """Stop the kernel straight away; its environment (and checkpoints) are thrown away."""
+        for conn in (self.conn, self._control):
+            try:
+                if conn is not None:
+                    conn.close()
+            except OSError:
+                pass
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.pid != self.process.pid:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+
+class KernelPool:
+    """Keeps kernels started ahead of time, so taking one never waits for Python to boot."""
+
+    def __init__(self, size=1):
+        self.size = size
+        self._ready = deque()
+        self._fill()
+
+    def _fill(self):
+        while len(self._ready) < self.size:
+            self._ready.append(Kernel())
+
+    def acquire(self):
+        """Hand out a warm kernel and start a replacement in the background."""
+        kernel = None
+        while self._ready and kernel is None:
+            candidate = self._ready.popleft()
+            if candidate.is_alive():
+                kernel = candidate
+        if kernel is None:
+            kernel = Kernel()
+        self._fill()
+        return kernel
+
+    def shutdown(self):
+        while self._ready:
+            self._ready.popleft().shutdown()
+
+
+# ---------------- AUTOSAVE ----------------
+
+# Per-user files: the autosave journal, saved variables, cached explanations
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".code_tutor")
+# Edits are written at most this often
+AUTOSAVE_DELAY_MS = 1000
+# Rewrite the journal as one snapshot after this many diffs...
+AUTOSAVE_COMPACT_RECORDS = 200
+# ...or once it is this many times bigger than the code itself
+AUTOSAVE_COMPACT_RATIO = 4
+AUTOSAVE_JOURNAL = os.path.join(DATA_DIR, "editor.journal")
+AUTOSAVE_VARIABLES = os.path.join(DATA_DIR, "variables.pickle")
+# Saved variables bigger than this (pickled, in total) are left out
+AUTOSAVE_ENV_LIMIT = 64 * 1024 * 1024
+
+
+def replay_journal(path):
+    """The editor text recorded in a journal file, or None if there is none."""
+    import json
+    try:
+        with open(path, encoding="utf-8") as f:
+            records = f.read().split("\n")
+    except (OSError, UnicodeDecodeError):
+        return None
+    text = None
+    for line in records:
+        try:
+            record = json.loads(line)
+            if record[0] == "S":  # ["S", text]: a full snapshot
+                text = record[1]
+            elif record[0] == "D" and text is not None:  # ["D", at, cut, text]: a diff
+                at, cut, inserted = record[1:]
+                text = text[:at] + inserted + text[at + cut:]
+        except (ValueError, TypeError, IndexError, KeyError):
+            break  # a torn last line from a crash; everything before it is good
+    return text
+
+
+def _text_diff(old, new):
+    """(at, cut, inserted) such that old[:at] + inserted + old[at + cut:] == new."""
+    limit = min(len(old), len(new))
+    at = 0
+    while at < limit and old[at] == new[at]:
+        at += 1
+    end = 0
+    while end < limit - at and old[-end - 1] == new[-end - 1]:
+        end += 1
+    return at, len(old) - at - end, new[at:len(new) - end]
+
+
+class JournalWriter:
+    """
+    Appends the editor's text to an append-only journal as small diffs, on
+    a background thread, so typing never waits for the disk. Every so often
+    the journal is rewritten as a single snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.enabled = self._lock()  # a second window leaves the journal alone
+        self._texts = queue.Queue()
+        self._thread = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._thread.start()
+
+    def _lock(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._lock_file = open(self.path + ".lock", "w")
+        except OSError:
+            return False
+        try:
+            import fcntl
+        except ImportError:
+            return True  # Windows: no locking, last writer wins
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            return False
+        return True
+
+    def save(self, text):
+        """Queue the editor's current text; returns straight away."""
+        if self.enabled:
+            self._texts.put(text)
+
+    def close(self):
+        """Write whatever is still queued, then stop."""
+        if self.enabled:
+            self._texts.put(None)
+            self._thread.join(timeout=5)
+            self._lock_file.close()
+
+    def _write_loop(self):
+        import json
+        text = None  # so the first save is a snapshot (it also drops any torn line)
+        journal = None
+        records = 0
+        try:
+            closing = False
+            while not closing:
+                new_text = self._texts.get()
+                closing = new_text is None
+                while not closing and not self._texts.empty():
+                    queued = self._texts.get()  # only the latest text matters
+                    closing = queued is None
+                    if not closing:
+                        new_text = queued
+                if new_text is None or new_text == text:
+                    continue
+                if text is None or records >= AUTOSAVE_COMPACT_RECORDS or (
+                    journal.tell() > AUTOSAVE_COMPACT_RATIO * len(new_text) + 4096
+                ):
+                    if journal is not None:
+                        journal.close()
+                    journal = self._compact(json, new_text)
+                    records = 0
+                else:
+                    journal.write(json.dumps(["D", *_text_diff(text, new_text)]) + "\n")
+                    journal.flush()
+                    records += 1
+                text = new_text
+        except OSError:
+            pass  # disk full or gone: stop autosaving rather than bother the student
+        finally:
+            if journal is not None:
+                journal.close()
+
+    def _compact(self, json, text):
+        """Replace the journal with one snapshot; returns it opened for appending."""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(["S", text]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        return open(self.path, "a", encoding="utf-8")
+
+
+# ---------------- EXPLANATION CACHE ----------------
+
+EXPLAIN_CACHE_DIR = os.path.join(DATA_DIR, "explanations")
+# Least recently used entries are deleted beyond this much disk
+EXPLAIN_CACHE_LIMIT = 64 * 1024 * 1024
+# Code that uses any of these may explain differently next time, so it isn't cached
+_UNREPEATABLE_NAMES = _SIDE_EFFECT_MODULES | {
+    "input", "open", "exec", "eval", "compile", "breakpoint", "__import__",
+}
+
+
+def _repeatable(code):
+    """True if tracing code in a fresh environment always gives the same steps."""
+    return all(
+        _UNREPEATABLE_NAMES.isdisjoint(each.co_names) for each in _iter_code_objects(code)
+    )
+
+
+class ExplanationCache:
+    """
+    Explanations and step-through traces on disk, one file per entry, named
+    by a hash of the source, the Python version and this program's own
+    code. Used entries have their mtime touched, so eviction is LRU.
+    """
+
+    def __init__(self, directory=EXPLAIN_CACHE_DIR, limit=EXPLAIN_CACHE_LIMIT):
+        self.directory = directory
+        self.limit = limit
+        self._salt = None
+
+    def key(self, kind, source, max_steps):
+        import hashlib
+        if self._salt is None:
+            self._salt = sys.version.encode() + _program_digest()
+        digest = hashlib.blake2b(self._salt, digest_size=20)
+        # A trailing newline (Tk always adds one) doesn't change anything
+        digest.update(f"{kind}\0{max_steps}\0{source.rstrip()}".encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def has(self, key):
+        return os.path.exists(os.path.join(self.directory, key))
+
+    def get(self, key):
+        import pickle
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)  # recently used
+        except Exception:
+            return None  # missing, half-written by a crash, or from another version
+        return value
+
+    def put(self, key, value):
+        import pickle
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.limit // 4:
+            return
+        path = os.path.join(self.directory, key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+            self._evict()
+        except OSError:
+            pass  # a cache that can't be written is just a slower cache
+
+    def _evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.limit:
+                break
+            os.remove(path)
+            total -= size
+
+
+def _program_digest():
+    """Hash of this file, so a changed explainer never reuses old explanations."""
+    import hashlib
+    try:
+        with open(__file__, "rb") as f:
+            return hashlib.blake2b(f.read(), digest_size=16).digest()
+    except (OSError, NameError):
+        return b""
+
+
+# ---------------- TELEMETRY ----------------
+
+# Samples kept per measurement for the rolling percentiles
+TELEMETRY_WINDOW = 500
+# How often the event-loop lag probe runs
+TELEMETRY_PROBE_MS = 100
+# The optional log: one JSON summary line this often, rotated at this size
+TELEMETRY_LOG = os.path.join(DATA_DIR, "telemetry.jsonl")
+TELEMETRY_LOG_SECONDS = 60
+TELEMETRY_LOG_LIMIT = 1024 * 1024
+
+
+class Telemetry:
+    """
+    Timings in milliseconds, by name ("run.kernel", "mainloop.lag", ...).
+    The last TELEMETRY_WINDOW samples of each are kept for percentiles.
+    """
+
+    def __init__(self, window=TELEMETRY_WINDOW):
+        self.window = window
+        self.samples = {}  # name -> deque of recent ms
+        self.counts = {}  # name -> samples ever recorded
+        self.log_path = None  # a JSONL file to append summaries to, if any
+        self._logged_at = time.monotonic()
+        self._logged_count = 0
+
+    def record(self, name, ms):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+        samples.append(ms)
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def summary(self):
+        """{name: {"count", "p50", "p95", "p99", "max"}} over the recent samples."""
+        result = {}
+        for name, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            result[name] = {"count": self.counts[name], "max": round(ordered[-1], 3)}
+            for p in (50, 95, 99):
+                rank = max(-(-p * len(ordered) // 100) - 1, 0)  # nearest rank
+                result[name][f"p{p}"] = round(ordered[rank], 3)
+        return result
+
+    def maybe_log(self):
+        """Append a summary to the log every TELEMETRY_LOG_SECONDS, if there's news."""
+        if self.log_path is None or time.monotonic() - self._logged_at < TELEMETRY_LOG_SECONDS:
+            return
+        self._logged_at = time.monotonic()
+        total = sum(self.counts.values())
+        if total != self._logged_count:
+            self._logged_count = total
+            self.write_log()
+
+    def write_log(self):
+        import json
+        line = json.dumps({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "summary": self.summary(),
+        })
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > TELEMETRY_LOG_LIMIT:
+                os.replace(self.log_path, self.log_path + ".1")  # keep one old file
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError:
+            pass
+
+
+# ---------------- OUTPUT PANE ----------------
+
+# Once the plain output pane holds this many lines it switches to the spooled view
+SPOOL_THRESHOLD_LINES = 20000
+SPOOL_MARGIN_LINES = 100  # extra lines rendered above and below the visible ones
+
+
+class SpoolFile:
+    """Append-only transcript kept in a temp file, read back through mmap by line number."""
+
+    def __init__(self):
+        import tempfile
+        self._file = tempfile.TemporaryFile()
+        self._size = 0
+        self._starts = array("Q", [0])  # byte offset where each line starts
+        self._map = None
+
+    @property
+    def line_count(self):
+        return len(self._starts)
+
+    def append(self, text):
+        data = text.encode("utf-8")
+        self._file.seek(self._size)
+        self._file.write(data)
+        pos = data.find(b"\n")
+        while pos != -1:
+            self._starts.append(self._size + pos + 1)
+            pos = data.find(b"\n", pos + 1)
+        self._size += len(data)
+
+    def get_lines(self, start, stop):
+        """Text of lines [start, stop), without a trailing newline."""
+        start = max(0, start)
+        stop = min(stop, self.line_count)
+        if start >= stop or self._size == 0:
+            return ""
+        begin = self._starts[start]
+        end = self._starts[stop] - 1 if stop < self.line_count else self._size
+        if self._map is None or len(self._map) < end:
+            self._remap()
+        return self._map[begin:end].decode("utf-8", errors="replace")
+
+    def _remap(self):
+        self._file.flush()
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class OutputPane:
+    """
+    The output Text widget plus its scrollbar. Small transcripts live in the
+    widget as usual; big ones are spooled to disk and only the visible lines
+    (plus a margin) are rendered, so a runaway print loop can't bloat memory.
+    """
+
+    def __init__(self, text, scrollbar):
+        self.text = text
+        self.scrollbar = scrollbar
+        self.always_spool = False
+        self.spool = None  # SpoolFile while in spooled mode
+        self._top = 0  # first visible line of the transcript
+        self._window = (0, 0)  # transcript lines currently in the widget
+        self._follow = True  # keep showing the end as output arrives
+        self._line_height = tkfont.Font(font=text["font"]).metrics("linespace")
+
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.text.bind(sequence, self._on_wheel, add="+")
+        self.text.bind("<Configure>", lambda e: self._render(), add="+")
+
+    # -- writing --
+
+    def write(self, text):
+        if self.spool is None:
+            self.text.insert(tk.END, text)
+            self.text.see(tk.END)
+            lines = int(self.text.index("end-1c").split(".")[0])
+            if self.always_spool or lines > SPOOL_THRESHOLD_LINES:
+                self._start_spooling()
+            return
+
+        self.spool.append(text)
+        if self._follow:
+            self._top = max(0, self.spool.line_count - self._visible_lines())
+        self._render()
+
+    def clear(self):
+        if self.spool is not None:
+            self._stop_spooling()
+        self.text.delete("1.0", tk.END)
+        if self.always_spool:
+            self._start_spooling()
+
+    def close(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+    # -- spooled mode --
+
+    def _start_spooling(self):
+        """Move what the widget holds into a spool file and switch to the virtual view."""
+        existing = self.text.get("1.0", "end-1c")
+        self.spool = SpoolFile()
+        self.spool.append(existing)
+        self.scrollbar.configure(command=self._on_scrollbar)
+        self.text.configure(yscrollcommand="", state="disabled")
+        self._window = (0, 0)
+        self._follow = True
+        self._top = max(0, self.spool.line_count - self._visible_lines())
+        self._render()
+
+    def _stop_spooling(self):
+        self.spool.close()
+        self.spool = None
+        self.text.configure(state="normal", yscrollcommand=self.scrollbar.set)
+        self.scrollbar.configure(command=self.text.yview)
+
+    def _visible_lines(self):
+        return max(1, self.text.winfo_height() // max(1, self._line_height))
+
+    def _render(self):
+        if self.spool is None:
+            return
+        visible = self._visible_lines()
+        total = self.spool.line_count
+        self._top = max(0, min(self._top, total - visible))
+
+        start, stop = self._window
+        if self._top < start or self._top + visible > stop or self._follow:
+            # Page a new window in from the spool file
+            start = max(0, self._top - SPOOL_MARGIN_LINES)
+            stop = min(total, self._top + visible + SPOOL_MARGIN_LINES)
+            self.text.configure(state="normal")
+            self.text.delete("1.0", tk.END)
+            self.text.insert("1.0", self.spool.get_lines(start, stop))
+            self.text.configure(state="disabled")
+            self._window = (start, stop)
+
+        self.text.yview(f"{self._top - start + 1}.0")
+        self.scrollbar.set(self._top / total, min(1.0, (self._top + visible) / total))
+
+    def _scroll_to(self, top):
+        visible = self._visible_lines()
+        total = self.spool.line_count
+        self._top = max(0, min(int(top), total - visible))
+        self._follow = self._top >= total - visible
+        self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(amount) * self.spool.line_count)
+        elif unit == "pages":
+            self._scroll_to(self._top + int(amount) * self._visible_lines())
+        else:
+            self._scroll_to(self._top + int(amount))
+
+    def _on_wheel(self, event):
+        if self.spool is None:
+            return None  # normal Text scrolling
+        if event.num == 4:
+            step = -3
+        elif event.num == 5:
+            step = 3
+        elif sys.platform == "darwin":
+            step = -event.delta
+        else:
+            step = -3 * (event.delta // 120)
+        self._scroll_to(self._top + step)
+        return "break"
+
+
+# ---------------- STEP SCRUBBER ----------------
+
+class StepScrubber:
+    """
+    A window for moving back and forth through a traced run: the slider (or
+    the arrow keys) picks a step, the line is highlighted in the editor and
+    the variables at that moment are listed.
+    """
+
+    def __init__(self, app, trace):
+        self.app = app
+        self.trace = trace
+        self.code_text = app.code_text
+        self.code_lines = self.code_text.get("1.0", "end-1c").splitlines()
+        self.step = 0
+        self._show_scheduled = False
+
+        self.top = tk.Toplevel(app.root)
+        self.top.title("Step Through")
+        self.top.geometry("460x360")
+        self.top.protocol("WM_DELETE_WINDOW", self.close)
+
+        controls = ttk.Frame(self.top, padding=(8, 8, 8, 0))
+        controls.pack(fill=tk.X)
+        ttk.Button(controls, text="◀", width=3, command=lambda: self.move(-1)).pack(side=tk.LEFT)
+        self.slider = ttk.Scale(
+            controls, from_=0, to=max(len(trace) - 1, 0), command=self._on_slide
+        )
+        self.slider.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=6)
+        ttk.Button(controls, text="▶", width=3, command=lambda: self.move(1)).pack(side=tk.LEFT)
+
+        self.step_label = ttk.Label(self.top, anchor="w", padding=(8, 4))
+        self.step_label.pack(fill=tk.X)
+
+        table_frame = ttk.Frame(self.top, padding=(8, 0, 8, 8))
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.table = ttk.Treeview(table_frame, columns=("value",), selectmode="none")
+        self.table.heading("#0", text="Variable")
+        self.table.heading("value", text="Value")
+        self.table.column("#0", width=120, stretch=False)
+        table_scroll = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.table.yview)
+        self.table.configure(yscrollcommand=table_scroll.set)
+        self.table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        table_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.code_text.tag_configure("current_step", background="#fff59d")
+        self.code_text.tag_raise("sel")
+        for key, delta in (("<Left>", -1), ("<Right>", 1), ("<Prior>", -100), ("<Next>", 100)):
+            self.top.bind(key, lambda event, d=delta: self.move(d))
+        self.top.bind("<Home>", lambda event: self.go_to(0))
+        self.top.bind("<End>", lambda event: self.go_to(len(self.trace) - 1))
+        self.top.focus_set()
+        self.go_to(0)
+
+    def move(self, delta):
+        self.go_to(self.step + delta)
+
+    def go_to(self, step):
+        step = max(0, min(step, len(self.trace) - 1))
+        self.slider.set(step)
+        self._on_slide(step)
+
+    def _on_slide(self, value):
+        self.step = int(float(value))
+        # Dragging fires many events; only the latest one gets drawn
+        if not self._show_scheduled:
+            self._show_scheduled = True
+            self.top.after_idle(self._show)
+
+    def _show(self):
+        self._show_scheduled = False
+        step = self.step
+        lineno = self.trace.lines[step]
+        self.code_text.tag_remove("current_step", "1.0", tk.END)
+        if lineno:
+            self.code_text.tag_add("current_step", f"{lineno}.0", f"{lineno}.0 lineend+1c")
+            self.code_text.see(f"{lineno}.0")
+            where = f"line {lineno}: {_line_text(self.code_lines, lineno).strip()}"
+        else:
+            where = "the program has finished"
+        note = "  (trace stopped early)" if self.trace.truncated and step == len(self.trace) - 1 else ""
+        self.step_label.configure(text=f"Step {step + 1:,} of {len(self.trace):,} – {where}{note}")
+
+        self.table.delete(*self.table.get_children())
+        for name, rep in self.trace.locals_at(step):
+            self.table.insert("", tk.END, text=name, values=(rep,))
+
+    def close(self):
+        self.code_text.tag_remove("current_step", "1.0", tk.END)
+        self.top.destroy()
+        if self.app.scrubber is self:
+            self.app.scrubber = None
+
+
+# ---------------- DIAGNOSTICS WINDOW ----------------
+
+class DiagnosticsWindow:
+    """Live table of the app's timings: how long each phase of a run takes, and event-loop lag."""
+
+    COLUMNS = ("count", "p50", "p95", "p99", "max")
+
+    def __init__(self, app):
+        self.app = app
+        self.top = tk.Toplevel(app.root)
+        self.top.title("Diagnostics")
+        self.top.geometry("520x360")
+        self.top.protocol("WM_DELETE_WINDOW", self.close)
+
+        table_frame = ttk.Frame(self.top, padding=(8, 8, 8, 0))
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.table = ttk.Treeview(table_frame, columns=self.COLUMNS, selectmode="none")
+        self.table.heading("#0", text="Timing (ms)")
+        self.table.column("#0", width=160, stretch=False)
+        for column in self.COLUMNS:
+            self.table.heading(column, text=column)
+            self.table.column(column, width=60, anchor="e")
+        self.table.pack(fill=tk.BOTH, expand=True)
+
+        buttons = ttk.Frame(self.top, padding=8)
+        buttons.pack(fill=tk.X)
+        ttk.Checkbutton(
+            buttons,
+            text=f"Log every {TELEMETRY_LOG_SECONDS}s to {TELEMETRY_LOG}",
+            variable=app.telemetry_log_var,
+            command=app._toggle_telemetry_log,
+        ).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Close", command=self.close).pack(side=tk.RIGHT)
+
+        self._refresh()
+
+    def _refresh(self):
+        self.table.delete(*self.table.get_children())
+        for name, stats in self.app.telemetry.summary().items():
+            self.table.insert("", tk.END, text=name, values=[stats[c] for c in self.COLUMNS])
+        self._after = self.top.after(1000, self._refresh)
+
+    def close(self):
+        self.top.after_cancel(self._after)
+        self.top.destroy()
+        if self.app.diagnostics is self:
+            self.app.diagnostics = None
+
+
+# ---------------- VARIABLES PANEL ----------------
+
+class WatchPanel:
+    """
+    Side panel listing the kernel's variables. After a run the kernel sends
+    only the names that were added, changed or removed, and only those rows
+    are redrawn. Opening a container loads what it holds WATCH_PAGE items
+    at a time.
+
+    Row ids spell out where a row's value lives: "var NAME" for a variable,
+    "var NAME/3/0" for the first child of its fourth child.
+    """
+
+    def __init__(self, app, parent, before):
+        self.app = app
+        self._loading = set()  # rows waiting for a page of children
+        self.frame = ttk.Frame(parent, padding=(0, 10, 10, 10))
+        self.frame.pack(side=tk.RIGHT, fill=tk.Y, before=before)
+        ttk.Label(self.frame, text="Variables:").pack(anchor="w")
+
+        table_frame = ttk.Frame(self.frame)
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.table = ttk.Treeview(table_frame, columns=("type", "value"), selectmode="browse")
+        self.table.heading("#0", text="Name")
+        self.table.heading("type", text="Type")
+        self.table.heading("value", text="Value")
+        self.table.column("#0", width=100)
+        self.table.column("type", width=60, stretch=False)
+        self.table.column("value", width=140)
+        table_scroll = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.table.yview)
+        self.table.configure(yscrollcommand=table_scroll.set)
+        self.table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        table_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.table.bind("<<TreeviewOpen>>", self._on_open)
+
+        self.full_refresh()
+
+    def refresh(self):
+        """Ask the kernel what changed (after any runs already queued)."""
+        self._submit("watch")
+
+    def full_refresh(self):
+        """Start over, for a kernel that doesn't know what the panel shows."""
+        self.table.delete(*self.table.get_children())
+        self._loading.clear()
+        self._submit("watch", full=True)
+
+    def _submit(self, op, **fields):
+        job_id = self.app.kernel.submit(op, **fields)
+        self.app._jobs[job_id] = {"kind": op}
+        self.app._schedule_pump()
+
+    def kernel_replied(self, job, msg):
+        if job["kind"] == "watch":
+            self._apply(msg["changes"])
+        else:
+            self._add_page(msg)
+
+    def _apply(self, changes):
+        for name, type_name, rep, openable in changes:
+            row = "var " + name
+            if type_name is None:
+                if self.table.exists(row):
+                    self.table.delete(row)
+                continue
+            if self.table.exists(row):
+                # Whatever was loaded below it may be out of date now
+                self.table.item(row, values=(type_name, rep))
+                self.table.delete(*self.table.get_children(row))
+                self._loading = {r for r in self._loading if r != row and not r.startswith(row + "/")}
+            else:
+                self.table.insert("", tk.END, iid=row, text=name, values=(type_name, rep))
+            if openable:
+                self.table.insert(row, tk.END, iid=row + "/...", text="loading...")
+                if self.table.item(row, "open"):
+                    self._load(row, 0)
+
+    def _on_open(self, event):
+        row = self.table.focus()
+        if row.endswith("/more"):
+            parent = self.table.parent(row)
+            self.table.delete(row)
+            self._load(parent, len(self.table.get_children(parent)))
+        elif self.table.exists(row + "/..."):
+            self._load(row, 0)
+
+    def _load(self, row, start):
+        if row in self._loading:
+            return
+        self._loading.add(row)
+        name, *positions = row[len("var "):].split("/")
+        self._submit("watch_items", path=[name, *map(int, positions)], start=start)
+
+    def _add_page(self, msg):
+        name, *positions = msg["path"]
+        row = "/".join(["var " + name, *map(str, positions)])
+        self._loading.discard(row)
+        if not self.table.exists(row):
+            return  # gone while we waited
+        if self.table.exists(row + "/..."):
+            self.table.delete(row + "/...")
+        for offset, (label, type_name, rep, openable) in enumerate(msg["items"]):
+            child = f"{row}/{msg['start'] + offset}"
+            if self.table.exists(child):
+                continue
+            self.table.insert(row, tk.END, iid=child, text=label, values=(type_name, rep))
+            if openable:
+                self.table.insert(child, tk.END, iid=child + "/...", text="loading...")
+        more = row + "/more"
+        if msg["more"] and not self.table.exists(more):
+            self.table.insert(
+                row, tk.END, iid=more, text="more...", values=("", f"open for the next {WATCH_PAGE}")
+            )
+            self.table.insert(more, tk.END, text="")  # makes it openable
+
+
+# ---------------- ENVIRONMENT INSPECTOR ----------------
+
+def _usage_report(msg):
+    """What a run used, for the status bar: CPU and wall time, peak memory, output."""
+    usage = msg.get("usage", {})
+    report = f"{msg.get('cpu', 0.0):.2f} s CPU, {msg.get('wall', 0.0):.2f} s in all"
+    if usage.get("peak_rss"):
+        report += f", peak memory {_format_size(usage['peak_rss'])}"
+    return report + f", {usage.get('output', 0):,} characters printed"
+
+
+def _memory_report(memory):
+    """The line written after a run with Measure Memory Use on."""
+    report = f"[Memory: peak {_format_size(memory['peak'])}, still held {_format_size(memory['kept'])}"
+    if memory.get("resident"):
+        report += f", the kernel now uses {_format_size(memory['resident'])}"
+    return report + "]\n"
+
+
+class EnvironmentInspector:
+    """
+    The kernel's variables with their sizes. The full ("deep") size of a
+    variable is only measured when its row is opened, since walking a big
+    list can take a while; the kernel keeps the answer until the value changes.
+    """
+
+    COLUMNS = ("type", "size", "deep")
+
+    def __init__(self, app):
+        self.app = app
+        self.top = tk.Toplevel(app.root)
+        self.top.title("Variables")
+        self.top.geometry("560x380")
+        self.top.protocol("WM_DELETE_WINDOW", self.close)
+
+        table_frame = ttk.Frame(self.top, padding=(8, 8, 8, 0))
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.table = ttk.Treeview(table_frame, columns=self.COLUMNS, selectmode="browse")
+        self.table.heading("#0", text="Variable")
+        self.table.heading("type", text="Type")
+        self.table.heading("size", text="Own size")
+        self.table.heading("deep", text="With contents")
+        self.table.column("#0", width=180)
+        self.table.column("type", width=100, stretch=False)
+        self.table.column("size", width=90, anchor="e", stretch=False)
+        self.table.column("deep", width=110, anchor="e", stretch=False)
+        table_scroll = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.table.yview)
+        self.table.configure(yscrollcommand=table_scroll.set)
+        self.table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        table_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.table.bind("<<TreeviewOpen>>", self._on_open)
+
+        buttons = ttk.Frame(self.top, padding=8)
+        buttons.pack(fill=tk.X)
+        self.memory_label = ttk.Label(buttons)
+        self.memory_label.pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Close", command=self.close).pack(side=tk.RIGHT)
+        ttk.Button(buttons, text="Refresh", command=self.refresh).pack(side=tk.RIGHT, padx=6)
+
+        self.refresh()
+
+    def refresh(self):
+        """Ask the kernel for its variables (after any runs already queued)."""
+        job_id = self.app.kernel.submit("env_list")
+        self.app._jobs[job_id] = {"kind": "env_list"}
+        self.app._schedule_pump()
+
+    def kernel_replied(self, job, msg):
+        if job["kind"] == "env_list":
+            self._show_list(msg)
+        else:
+            self._show_sizes(msg["sizes"])
+
+    def _show_list(self, msg):
+        opened = [row for row in self.table.get_children() if self.table.item(row, "open")]
+        self.table.delete(*self.table.get_children())
+        for name, type_name, size in sorted(msg["entries"]):
+            row = self._row(name)
+            self.table.insert("", tk.END, iid=row, text=name, values=(type_name, _format_size(size), ""))
+            self.table.insert(row, tk.END, text="measuring...")  # makes the row openable
+        if msg.get("resident"):
+            self.memory_label.configure(text=f"The kernel uses {_format_size(msg['resident'])}")
+        # Rows that were open stay open, with fresh sizes
+        opened = [row for row in opened if self.table.exists(row)]
+        for row in opened:
+            self.table.item(row, open=True)
+        if opened:
+            self._measure([self.table.item(row, "text") for row in opened])
+
+    @staticmethod
+    def _row(name):
+        return "var " + name  # can't clash with Tk's own ids for the part rows
+
+    def _on_open(self, event):
+        row = self.table.focus()
+        if row and self.table.parent(row) == "":
+            self._measure([self.table.item(row, "text")])
+
+    def _measure(self, names):
+        job_id = self.app.kernel.submit("env_sizes", names=names)
+        self.app._jobs[job_id] = {"kind": "env_sizes"}
+        self.app._schedule_pump()
+
+    def _show_sizes(self, sizes):
+        for name, result in sizes.items():
+            row = self._row(name)
+            if not self.table.exists(row):
+                continue  # gone since we asked
+            self.table.delete(*self.table.get_children(row))
+            if result is None:
+                self.table.set(row, "deep", "?")
+                self.table.insert(row, tk.END, text="(couldn't be measured)")
+                continue
+            total, parts, complete = result
+            self.table.set(row, "deep", _format_size(total) if complete else f"≥ {_format_size(total)}")
+            for label, size in parts:
+                self.table.insert(row, tk.END, text=label, values=("", "", _format_size(size)))
+            if not parts:
+                self.table.insert(row, tk.END, text="(nothing inside)")
+
+    def close(self):
+        self.top.destroy()
+        if self.app.inspector is self:
+            self.app.inspector = None
+
+
+# ---------------- EXAMPLES ----------------
+
+# The predefined educational examples offered in the Examples menu
+EXAMPLES = {
+    "loop_sum": (
+        "count = 0\n"
+        "for i in range(1, 5):\n"
+        "    count += i\n"
+        "print(\"Final count is\", count)\n"
+    ),
+    "string_ops": (
+        "text = \"Hello, world!\"\n"
+        "print(text)\n"
+        "print(text.upper())\n"
+        "print(text.lower())\n"
+        "print(text.replace(\"world\", \"Python\"))\n"
+        "print(\"Length of text:\", len(text))\n"
+    ),
+    "list_average": (
+        "numbers = [10, 20, 30, 40]\n"
+        "total = 0\n"
+        "for n in numbers:\n"
+        "    total += n\n"
+        "\n"
+        "average = total / len(numbers)\n"
+        "print(\"Numbers:\", numbers)\n"
+        "print(\"Total:\", total)\n"
+        "print(\"Average:\", average)\n"
+    ),
+    "function_greet": (
+        "def greet(name):\n"
+        "    message = f\"Hello, {name}!\"\n"
+        "    print(message)\n"
+        "    return message\n"
+        "\n"
+        "greet(\"Alice\")\n"
+        "greet(\"Bob\")\n"
+    ),
+    "grade_checker": (
+        "score = 73\n"
+        "\n"
+        "if score >= 80:\n"
+        "    grade = \"A\"\n"
+        "elif score >= 70:\n"
+        "    grade = \"B\"\n"
+        "elif score >= 60:\n"
+        "    grade = \"C\"\n"
+        "else:\n"
+        "    grade = \"D\"\n"
+        "\n"
+        "print(\"Score:\", score)\n"
+        "print(\"Grade:\", grade)\n"
+    ),
+    "dict_lookup": (
+        "words = {\n"
+        "    \"python\": \"a programming language\",\n"
+        "    \"loop\": \"a way to repeat code\",\n"
+        "    \"variable\": \"a named place to store a value\",\n"
+        "}\n"
+        "\n"
+        "key = \"loop\"\n"
+        "meaning = words.get(key, \"(not found)\")\n"
+        "print(f\"Word: {key}\")\n"
+        "print(f\"Meaning: {meaning}\")\n"
+    ),
+    "while_countdown": (
+        "n = 5\n"
+        "while n > 0:\n"
+        "    print(\"Counting down:\", n)\n"
+        "    n -= 1\n"
+        "print(\"Lift off!\")\n"
+    ),
+    "list_comprehension": (
+        "numbers = [1, 2, 3, 4, 5]\n"
+        "squares = [n * n for n in numbers]\n"
+        "print(\"Numbers:\", numbers)\n"
+        "print(\"Squares:\", squares)\n"
+    ),
+    "tuple_unpack": (
+        "point = (4, 7)\n"
+        "x, y = point\n"
+        "print(\"Point:\", point)\n"
+        "print(\"x coordinate:\", x)\n"
+        "print(\"y coordinate:\", y)\n"
+    ),
+    "try_except": (
+        "text = \"12\"  # try changing this to \"abc\" and run again\n"
+        "\n"
+        "try:\n"
+        "    number = int(text)\n"
+        "    result = 100 / number\n"
+        "    print(\"Text as int:\", number)\n"
+        "    print(\"100 divided by\", number, \"is\", result)\n"
+        "except ValueError:\n"
+        "    print(\"Cannot convert text to an integer.\")\n"
+        "except ZeroDivisionError:\n"
+        "    print(\"Cannot divide by zero.\")\n"
+    ),
+}
+
+
+# Safety cap on traced steps, so an endless loop can't explain forever
+EXPLAIN_MAX_STEPS = 1000
+
+# Stop / time limit: seconds a run may take (0 = no limit), and how long
+# stopped code gets to give up before its kernel is replaced
+TIME_LIMIT_CHOICES = (0, 5, 10, 30, 60, 300)
+DEFAULT_TIME_LIMIT = 30
+# Memory Limit choices in the Run menu, in MB of extra memory per run (0 = no limit)
+MEMORY_LIMIT_CHOICES = (0, 256, 1024, 4096)
+DEFAULT_MEMORY_LIMIT = RUN_BUDGETS["memory"] // (1024 * 1024)
+STOP_GRACE_MS = 3000
+
+# Profile heatmap backgrounds, coolest to hottest
+HEATMAP_COLOURS = (
+    "#fff7f0", "#ffeede", "#ffe2c8", "#ffd4b0", "#ffc398",
+    "#ffae80", "#ff9868", "#ff8050", "#ff6640", "#ff4a30",
+)
+
+# Output pane refresh: batched inserts at a capped frame rate
+OUTPUT_FRAME_MS = 33  # ~30 flushes per second
+OUTPUT_CHARS_PER_FRAME = 256 * 1024
+OUTPUT_MESSAGES_PER_FRAME = 64
+OUTPUT_BACKLOG_LIMIT = 1024 * 1024
+
+# The rest of startup runs after the first paint, or after this long if the
+# window never reports one (e.g. it starts minimised)
+STARTUP_FALLBACK_MS = 1000
+
+
+class MiniNotebookApp:
+    def __init__(self, root, startup=None):
+        self.root = root
+        self.root.title("Code Tutor")
+        self.startup = startup  # a StartupProfile for --startup-profile
+
+        # Variables/functions live inside a kernel process between runs (like a
+        # notebook); the pool keeps a spare one warm for instant resets. They
+        # are started after the first paint (see _finish_startup).
+        self.kernel_pool = None
+        self._kernel = None
+        self.checkpoints = []  # parked copies of the environment, oldest first
+        self.scrubber = None  # the open StepScrubber window, if any
+        self.diagnostics = None  # the open DiagnosticsWindow, if any
+        self.inspector = None  # the open EnvironmentInspector, if any
+        self.watch_panel = None  # the Variables side panel, once built
+        self.telemetry = Telemetry()
+        self._probe_due = None
+        self._jobs = {}  # kernel job id -> what to do with its replies
+        self.compile_cache = CompileCache()
+
+        # Output is queued and flushed in batches by _pump
+        self._output_queue = deque()
+        self._output_backlog = 0  # characters waiting in the queue
+        self._pump_scheduled = False
+
+        # Settings shown in the menus, which are built after the first paint
+        self.time_limit_var = tk.IntVar(value=DEFAULT_TIME_LIMIT)
+        self.incremental_var = tk.BooleanVar(value=False)
+        self.auto_checkpoint_var = tk.BooleanVar(value=False)  # each one forks the kernel
+        self.always_spool_var = tk.BooleanVar(value=False)
+        self.save_variables_var = tk.BooleanVar(value=os.path.exists(AUTOSAVE_VARIABLES))
+        self.telemetry_log_var = tk.BooleanVar(value=False)
+        self.measure_memory_var = tk.BooleanVar(value=False)
+        self.watch_panel_var = tk.BooleanVar(value=True)
+        self.memory_limit_var = tk.IntVar(value=DEFAULT_MEMORY_LIMIT)
+        self.budgets_var = tk.BooleanVar(value=True)  # the rest of RUN_BUDGETS
+        self.restore_menu = None
+        self.highlighter = None
+        self.journal = None  # autosaves the code; started with the kernels
+        self._autosave_scheduled = False
+        self.checker = None  # LiveChecker, started with the kernels
+        self.env_names = set()  # names the kernel has defined, so they aren't flagged
+        self._check_after = None
+        self._check_version = 0
+        self._check_polling = False
+
+        # Only the editor is built up front; everything else waits until the
+        # window has been drawn once, so it appears quickly on slow machines.
+        self._build_ui()
+        self._bind_shortcuts()
+        self._mark_startup("editor widgets")
+        self._started = False
+        self.code_text.bind("<Expose>", self._on_first_paint)
+        self.root.after(STARTUP_FALLBACK_MS, self._finish_startup)  # in case nothing is drawn
+
+        # Handle window close (no save prompt)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    @property
+    def kernel(self):
+        if self._kernel is None:
+            self._start_kernels()  # asked for before _finish_startup got to it
+        return self._kernel
+
+    @kernel.setter
+    def kernel(self, kernel):
+        self._kernel = kernel
+
+    def _start_kernels(self):
+        self.kernel_pool = KernelPool(size=1)
+        self._kernel = self.kernel_pool.acquire()
+
+    # ---------------- STARTUP ----------------
+
+    def _mark_startup(self, phase):
+        if self.startup is not None:
+            self.startup.mark(phase)
+
+    def _on_first_paint(self, event):
+        self.code_text.unbind("<Expose>")
+        self._mark_startup("first paint")
+        self.telemetry.record("startup.first_paint", (time.perf_counter() - _IMPORTS_STARTED) * 1000)
+        # Redrawing runs as idle callbacks, so this one comes after it
+        self.root.after_idle(self._finish_startup)
+
+    def _finish_startup(self):
+        """The work that isn't needed to show the editor: highlighter, menus, kernels."""
+        if self._started:
+            return
+        self._started = True
+
+        # Attach the syntax highlighter; it repaints whatever scrolls into view
+        self.highlighter = ViewportHighlighter(self.code_text)
+        Percolator(self.code_text).insertfilter(self.highlighter)
+        self.code_text.configure(yscrollcommand=self._on_code_scroll)
+        self._mark_startup("highlighter")
+
+        self._create_menu()
+        self._mark_startup("menus")
+
+        if self._kernel is None:
+            self._start_kernels()
+        self._mark_startup("kernels started")
+
+        self._toggle_watch_panel()
+
+        self.journal = JournalWriter(AUTOSAVE_JOURNAL)
+        self.checker = LiveChecker(self.compile_cache)
+        self.code_text.bind("<<Modified>>", self._on_code_modified)
+        self._schedule_check()
+        if self.code_text.edit_modified():
+            self._on_code_modified()  # typed into before we were listening
+        if self.save_variables_var.get():
+            self._load_variables()
+        self._mark_startup("autosave")
+
+        # Explaining an example should be instant: cache the ones that
+        # aren't yet. Usually none are missing, and a run straight after
+        # starting up doesn't queue behind the warming.
+        cache = ExplanationCache()
+        missing = [
+            source for source in EXAMPLES.values()
+            if _repeatable(self.compile_cache.compile(source)) and not (
+                cache.has(cache.key("explain", source, EXPLAIN_MAX_STEPS))
+                and cache.has(cache.key("trace", source, TRACE_MAX_STEPS))
+            )
+        ]
+        if missing:
+            job_id = self.kernel.submit(
+                "warm_explanations",
+                sources=missing,
+                explain_steps=EXPLAIN_MAX_STEPS,
+                trace_steps=TRACE_MAX_STEPS,
+            )
+            self._jobs[job_id] = {"kind": "warm"}
+        self._schedule_pump()
+        self._probe_lag()
+
+        if self.startup is not None:
+            print(self.startup.report())
+            self.on_close()  # --startup-profile only measures
+
+    # ---------------- UI BUILDING ----------------
+
+    def _build_ui(self):
+        self.root.geometry("760x540")
+
+        main_frame = ttk.Frame(self.root, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        self.main_frame = main_frame  # the Variables panel goes beside it
+
+        # Code label
+        code_label = ttk.Label(main_frame, text="Python code:")
+        code_label.pack(anchor="w")
+
+        # Code text area + scrollbar
+        code_frame = ttk.Frame(main_frame)
+        code_frame.pack(fill=tk.BOTH, expand=True)
+
+        # Main code Text widget
+        self.code_text = tk.Text(
+            code_frame,
+            height=15,
+            wrap="none",
+            font=("Consolas", 11),
+            undo=True,
+        )
+        self.code_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # Vertical scrollbar for code
+        self.code_scroll = ttk.Scrollbar(
+            code_frame, orient="vertical", command=self.code_text.yview
+        )
+        self.code_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.code_text.configure(yscrollcommand=self.code_scroll.set)
+
+        # Heatmap tags used by Profile, from barely warm to hottest
+        for level, colour in enumerate(HEATMAP_COLOURS):
+            self.code_text.tag_configure(f"heat{level}", background=colour)
+        self.code_text.tag_raise("sel")
+
+        # Marks from the live checker: syntax errors, and names never defined
+        self.code_text.tag_configure("check_error", underline=True, background="#ffd0d0")
+        self.code_text.tag_configure("check_undefined", underline=True, foreground="#c00000")
+
+        # Track cursor movement for status bar; any edit (see
+        # _on_code_modified) also re-checks the code in the background
+        self.code_text.bind("<KeyRelease>", self.update_status)
+        self.code_text.bind("<ButtonRelease-1>", self.update_status)
+
+        # Tab inserts 4 spaces
+        self.code_text.bind("<Tab>", self.insert_tab_spaces)
+
+        # Buttons
+        btn_frame = ttk.Frame(main_frame)
+        btn_frame.pack(fill=tk.X, pady=(8, 4))
+
+        run_button = ttk.Button(btn_frame, text="Run (Ctrl+Enter)", command=self.run_code)
+        run_button.pack(side=tk.LEFT)
+
+        clear_out_button = ttk.Button(btn_frame, text="Clear Output", command=self.clear_output)
+        clear_out_button.pack(side=tk.LEFT, padx=(8, 0))
+
+        clear_code_button = ttk.Button(btn_frame, text="Clear Code", command=self.clear_code)
+        clear_code_button.pack(side=tk.LEFT, padx=(8, 0))
+
+        reset_env_button = ttk.Button(btn_frame, text="Reset Env", command=self.reset_environment)
+        reset_env_button.pack(side=tk.LEFT, padx=(8, 0))
+
+        # Explain Step-by-Step button (now always Kid-style)
+        explain_button = ttk.Button(
+            btn_frame,
+            text="Explain Step-by-Step",
+            command=self.explain_step_by_step
+        )
+        explain_button.pack(side=tk.LEFT, padx=(8, 0))
+
+        # Stop button: interrupts running code (variables are kept)
+        stop_button = ttk.Button(btn_frame, text="Stop", command=self.stop)
+        stop_button.pack(side=tk.LEFT, padx=(8, 0))
+
+        # Step Through button: scrub back and forth through a traced run
+        step_button = ttk.Button(btn_frame, text="Step Through", command=self.step_through)
+        step_button.pack(side=tk.LEFT, padx=(8, 0))
+
+        # Profile button: per-line hits/time shown as a heatmap on the code
+        profile_button = ttk.Button(btn_frame, text="Profile", command=self.profile_code)
+        profile_button.pack(side=tk.LEFT, padx=(8, 0))
+
+        # Output label
+        out_label = ttk.Label(main_frame, text="Output:")
+        out_label.pack(anchor="w", pady=(8, 0))
+
+        # Output text area + scrollbar
+        out_frame = ttk.Frame(main_frame)
+        out_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.output_text = tk.Text(
+            out_frame,
+            height=10,
+            wrap="none",
+            font=("Consolas", 11),
+            state="normal",
+            bg="white",
+            fg="black",
+            insertbackground="black",
+        )
+        self.output_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        out_scroll = ttk.Scrollbar(
+            out_frame, orient="vertical", command=self.output_text.yview
+        )
+        out_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.output_text.configure(yscrollcommand=out_scroll.set)
+        self.output = OutputPane(self.output_text, out_scroll)
+
+        # Answer bar for input() in the running code; shown only while it waits
+        self.input_bar = ttk.Frame(main_frame)
+        ttk.Label(self.input_bar, text="Your answer:").pack(side=tk.LEFT)
+        self.input_entry = ttk.Entry(self.input_bar, font=("Consolas", 11))
+        self.input_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(6, 0))
+        send_button = ttk.Button(self.input_bar, text="Send", command=self._send_input)
+        send_button.pack(side=tk.LEFT, padx=(6, 0))
+        self.input_entry.bind("<Return>", self._send_input)
+        self.input_entry.bind("<Control-d>", lambda event: self._send_input(eof=True))
+        self._input_anchor = out_frame  # the bar goes just below the output
+        self._input_job = None  # job id whose input() is waiting for an answer
+
+        # Status bar (line/column, last run)
+        self.status_var = tk.StringVar()
+        self.status_var.set("Ln 1, Col 1")
+        status_bar = ttk.Label(main_frame, textvariable=self.status_var, anchor="w")
+        status_bar.pack(fill=tk.X, side=tk.BOTTOM, pady=(5, 0))
+
+        # Starter example in the code box, unless there is code from last time
+        starter = (
+            "count = 0\n"
+            "for i in range(1, 5):\n"
+            "    count += i\n"
+            "print(count)\n"
+        )
+        restored = replay_journal(AUTOSAVE_JOURNAL)
+        self.code_text.insert("1.0", starter if restored is None else restored)
+        self.code_text.edit_reset()  # reset undo/redo stack
+        self.code_text.edit_modified(False)
+        if restored is not None:
+            self.update_status(extra_info="Code restored from last time")
+
+    def _create_menu(self):
+        menubar = tk.Menu(self.root)
+
+        # File menu – your code is autosaved, so there is no Save
+        file_menu = tk.Menu(menubar, tearoff=False)
+        file_menu.add_checkbutton(
+            label="Remember Variables Between Sessions",
+            variable=self.save_variables_var,
+            command=self._toggle_save_variables,
+        )
+        file_menu.add_separator()
+        file_menu.add_command(label="Exit", command=self.on_close)
+        menubar.add_cascade(label="File", menu=file_menu)
+
+        # Run menu
+        run_menu = tk.Menu(menubar, tearoff=False)
+        run_menu.add_command(label="Run", command=self.run_code, accelerator="Ctrl+Enter")
+        run_menu.add_command(
+            label="Run Selection", command=self.run_selection, accelerator="Shift+Enter"
+        )
+        run_menu.add_command(label="Stop", command=self.stop, accelerator="Esc")
+        time_limit_menu = tk.Menu(run_menu, tearoff=False)
+        for seconds in TIME_LIMIT_CHOICES:
+            time_limit_menu.add_radiobutton(
+                label=f"{seconds} seconds" if seconds else "No limit",
+                variable=self.time_limit_var,
+                value=seconds,
+            )
+        run_menu.add_cascade(label="Time Limit", menu=time_limit_menu)
+        memory_limit_menu = tk.Menu(run_menu, tearoff=False)
+        for megabytes in MEMORY_LIMIT_CHOICES:
+            memory_limit_menu.add_radiobutton(
+                label=_format_size(megabytes * 1024 * 1024) if megabytes else "No limit",
+                variable=self.memory_limit_var,
+                value=megabytes,
+            )
+        run_menu.add_cascade(label="Memory Limit", menu=memory_limit_menu)
+        run_menu.add_checkbutton(
+            label="Limit CPU Time, Output and Recursion", variable=self.budgets_var
+        )
+        run_menu.add_command(label="Reset Environment", command=self.reset_environment)
+        run_menu.add_checkbutton(
+            label="Incremental Run (skip unchanged statements)", variable=self.incremental_var
+        )
+        run_menu.add_separator()
+        checkpoint_state = tk.NORMAL if CHECKPOINTS_SUPPORTED else tk.DISABLED
+        run_menu.add_checkbutton(
+            label="Checkpoint After Each Run",
+            variable=self.auto_checkpoint_var,
+            state=checkpoint_state,
+        )
+        run_menu.add_command(
+            label="Checkpoint Now",
+            command=lambda: self.checkpoint_environment("Manual checkpoint"),
+            state=checkpoint_state,
+        )
+        self.restore_menu = tk.Menu(run_menu, tearoff=False)
+        run_menu.add_cascade(label="Restore Checkpoint", menu=self.restore_menu, state=checkpoint_state)
+        self._refresh_restore_menu()
+        run_menu.add_separator()
+        run_menu.add_command(label="Profile", command=self.profile_code)
+        run_menu.add_command(label="Clear Heatmap", command=self.clear_heatmap)
+        run_menu.add_command(label="Compile Cache Stats", command=self.show_compile_cache_stats)
+        run_menu.add_checkbutton(
+            label="Measure Memory Use (slower runs)", variable=self.measure_memory_var
+        )
+        menubar.add_cascade(label="Run", menu=run_menu)
+
+        # View menu
+        view_menu = tk.Menu(menubar, tearoff=False)
+        view_menu.add_checkbutton(
+            label="Spool Output to Disk (huge outputs)",
+            variable=self.always_spool_var,
+            command=self._toggle_spooling,
+        )
+        view_menu.add_checkbutton(
+            label="Variables Panel", variable=self.watch_panel_var, command=self._toggle_watch_panel
+        )
+        view_menu.add_command(label="Inspect Variables...", command=self.show_inspector)
+        view_menu.add_command(label="Diagnostics...", command=self.show_diagnostics)
+        menubar.add_cascade(label="View", menu=view_menu)
+
+        # Examples menu
+        examples_menu = tk.Menu(menubar, tearoff=False)
+        examples_menu.add_command(
+            label="Loop: Sum 1 to 4",
+            command=lambda: self.load_example("loop_sum"),
+        )
+        examples_menu.add_command(
+            label="Strings: basic operations",
+            command=lambda: self.load_example("string_ops"),
+        )
+        examples_menu.add_command(
+            label="Lists: average of numbers",
+            command=lambda: self.load_example("list_average"),
+        )
+        examples_menu.add_command(
+            label="Functions: greeting",
+            command=lambda: self.load_example("function_greet"),
+        )
+        examples_menu.add_command(
+            label="If/elif: grade checker",
+            command=lambda: self.load_example("grade_checker"),
+        )
+        examples_menu.add_separator()
+        examples_menu.add_command(
+            label="Dictionaries: word meanings",
+            command=lambda: self.load_example("dict_lookup"),
+        )
+        examples_menu.add_command(
+            label="While loop: countdown",
+            command=lambda: self.load_example("while_countdown"),
+        )
+        examples_menu.add_command(
+            label="List comprehension: squares",
+            command=lambda: self.load_example("list_comprehension"),
+        )
+        examples_menu.add_command(
+            label="Tuples: unpacking coordinates",
+            command=lambda: self.load_example("tuple_unpack"),
+        )
+        examples_menu.add_command(
+            label="Try/except: safe division",
+            command=lambda: self.load_example("try_except"),
+        )
+        menubar.add_cascade(label="Examples", menu=examples_menu)
+
+        self.root.config(menu=menubar)
+
+    def _bind_shortcuts(self):
+        # Only run-related shortcuts
+        self.root.bind("<Control-Return>", lambda e: self.run_code())
+        self.root.bind("<Shift-Return>", self._run_selection_event)
+        self.root.bind("<Escape>", self.stop)
+
+    # ---------------- EDITOR BEHAVIOUR ----------------
+
+    def _on_code_scroll(self, first, last):
+        self.code_scroll.set(first, last)
+        self.highlighter.schedule_paint()
+
+    def insert_tab_spaces(self, event):
+        """Insert 4 spaces when Tab is pressed."""
+        self.code_text.insert("insert", " " * 4)
+        return "break"   # Stop the default behaviour
+
+    def update_status(self, event=None, extra_info=""):
+        """Update the status bar with current line/column and optional extra info."""
+        try:
+            index = self.code_text.index("insert")
+            line, col = index.split(".")
+            # Column is zero-based internally; show as 1-based
+            text = f"Ln {int(line)}, Col {int(col) + 1}"
+            if extra_info:
+                text += " | " + extra_info
+            self.status_var.set(text)
+        except tk.TclError:
+            pass  # happens if widget not yet fully initialised
+
+    # ---------------- RUNNING CODE ----------------
+
+    def run_code(self):
+        """Run the entire code cell."""
+        code = self.code_text.get("1.0", tk.END)
+        self._submit_run(code, "Run", op="exec_incremental" if self.incremental_var.get() else "exec")
+
+    def _run_selection_event(self, event):
+        self.run_selection()
+        return "break"
+
+    def run_selection(self):
+        """Run only the selected code, or the current line if nothing is selected."""
+        try:
+            code = self.code_text.get("sel.first", "sel.last")
+        except tk.TclError:
+            # No selection: run the current line
+            index = self.code_text.index("insert linestart")
+            end_index = self.code_text.index("insert lineend")
+            code = self.code_text.get(index, end_index) + "\n"
+
+        self._submit_run(code, "Run selection", metric="run_selection")
+
+    def _submit_run(self, code, title, op="exec", metric="run"):
+        """Send code to the kernel; its output streams into the pane as it is printed."""
+        timestamp = time.strftime("%H:%M:%S")
+        self._write_output(f"--- {title} at {timestamp} ---\n")
+        try:
+            compiled = self._compile(code, metric)
+        except (SyntaxError, ValueError) as e:
+            import traceback
+            self._write_output("".join(traceback.format_exception_only(type(e), e)) + "\n")
+            self.update_status(extra_info=f"Last run: {timestamp}")
+            return
+
+        options = {"measure_memory": self.measure_memory_var.get(), "budgets": self._run_budgets()}
+        if op == "exec_incremental":
+            options["source"] = code  # the kernel splits it into statements
+        else:
+            options["code"] = marshal.dumps(compiled)
+        self._start_job({
+            "kind": "run",
+            "metric": metric,
+            "has_output": False,
+            "profile": op == "profile",
+            "label": f"{title} at {timestamp}",
+        }, op, **options)
+        self.update_status(extra_info="Running...")
+        self._schedule_pump()
+
+    def _run_budgets(self):
+        """RUN_BUDGETS as set in the Run menu."""
+        budgets = dict(RUN_BUDGETS) if self.budgets_var.get() else {}
+        budgets["memory"] = self.memory_limit_var.get() * 1024 * 1024 or None
+        return budgets
+
+    def _compile(self, code, metric):
+        """compile_cache.compile, timed as '<metric>.compile'."""
+        started = time.perf_counter()
+        try:
+            return self.compile_cache.compile(code)
+        finally:
+            self.telemetry.record(f"{metric}.compile", (time.perf_counter() - started) * 1000)
+
+    # ---------------- STOP / TIME LIMIT ----------------
+
+    def _start_job(self, job, op, **fields):
+        """
+        Send a job that runs the user's code and track it. The kernel says
+        when it starts on it (see _job_started), which is when its time limit
+        starts too: time spent queued behind other jobs doesn't count.
+        """
+        job["stoppable"] = True
+        job["submitted"] = time.perf_counter()
+        job_id = self.kernel.submit(op, announce_start=True, **fields)
+        self._jobs[job_id] = job
+        return job_id
+
+    def _job_started(self, job_id, job):
+        """The kernel began running a job: start its clock, or stop it if that was asked for already."""
+        job["started"] = time.perf_counter()
+        if job.get("stopping"):
+            self._send_interrupt(job_id, job)
+            return
+        limit = self.time_limit_var.get()
+        if limit:
+            self.root.after(limit * 1000, lambda: self._time_limit_hit(job_id, job, limit))
+
+    def _running_job(self):
+        """(job id, job) of the oldest unfinished run/explain/trace, or (None, None)."""
+        for job_id, job in self._jobs.items():
+            if job.get("stoppable"):
+                return job_id, job
+        return None, None
+
+    def stop(self, event=None):
+        """Interrupt the running code; its variables so far are kept."""
+        job_id, job = self._running_job()
+        if job is None:
+            self.update_status(extra_info="Nothing is running")
+            return
+        self._interrupt(job_id, job, _stop_message())
+
+    def _time_limit_hit(self, job_id, job, limit):
+        if self._jobs.get(job_id) is not job:
+            return
+        # Time spent waiting for an answer to input() doesn't count
+        waited = job.get("input_waited", 0.0)
+        if job.get("input_since") is not None:
+            waited += time.perf_counter() - job["input_since"]
+        left = limit - (time.perf_counter() - job["started"] - waited)
+        if left > 0.01:
+            self.root.after(int(left * 1000) + 1, lambda: self._time_limit_hit(job_id, job, limit))
+            return
+        self._interrupt(job_id, job, _stop_message(limit))
+
+    def _interrupt(self, job_id, job, message):
+        if job.get("stopping"):
+            return
+        job["stopping"] = message
+        if job_id == self._input_job:
+            self._hide_input_bar()
+        self.update_status(extra_info="Stopping...")
+        if "started" in job:
+            self._send_interrupt(job_id, job)
+        # else: it is interrupted as soon as the kernel starts on it
+
+    def _send_interrupt(self, job_id, job):
+        """Interrupt this job, and nothing else the kernel may be running by then."""
+        self.kernel.interrupt(job_id)
+        self.root.after(STOP_GRACE_MS, lambda: self._force_stop(job_id, job))
+
+    def _force_stop(self, job_id, job):
+        """The code ignored the interrupt (e.g. stuck inside a C function): replace the kernel."""
+        if self._jobs.get(job_id) is not job:
+            return
+        self.reset_environment()
+        self._write_output(
+            "\n[The code would not stop, so Python was restarted - your variables were cleared]\n\n"
+        )
+
+    def show_compile_cache_stats(self):
+        messagebox.showinfo("Compile cache", self.compile_cache.stats())
+
+    def reset_environment(self):
+        """Clear the execution environment by swapping in a fresh, pre-started kernel."""
+        old_kernel = self.kernel
+        self.kernel = self.kernel_pool.acquire()
+        self._jobs.clear()  # replies from the old kernel are discarded
+        self._hide_input_bar()
+        old_kernel.shutdown()
+        self.checkpoints = []  # they lived in the old kernel
+        self._refresh_restore_menu()
+        self._forget_saved_variables()
+        self.env_names.clear()
+        if self.checker is not None:
+            self._schedule_check()
+        if self.watch_panel is not None:
+            self.watch_panel.full_refresh()
+        self.update_status(extra_info="Environment reset")
+
+    # ---------------- CHECKPOINTS ----------------
+
+    def checkpoint_environment(self, label):
+        """Ask the kernel to park a copy-on-write snapshot of the environment."""
+        job_id = self.kernel.submit("checkpoint", label=label)
+        self._jobs[job_id] = {"kind": "checkpoint"}
+        self._schedule_pump()
+
+    def restore_checkpoint(self, checkpoint):
+        """Roll the environment back to a checkpoint; the kernel process is swapped for its fork."""
+        job_id = self.kernel.submit("restore", checkpoint=checkpoint["id"])
+        self._jobs[job_id] = {"kind": "restore", "label": checkpoint["label"]}
+        self.update_status(extra_info="Restoring...")
+        self._schedule_pump()
+
+    def _checkpoint_done(self, job, msg):
+        self.checkpoints = msg["checkpoints"]
+        self._refresh_restore_menu()
+        if job["kind"] == "checkpoint":
+            return
+        if msg.get("error"):
+            self._write_output(f"[Could not restore: {msg['error']}]\n\n")
+            return
+        self._write_output(f"--- Environment restored to: {job['label']} ---\n\n")
+        if self.watch_panel is not None:
+            self.watch_panel.full_refresh()  # the restored kernel last saw an older panel
+        if self.inspector is not None:
+            self.inspector.refresh()
+        self.update_status(extra_info=f"Restored: {job['label']}")
+
+    def _refresh_restore_menu(self):
+        if self.restore_menu is None:
+            return  # the menus aren't built yet
+        self.restore_menu.delete(0, tk.END)
+        if not self.checkpoints:
+            self.restore_menu.add_command(label="(no checkpoints yet)", state=tk.DISABLED)
+            return
+        for checkpoint in reversed(self.checkpoints):  # newest first
+            megabytes = checkpoint["memory"] / (1024 * 1024)
+            self.restore_menu.add_command(
+                label=f"{checkpoint['label']}  ({megabytes:.1f} MB)",
+                command=lambda c=checkpoint: self.restore_checkpoint(c),
+            )
+
+    # ---------------- AUTOSAVE ----------------
+
+    def _on_code_modified(self, event=None):
+        if not self.code_text.edit_modified():
+            return  # the reset below fires this event too
+        self.code_text.edit_modified(False)
+        if not self._autosave_scheduled:
+            self._autosave_scheduled = True
+            self.root.after(AUTOSAVE_DELAY_MS, self._autosave)
+        self._schedule_check()
+
+    def _autosave(self):
+        """Hand the code to the journal thread; the disk is never touched here."""
+        self._autosave_scheduled = False
+        self.journal.save(self.code_text.get("1.0", "end-1c"))
+
+    def _toggle_save_variables(self):
+        if self.save_variables_var.get():
+            self._save_variables()
+        else:
+            self._forget_saved_variables()
+
+    def _save_variables(self):
+        """Have the kernel pickle what it can of the environment (after any queued runs)."""
+        job_id = self.kernel.submit("save_env", path=AUTOSAVE_VARIABLES)
+        self._jobs[job_id] = {"kind": "save_env"}
+        self._schedule_pump()
+
+    def _load_variables(self):
+        job_id = self.kernel.submit("load_env", path=AUTOSAVE_VARIABLES)
+        self._jobs[job_id] = {"kind": "load_env"}
+        self._schedule_pump()
+
+    def _forget_saved_variables(self):
+        try:
+            os.remove(AUTOSAVE_VARIABLES)
+        except OSError:
+            pass
+
+    def _variables_done(self, job, msg):
+        if msg.get("error"):
+            if job["kind"] == "load_env":
+                self._write_output(f"[Could not restore your variables: {msg['error']}]\n\n")
+            return
+        if job["kind"] == "load_env" and msg["loaded"]:
+            self._write_output(f"[Variables from last time: {', '.join(msg['loaded'])}]\n\n")
+
+    # ---------------- LIVE CHECKING ----------------
+
+    def _schedule_check(self):
+        """Check the code once typing pauses for CHECK_DELAY_MS."""
+        if self._check_after is not None:
+            self.root.after_cancel(self._check_after)
+        self._check_after = self.root.after(CHECK_DELAY_MS, self._start_check)
+
+    def _start_check(self):
+        self._check_after = None
+        self._check_version += 1
+        # The same text Run compiles, so Run finds it in the compile cache
+        self.checker.submit(self._check_version, self.code_text.get("1.0", tk.END), self.env_names)
+        if not self._check_polling:
+            self._check_polling = True
+            self.root.after(20, self._collect_check)
+
+    def _collect_check(self):
+        result = self.checker.poll()
+        if result is None or result.version != self._check_version:
+            self.root.after(20, self._collect_check)  # the newest check is still running
+            return
+        self._check_polling = False
+        self.code_text.tag_remove("check_error", "1.0", tk.END)
+        self.code_text.tag_remove("check_undefined", "1.0", tk.END)
+        for lineno, start, end in result.undefined:
+            self.code_text.tag_add("check_undefined", f"{lineno}.{start}", f"{lineno}.{end}")
+        if result.error is not None:
+            lineno, start, end, message = result.error
+            self.code_text.tag_add("check_error", f"{lineno}.{start}", f"{lineno}.{end}")
+            self.update_status(extra_info=f"Line {lineno}: {message}")
+
+    def _note_env_names(self, names):
+        """Names a run defined stop being flagged as undefined."""
+        if not self.env_names.issuperset(names):
+            self.env_names.update(names)
+            if self.checker is not None:
+                self._schedule_check()
+
+    # ---------------- TELEMETRY ----------------
+
+    def _probe_lag(self):
+        """Runs every TELEMETRY_PROBE_MS; how late it runs is how busy the event loop was."""
+        now = time.perf_counter()
+        if self._probe_due is not None:
+            self.telemetry.record("mainloop.lag", max(now - self._probe_due, 0.0) * 1000)
+        self._probe_due = now + TELEMETRY_PROBE_MS / 1000
+        self.telemetry.maybe_log()
+        self.root.after(TELEMETRY_PROBE_MS, self._probe_lag)
+
+    def _record_job_timings(self, job, msg):
+        metric = job.get("metric")
+        if metric is None:
+            return
+        total = (time.perf_counter() - job["submitted"]) * 1000
+        in_kernel = msg.get("wall", 0.0) * 1000
+        self.telemetry.record(f"{metric}.total", total)
+        self.telemetry.record(f"{metric}.waiting", total - in_kernel)  # queue, pipe and our pump
+        if "format_seconds" in msg:
+            formatting = msg["format_seconds"] * 1000
+            self.telemetry.record(f"{metric}.trace", in_kernel - formatting)
+            self.telemetry.record(f"{metric}.format", formatting)
+        else:
+            self.telemetry.record(f"{metric}.kernel", in_kernel)
+
+    def _toggle_watch_panel(self):
+        if self.watch_panel_var.get() and self.watch_panel is None:
+            self.watch_panel = WatchPanel(self, self.root, before=self.main_frame)
+        elif not self.watch_panel_var.get() and self.watch_panel is not None:
+            self.watch_panel.frame.destroy()
+            self.watch_panel = None
+
+    def show_inspector(self):
+        if self.inspector is not None:
+            self.inspector.top.lift()
+            return
+        self.inspector = EnvironmentInspector(self)
+
+    def show_diagnostics(self):
+        if self.diagnostics is not None:
+            self.diagnostics.top.lift()
+            return
+        self.diagnostics = DiagnosticsWindow(self)
+
+    def _toggle_telemetry_log(self):
+        if self.telemetry_log_var.get():
+            self.telemetry.log_path = TELEMETRY_LOG
+            self.telemetry.write_log()  # one line now, then every TELEMETRY_LOG_SECONDS
+        else:
+            self.telemetry.log_path = None
+
+    # ---------------- OUTPUT STREAMING ----------------
+
+    def _write_output(self, text):
+        """Queue text for the output pane; the pump inserts it in batches."""
+        self._output_queue.append(text)
+        self._output_backlog += len(text)
+        self._schedule_pump()
+
+    def _schedule_pump(self):
+        if not self._pump_scheduled:
+            self._pump_scheduled = True
+            self.root.after(OUTPUT_FRAME_MS, self._pump)
+
+    def _pump(self):
+        """Drain kernel messages and flush queued output, at most once per frame."""
+        self._pump_scheduled = False
+
+        # Leave messages in the pipe while the pane is behind, so a chatty
+        # program is slowed down instead of filling up our memory.
+        if self._output_backlog < OUTPUT_BACKLOG_LIMIT:
+            for msg in self.kernel.poll(limit=OUTPUT_MESSAGES_PER_FRAME):
+                self._handle_kernel_message(msg)
+
+        if self._jobs and not self.kernel.is_alive():
+            self._jobs.clear()
+            self._write_output("[The kernel stopped unexpectedly - press Reset Env]\n\n")
+
+        self._flush_output()
+        if self._jobs or self._output_queue:
+            self._schedule_pump()
+
+    def _flush_output(self):
+        """Insert queued text with a single widget call, capped per frame."""
+        if not self._output_queue:
+            return
+        parts = []
+        size = 0
+        while self._output_queue and size < OUTPUT_CHARS_PER_FRAME:
+            text = self._output_queue.popleft()
+            parts.append(text)
+            size += len(text)
+        self._output_backlog -= size
+        started = time.perf_counter()
+        self.output.write("".join(parts))
+        self.telemetry.record("output.insert", (time.perf_counter() - started) * 1000)
+
+    def _handle_kernel_message(self, msg):
+        job = self._jobs.get(msg["id"])
+        if job is None:
+            return  # a reply for something we no longer care about
+        if msg["op"] == "input_request":
+            self._ask_for_input(msg["id"], job)
+            return
+        if msg["op"] == "started":
+            self._job_started(msg["id"], job)
+            return
+        if msg["op"] == "stream":
+            if job["kind"] == "explain":
+                self._start_explanation_output(job)  # explanation lines, live
+            elif not job["has_output"] and msg["data"].strip():
+                job["has_output"] = True
+            self._write_output(msg["data"])
+            return
+
+        del self._jobs[msg["id"]]
+        if msg["id"] == self._input_job:
+            self._hide_input_bar()  # input() was stopped or the run died
+        self._record_job_timings(job, msg)
+        if job.get("stopping"):
+            self._write_output(f"{job['stopping']}\n")
+        if job["kind"] == "explain":
+            self._show_explanation_end(job, msg)
+            return
+        if job["kind"] in ("checkpoint", "restore"):
+            self._checkpoint_done(job, msg)
+            return
+        if job["kind"] == "trace":
+            self._open_scrubber(msg)
+            return
+        self._note_env_names(msg.get("names", ()))
+        if "names" in msg:
+            if self.watch_panel is not None:
+                self.watch_panel.refresh()
+            if self.inspector is not None:
+                self.inspector.refresh()
+        if job["kind"] == "warm":
+            return
+        if job["kind"] in ("watch", "watch_items"):
+            if self.watch_panel is not None:
+                self.watch_panel.kernel_replied(job, msg)
+            return
+        if job["kind"] in ("env_list", "env_sizes"):
+            if self.inspector is not None:
+                self.inspector.kernel_replied(job, msg)
+            return
+        if job["kind"] in ("save_env", "load_env"):
+            self._variables_done(job, msg)
+            return
+        if self.auto_checkpoint_var.get():
+            self.checkpoint_environment(job["label"])
+        if self.save_variables_var.get():
+            self._save_variables()
+        if not job["has_output"]:
+            self._write_output("[No output]\n")
+        if "memory" in msg:
+            self._write_output(_memory_report(msg["memory"]))
+        if job["profile"]:
+            self._show_profile(msg)
+            return
+        self._write_output("\n")
+        status = f"Last run: {time.strftime('%H:%M:%S')} – {_usage_report(msg)}"
+        if msg.get("reused"):
+            total = msg["ran"] + msg["reused"]
+            status += f" (re-ran {msg['ran']} of {total} statements)"
+        self.update_status(extra_info=status)
+
+    # ---------------- INPUT ----------------
+
+    def _ask_for_input(self, job_id, job):
+        """The running code called input(): show the answer bar under the output."""
+        job["input_since"] = time.perf_counter()
+        self._input_job = job_id
+        self.input_bar.pack(fill=tk.X, pady=(4, 0), after=self._input_anchor)
+        self.input_entry.focus_set()
+        self.update_status(extra_info="Waiting for your answer...")
+
+    def _send_input(self, event=None, eof=False):
+        job = self._jobs.get(self._input_job)
+        if job is None:
+            self._hide_input_bar()
+            return "break"
+        text = None if eof else self.input_entry.get()
+        self._write_output("\n" if eof else text + "\n")  # echoed, like in a terminal
+        self.kernel.answer(self._input_job, text)
+        waited = time.perf_counter() - job.pop("input_since")
+        job["input_waited"] = job.get("input_waited", 0.0) + waited
+        self._hide_input_bar()
+        self.code_text.focus_set()
+        self.update_status(extra_info="Running...")
+        return "break"
+
+    def _hide_input_bar(self):
+        self._input_job = None
+        self.input_entry.delete(0, tk.END)
+        self.input_bar.pack_forget()
+
+    def _toggle_spooling(self):
+        """Turn 'always spool' on/off; turning it off takes effect at the next Clear Output."""
+        self.output.always_spool = self.always_spool_var.get()
+        if self.output.always_spool and self.output.spool is None:
+            self.output.write("")  # switches over straight away
+
+    # ---------------- PROFILING ----------------
+
+    def profile_code(self):
+        """Run the code cell while counting hits/time per line, then colour the lines."""
+        self.clear_heatmap()
+        code = self.code_text.get("1.0", tk.END)
+        self._submit_run(code, "Profile", op="profile", metric="profile")
+
+    def _show_profile(self, result):
+        hits, times = result["hits"], result["times"]
+        total_ms = result["total_ns"] / 1e6
+        if not times:
+            self._write_output("[Profile: no lines ran]\n\n")
+            return
+
+        # Colour each line by its share of the hottest line's time
+        hottest = max(times.values()) or 1
+        for lineno, spent in times.items():
+            level = min(len(HEATMAP_COLOURS) - 1, spent * len(HEATMAP_COLOURS) // hottest)
+            self.code_text.tag_add(f"heat{level}", f"{lineno}.0", f"{lineno}.0 lineend+1c")
+
+        code_lines = self.code_text.get("1.0", "end-1c").splitlines()
+        spent_total = sum(times.values()) or 1
+        self._write_output("Hottest lines:\n")
+        for lineno, spent in sorted(times.items(), key=lambda item: -item[1])[:5]:
+            self._write_output(
+                f"  line {lineno:>4}: {hits.get(lineno, 0):>9,} hits {spent / 1e6:>10.2f} ms "
+                f"({100 * spent / spent_total:4.1f}%)  {_line_text(code_lines, lineno).strip()}\n"
+            )
+        self._write_output("\n")
+
+        top_line = max(times, key=times.get)
+        self.update_status(
+            extra_info=f"Profile: {sum(hits.values()):,} line hits in {total_ms:.1f} ms, "
+                       f"hottest line {top_line} ({100 * times[top_line] / spent_total:.0f}%)"
+        )
+
+    def clear_heatmap(self):
+        for level in range(len(HEATMAP_COLOURS)):
+            self.code_text.tag_remove(f"heat{level}", "1.0", tk.END)
+
+    # ---------------- STEP-BY-STEP EXPLANATION (always Kid-style) ----------------
+
+    def explain_step_by_step(self):
+        """Trace the code line-by-line (in the kernel) and stream a kid-style explanation."""
+        code = self.code_text.get("1.0", tk.END)
+        if not code.strip():
+            messagebox.showinfo("No code", "There is no code to explain.")
+            return
+
+        max_steps = EXPLAIN_MAX_STEPS  # safety: avoid infinite loops in explanations
+        job = {
+            "kind": "explain",
+            "metric": "explain",
+            "header_written": False,
+            "max_steps": max_steps,
+            "timestamp": time.strftime("%H:%M:%S"),
+        }
+        try:
+            compiled = self._compile(code, "explain")
+        except (SyntaxError, ValueError) as e:
+            self._show_explanation_end(job, {"syntax_error": str(e)})
+            return
+
+        self._start_job(
+            job, "explain", code=marshal.dumps(compiled), source=code, max_steps=max_steps,
+            budgets=self._run_budgets(),
+        )
+        self.update_status(extra_info="Explaining...")
+        self._schedule_pump()
+
+    def _start_explanation_output(self, job):
+        if not job["header_written"]:
+            job["header_written"] = True
+            self._write_output(f"--- Step-by-step at {job['timestamp']} ---\n")
+
+    def _show_explanation_end(self, job, result):
+        timestamp = job["timestamp"]
+        if "syntax_error" in result:
+            self._write_output(
+                f"--- Step-by-step (syntax error) ---\n{result['syntax_error']}\n\n"
+            )
+            return
+
+        self._start_explanation_output(job)
+        if not result["step_count"]:
+            self._write_output(
+                "[No steps traced – the code may be empty or didn't execute any lines]\n"
+            )
+
+        if result["step_count"] >= job["max_steps"]:
+            self._write_output(
+                f"\n[Stopped after {job['max_steps']} steps to avoid a very long trace]\n"
+            )
+
+        printed_output = result["printed"]
+        if printed_output.strip():
+            self._write_output("\n--- Printed output during explanation ---\n")
+            self._write_output(printed_output + "\n\n")
+        else:
+            self._write_output("\n")
+
+        cached = " (saved explanation)" if result.get("cached") else ""
+        self.update_status(extra_info=f"Step-by-step at {timestamp}{cached}")
+
+    # ---------------- STEP THROUGH ----------------
+
+    def step_through(self):
+        """Trace the code (in the kernel) and open a scrubber over every step."""
+        code = self.code_text.get("1.0", tk.END)
+        if not code.strip():
+            messagebox.showinfo("No code", "There is no code to step through.")
+            return
+        try:
+            compiled = self._compile(code, "step_through")
+        except (SyntaxError, ValueError) as e:
+            self._write_output(f"--- Step through (syntax error) ---\n{e}\n\n")
+            return
+
+        self._start_job(
+            {"kind": "trace", "metric": "step_through"},
+            "trace", code=marshal.dumps(compiled), source=code, max_steps=TRACE_MAX_STEPS,
+            budgets=self._run_budgets(),
+        )
+        self.update_status(extra_info="Tracing...")
+        self._schedule_pump()
+
+    def _open_scrubber(self, result):
+        trace = ColumnarTrace.from_message(result["trace"])
+        if result["printed"].strip():
+            self._write_output("--- Printed output while tracing ---\n" + result["printed"] + "\n")
+        if self.scrubber is not None:
+            self.scrubber.close()
+        self.scrubber = StepScrubber(self, trace)
+        stopped = " (stopped early)" if trace.truncated else ""
+        self.update_status(extra_info=f"Traced {len(trace):,} steps{stopped}")
+
+    # ---------------- EXAMPLES ----------------
+
+    def load_example(self, key: str):
+        """Load one of the predefined educational examples into the editor."""
+        code = EXAMPLES.get(key)
+        if code is None:
+            return
+
+        # Replace editor contents with the chosen example
+        self.clear_heatmap()
+        self.code_text.delete("1.0", tk.END)
+        self.code_text.insert("1.0", code)
+        self.code_text.edit_reset()
+        self.update_status()
+
+    # ---------------- CLEARING ----------------
+
+    def clear_output(self):
+        self._output_queue.clear()
+        self._output_backlog = 0
+        self.output.clear()
+
+    def clear_code(self):
+        self.code_text.delete("1.0", tk.END)
+        self.clear_heatmap()
+        self.update_status()
+
+    # ---------------- WINDOW CLOSE ----------------
+
+    def on_close(self):
+        if self.telemetry.log_path is not None:
+            self.telemetry.write_log()
+        if self.journal is not None:
+            self.journal.save(self.code_text.get("1.0", "end-1c"))
+            self.journal.close()
+        if self._kernel is not None:
+            self._kernel.shutdown()
+            self.kernel_pool.shutdown()
+        self.output.close()
+        self.root.destroy()
+
+
+# ---------------- HEADLESS BATCH RUNNER ----------------
+
+# Per-submission output kept for the report; anything beyond is dropped
+BATCH_OUTPUT_LIMIT = 256 * 1024
+
+
+class _BatchSlot:
+    """One kernel of the batch pool and the submission it is working on."""
+
+    def __init__(self):
+        self.kernel = Kernel()
+        self.result = None
+        self.waiting_for = None  # job id we expect a reply to
+        self.deadline = None
+        self.explain_next = False
+        self.output = []
+        self.output_size = 0
+        self.answers = deque()  # lines for the submission's input() calls
+
+
+def _batch_answers(path):
+    """Lines from NAME.in next to a submission, fed to its input() calls (none: EOF)."""
+    try:
+        with open(os.path.splitext(path)[0] + ".in", encoding="utf-8") as f:
+            return deque(f.read().splitlines())
+    except OSError:
+        return deque()
+
+
+def run_batch(paths, jobs=None, timeout=10.0, explain=False, on_result=None):
+    """
+    Run each submission file in a fresh environment, the way Run does, spread
+    over `jobs` kernel processes (one per core by default). Returns one dict
+    per file with status ok / error / exit / syntax-error / timeout, its
+    output, traceback and exit code, and (with explain=True) the step-by-step
+    explanation. "exit" means the code called sys.exit() with a non-zero code.
+    input() reads lines from NAME.in, then gets EOFError.
+    """
+    paths = list(paths)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(paths) or 1))
+    compile_cache = CompileCache()
+    todo = deque(paths)
+    results = []
+    slots = [_BatchSlot() for _ in range(jobs)]
+
+    def finish(slot):
+        result = slot.result
+        result["seconds"] = round(time.monotonic() - result.pop("_started"), 3)
+        _check_expected_output(result)
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+        slot.result = None
+        slot.waiting_for = None
+
+    def start_next(slot):
+        while todo and slot.result is None:
+            path = todo.popleft()
+            result = {"file": str(path), "_started": time.monotonic()}
+            try:
+                with open(path, encoding="utf-8") as f:
+                    source = f.read()
+                compiled = compile_cache.compile(source, filename="<string>")
+            except (SyntaxError, ValueError, OSError, UnicodeDecodeError) as e:
+                result.update(status="syntax-error", output="", error=f"{type(e).__name__}: {e}")
+                slot.result = result
+                finish(slot)
+                continue
+
+            slot.result = result
+            slot.output, slot.output_size = [], 0
+            slot.answers = _batch_answers(path)
+            slot.explain_next = explain
+            slot.kernel.submit("reset")
+            slot.waiting_for = slot.kernel.submit(
+                "exec", code=marshal.dumps(compiled), budgets=RUN_BUDGETS
+            )
+            slot.deadline = time.monotonic() + timeout
+            result["_code"], result["_source"] = compiled, source
+
+    for slot in slots:
+        start_next(slot)
+
+    while any(slot.result is not None for slot in slots):
+        busy = {slot.kernel.conn: slot for slot in slots if slot.result is not None}
+        for conn in wait_for_connections(list(busy), timeout=0.05):
+            slot = busy[conn]
+            for msg in slot.kernel.poll():
+                if msg["id"] != slot.waiting_for:
+                    continue
+                if msg["op"] == "input_request":
+                    slot.kernel.answer(msg["id"], slot.answers.popleft() if slot.answers else None)
+                    continue
+                if msg["op"] == "stream":
+                    if slot.output_size < BATCH_OUTPUT_LIMIT:
+                        slot.output.append(msg["data"])
+                        slot.output_size += len(msg["data"])
+                    continue
+                result = slot.result
+                if "status" not in result:
+                    # the run itself finished
+                    result["output"] = "".join(slot.output)[:BATCH_OUTPUT_LIMIT]
+                    result["error"] = msg.get("error")
+                    result["exit_code"] = msg.get("exit_code", 0)
+                    if result["error"]:
+                        result["status"] = "error"
+                    else:
+                        result["status"] = "exit" if result["exit_code"] else "ok"
+                    result["cpu_seconds"] = round(msg["cpu"], 3)
+                    result["peak_memory"] = msg["usage"]["peak_rss"]
+                    result["over_budget"] = msg["usage"]["budget"]
+                    if slot.explain_next:
+                        slot.output, slot.output_size = [], 0
+                        slot.waiting_for = slot.kernel.submit(
+                            "explain", code=marshal.dumps(result["_code"]),
+                            source=result["_source"], max_steps=EXPLAIN_MAX_STEPS, budgets=RUN_BUDGETS,
+                        )
+                        slot.deadline = time.monotonic() + timeout
+                        continue
+                else:
+                    result["explanation"] = "".join(slot.output)
+                    result["steps"] = msg["step_count"]
+                del result["_code"], result["_source"]
+                finish(slot)
+                start_next(slot)
+
+        now = time.monotonic()
+        for slot in slots:
+            if slot.result is not None and (
+                now > slot.deadline or not slot.kernel.is_alive()
+            ):
+                result = slot.result
+                timed_out = now > slot.deadline
+                if "status" in result:  # the run was fine; the explanation wasn't
+                    result["explanation"] = "[timed out]" if timed_out else "[kernel died]"
+                else:
+                    result["output"] = "".join(slot.output)[:BATCH_OUTPUT_LIMIT]
+                    result["error"] = None if timed_out else "The kernel process died"
+                    result["status"] = "timeout" if timed_out else "error"
+                result.pop("_code", None)
+                result.pop("_source", None)
+                slot.kernel.shutdown()
+                slot.kernel = Kernel()
+                finish(slot)
+                start_next(slot)
+
+    for slot in slots:
+        slot.kernel.shutdown()
+    results.sort(key=lambda r: r["file"])
+    return results
+
+
+def _check_expected_output(result):
+    """Compare output with NAME.expected / NAME.out next to the submission, if present."""
+    base = os.path.splitext(result["file"])[0]
+    for ext in (".expected", ".out"):
+        if os.path.exists(base + ext):
+            with open(base + ext, encoding="utf-8") as f:
+                expected = f.read()
+            normalise = lambda text: [line.rstrip() for line in text.rstrip().splitlines()]
+            result["passed"] = (
+                result.get("status") == "ok"
+                and normalise(result.get("output", "")) == normalise(expected)
+            )
+            return
+
+
+def write_batch_report(results, path):
+    """Write results as JSON, or as CSV if the path ends in .csv."""
+    import csv
+    import json
+    if path.lower().endswith(".csv"):
+        fields = [
+            "file", "status", "exit_code", "passed", "seconds", "cpu_seconds", "peak_memory",
+            "over_budget", "steps", "output", "error",
+        ]
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+def _batch_main(args):
+    if os.path.isdir(args.batch):
+        paths = sorted(
+            os.path.join(args.batch, name)
+            for name in os.listdir(args.batch)
+            if name.endswith(".py")
+        )
+    else:
+        paths = [args.batch]
+    if not paths:
+        print(f"No .py files found in {args.batch}")
+        return 1
+
+    def report_progress(result):
+        passed = {True: " (passed)", False: " (FAILED)"}.get(result.get("passed"), "")
+        status = result["status"]
+        if status == "exit":
+            status = f"exit {result['exit_code']}"
+        print(f"{status:>12}  {result['seconds']:7.3f}s  {result['file']}{passed}")
+
+    started = time.monotonic()
+    results = run_batch(
+        paths, jobs=args.jobs, timeout=args.timeout, explain=args.explain,
+        on_result=report_progress,
+    )
+    elapsed = time.monotonic() - started
+
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    summary = ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+    checked = [r for r in results if "passed" in r]
+    if checked:
+        summary += f"; {sum(r['passed'] for r in checked)}/{len(checked)} matched expected output"
+    print(f"\n{len(results)} files in {elapsed:.2f}s: {summary}")
+
+    if args.report:
+        write_batch_report(results, args.report)
+        print(f"Report written to {args.report}")
+    return 0
+
+
+# ---------------- BENCHMARKS ----------------
+
+# A metric this much worse than the baseline counts as a regression...
+BENCHMARK_TOLERANCE = 0.20
+# ...unless it is within the noise: timings this close are never flagged,
+# nor peaks this close...
+BENCHMARK_NOISE_MS = 1.0
+BENCHMARK_NOISE_KB = 64
+# ...and only when both sides took the median of at least this many runs
+BENCHMARK_MIN_REPEAT = 5
+
+
+def _benchmark_workloads():
+    """name -> source: the built-in examples plus a few stress programs."""
+    workloads = {f"example:{key}": code for key, code in EXAMPLES.items()}
+    workloads["long_loop"] = (
+        "total = 0\n"
+        "for i in range(200000):\n"
+        "    total += i\n"
+    )
+    workloads["wide_namespace"] = "".join(f"v{i} = {i}\n" for i in range(2000)) + (
+        "for i in range(50):\n"
+        "    v0 += i\n"
+    )
+    workloads["huge_print"] = (
+        "for i in range(100000):\n"
+        "    print('line', i)\n"
+    )
+    return workloads
+
+
+def _best_of(repeat, func):
+    """Median wall time of func() in milliseconds."""
+    import statistics
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def benchmark_workload(source, repeat=5, max_steps=300000):
+    """Time plain exec, tracing and kid-style formatting of one program, in this process."""
+    compiled = compile(source, "<string>", "exec")
+    sink = io.StringIO()
+
+    def plain_exec():
+        sink.seek(0)
+        sink.truncate()
+        with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+            exec(compiled, {"__builtins__": builtins})
+
+    exec_ms = _best_of(repeat, plain_exec)
+
+    steps = []
+    tracer_box = []
+
+    def traced_exec():
+        steps.clear()
+        env = {"__builtins__": builtins}
+        tracer = StepTracer(max_steps, steps.append)
+        sink.seek(0)
+        sink.truncate()
+        with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+            tracer.run(compiled, env)
+        tracer.finish(env)
+        tracer_box[:] = [tracer]
+
+    trace_ms = _best_of(max(1, repeat // 2), traced_exec)
+    final_changes = tracer_box[0].final_changes
+    code_lines = source.splitlines()
+    format_ms = _best_of(
+        max(1, repeat // 2), lambda: format_kid_style(steps, final_changes, code_lines)
+    )
+
+    import tracemalloc
+    tracemalloc.start()
+    traced_exec()
+    format_kid_style(steps, final_changes, code_lines)
+    peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+
+    step_count = len(steps)
+    return {
+        "exec_ms": round(exec_ms, 3),
+        "trace_ms": round(trace_ms, 3),
+        "format_ms": round(format_ms, 3),
+        "steps": step_count,
+        "trace_steps_per_sec": round(step_count / (trace_ms / 1000)) if trace_ms else 0,
+        "format_steps_per_sec": round(step_count / (format_ms / 1000)) if format_ms else 0,
+        "trace_overhead_x": round(trace_ms / exec_ms, 2) if exec_ms else 0,
+        "trace_peak_kb": round(peak_kb, 1),
+    }
+
+
+def benchmark_kernel_round_trip(source, repeat=5):
+    """Milliseconds for a run through a kernel process, streaming included."""
+    kernel = Kernel()
+    payload = marshal.dumps(compile(source, "<string>", "exec"))
+
+    def one_run():
+        job_id = kernel.submit("exec", code=payload)
+        while True:
+            wait_for_connections([kernel.conn])
+            if any(msg["id"] == job_id and msg["op"] == "done" for msg in kernel.poll()):
+                return
+
+    one_run()  # the first run also waits for the kernel to boot
+    try:
+        return round(_best_of(repeat, one_run), 3)
+    finally:
+        kernel.shutdown()
+
+
+def benchmark_output_pane(text, repeat=3):
+    """Milliseconds to push text through OutputPane in frame-sized chunks, or None without a display."""
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    root.withdraw()
+    try:
+        widget = tk.Text(root, font=("Consolas", 11))
+        scrollbar = ttk.Scrollbar(root, command=widget.yview)
+        pane = OutputPane(widget, scrollbar)
+        chunks = [
+            text[i:i + OUTPUT_CHARS_PER_FRAME]
+            for i in range(0, len(text), OUTPUT_CHARS_PER_FRAME)
+        ]
+
+        def fill():
+            pane.clear()
+            for chunk in chunks:
+                pane.write(chunk)
+            root.update_idletasks()
+
+        return round(_best_of(repeat, fill), 3)
+    finally:
+        pane.close()
+        root.destroy()
+
+
+def run_benchmarks(repeat=5, log=print):
+    """Run every workload; returns a machine-readable results dict."""
+    import platform
+    results = {}
+    for name, source in _benchmark_workloads().items():
+        log(f"  {name} ...")
+        metrics = benchmark_workload(source, repeat=repeat)
+        metrics["kernel_run_ms"] = benchmark_kernel_round_trip(source, repeat=repeat)
+        if name == "huge_print":
+            printed = io.StringIO()
+            with contextlib.redirect_stdout(printed):
+                exec(compile(source, "<string>", "exec"), {"__builtins__": builtins})
+            metrics["output_pane_ms"] = benchmark_output_pane(printed.getvalue())
+        results[name] = metrics
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "tracer": "sys.monitoring" if hasattr(sys, "monitoring") else "sys.settrace",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+# Metrics where a bigger number is better; every other timing is "lower is better"
+_HIGHER_IS_BETTER = {"trace_steps_per_sec", "format_steps_per_sec"}
+_COMPARED_METRICS = (
+    "exec_ms", "trace_ms", "format_ms", "kernel_run_ms", "output_pane_ms",
+    "trace_steps_per_sec", "format_steps_per_sec", "trace_peak_kb",
+)
+
+
+# Rates are judged by the timing they come from, so they share its noise floor
+_RATE_TIMINGS = {"trace_steps_per_sec": "trace_ms", "format_steps_per_sec": "format_ms"}
+
+
+def _within_noise(metric, old_metrics, new_metrics):
+    """Is the difference in metric (a median) too small to mean anything?"""
+    metric = _RATE_TIMINGS.get(metric, metric)
+    old, new = old_metrics.get(metric), new_metrics.get(metric)
+    if old is None or new is None:
+        return False
+    floor = BENCHMARK_NOISE_KB if metric.endswith("_kb") else BENCHMARK_NOISE_MS
+    return abs(new - old) < floor
+
+
+def compare_benchmarks(baseline, current, tolerance=BENCHMARK_TOLERANCE):
+    """
+    Lines describing each metric's change, and whether anything regressed.
+    Metrics are medians; a difference is only a regression when it is more
+    than tolerance, outside the noise floor, and both sides ran at least
+    BENCHMARK_MIN_REPEAT times (baselines from before "repeat" was recorded
+    never count).
+    """
+    lines = []
+    regressed = False
+    repeat = min(baseline.get("repeat", 0), current.get("repeat", 0))
+    judged = repeat >= BENCHMARK_MIN_REPEAT
+    for name, metrics in current["results"].items():
+        old_metrics = baseline["results"].get(name)
+        if old_metrics is None:
+            continue
+        for metric in _COMPARED_METRICS:
+            old, new = old_metrics.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric in _HIGHER_IS_BETTER else change
+            flag = ""
+            if worse > tolerance and not _within_noise(metric, old_metrics, metrics):
+                if judged:
+                    flag = "  <-- REGRESSION"
+                    regressed = True
+                else:
+                    flag = "  <-- slower?"
+            lines.append(f"{name:32} {metric:22} {old:>12} -> {new:>12} ({change:+.0%}){flag}")
+    if not judged:
+        lines.append(
+            f"(Nothing counts as a regression: both runs need --repeat {BENCHMARK_MIN_REPEAT} "
+            f"or more, and the fewest here was {repeat or 'not recorded'}.)"
+        )
+    return lines, regressed
+
+
+def _benchmark_main(args):
+    import json
+    print("Running benchmarks (this takes a little while)...")
+    current = run_benchmarks(repeat=args.repeat)
+
+    print(f"\nPython {current['python']} ({current['tracer']} tracer)")
+    header = f"{'workload':32} {'exec ms':>9} {'trace ms':>9} {'fmt ms':>8} {'steps':>7} " \
+             f"{'steps/s':>9} {'overhead':>8} {'peak KB':>9} {'kernel ms':>9}"
+    print(header)
+    for name, m in current["results"].items():
+        print(
+            f"{name:32} {m['exec_ms']:>9} {m['trace_ms']:>9} {m['format_ms']:>8} "
+            f"{m['steps']:>7} {m['trace_steps_per_sec']:>9} {m['trace_overhead_x']:>7}x "
+            f"{m['trace_peak_kb']:>9} {m['kernel_run_ms']:>9}"
+        )
+    pane_ms = current["results"]["huge_print"].get("output_pane_ms")
+    print(f"\nOutput pane, 100k printed lines: "
+          f"{'skipped (no display)' if pane_ms is None else f'{pane_ms} ms'}")
+
+    if args.benchmark_out:
+        with open(args.benchmark_out, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to {args.benchmark_out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressed = compare_benchmarks(baseline, current)
+        print(f"\nCompared with {args.compare} (python {baseline.get('python')}):")
+        print("\n".join(lines))
+        return 1 if regressed else 0
+    return 0
+
+
+# ---------------- CLASSROOM SERVER ----------------
+
+# Events kept per session for a client that falls behind
+SERVER_EVENT_LIMIT = 2000
+# How long an /events request waits for something to happen
+SERVER_POLL_SECONDS = 25
+# Sessions nobody has touched for this long are closed
+SERVER_IDLE_SECONDS = 4 * 3600
+SERVER_TIME_LIMIT = 30
+SERVER_MAX_BODY = 1024 * 1024
+
+
+class _Session:
+    """One student's notebook: the worker holding its variables, and its event log."""
+
+    def __init__(self, session_id, worker):
+        self.id = session_id
+        self.worker = worker
+        self.events = deque(maxlen=SERVER_EVENT_LIMIT)
+        self.next_seq = 1
+        self.runs = 0
+        self.cpu_seconds = 0.0
+        self.last_active = time.monotonic()
+
+
+class _ServerWorker:
+    """A kernel shared by several sessions, and its jobs in the order it runs them."""
+
+    def __init__(self):
+        self.kernel = Kernel()
+        self.queue = deque()  # [job id, session, kind, op, fields]; the first one is running
+        self.started = None  # when the running job started
+        self.stopping = None  # when we asked it to stop
+        self.stop_message = None  # why, as _stop_message says it
+        self.session_count = 0
+
+
+class SessionServer:
+    """
+    Many independent notebooks in one process: each session's environment
+    lives in one of a few shared kernels (selected per request by name), and
+    its output is kept as numbered events that clients long-poll for.
+    """
+
+    def __init__(self, workers=None, time_limit=SERVER_TIME_LIMIT):
+        self.workers = [_ServerWorker() for _ in range(workers or os.cpu_count() or 1)]
+        self.sessions = {}
+        self.time_limit = time_limit
+        self.compile_cache = CompileCache()
+        self._lock = threading.Condition()
+        self._running = True
+        self._pump_thread = threading.Thread(target=self._pump, daemon=True)
+        self._pump_thread.start()
+
+    # -- sessions --
+
+    def create_session(self):
+        import secrets
+        with self._lock:
+            worker = min(self.workers, key=lambda w: w.session_count)
+            worker.session_count += 1
+            session = _Session(secrets.token_urlsafe(9), worker)
+            self.sessions[session.id] = session
+            return session.id
+
+    def close_session(self, session_id):
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+            if session is not None:
+                session.worker.session_count -= 1
+                session.worker.kernel.submit("drop_session", name=session_id)
+
+    def _session(self, session_id):
+        session = self.sessions[session_id]  # KeyError: unknown session
+        session.last_active = time.monotonic()
+        return session
+
+    def submit(self, session_id, kind, code=""):
+        """Queue a run, explain or reset for a session; returns the job id (None on a syntax error)."""
+        with self._lock:
+            session = self._session(session_id)
+            kernel = session.worker.kernel
+            if kind == "reset":
+                op, fields = "reset", dict(session=session_id)
+                job_id = kernel.submit(op, **fields)
+            else:
+                try:
+                    compiled = self.compile_cache.compile(code)
+                except (SyntaxError, ValueError) as e:
+                    import traceback
+                    self._emit(session, "output", text="".join(traceback.format_exception_only(type(e), e)))
+                    self._emit(session, "done", kind=kind, error="syntax")
+                    return None
+                if kind == "explain":
+                    op, fields = "explain", dict(
+                        session=session_id, code=marshal.dumps(compiled),
+                        source=code, max_steps=EXPLAIN_MAX_STEPS, budgets=RUN_BUDGETS,
+                    )
+                else:
+                    op, fields = "exec", dict(
+                        session=session_id, code=marshal.dumps(compiled), budgets=RUN_BUDGETS
+                    )
+                job_id = kernel.submit(op, **fields)
+                session.runs += 1
+            # what was sent is kept, to send it again should the kernel be replaced
+            session.worker.queue.append([job_id, session, kind, op, fields])
+            if len(session.worker.queue) == 1:
+                session.worker.started = time.monotonic()
+            return job_id
+
+    def stop(self, session_id):
+        """Interrupt the session's code if it is the one running; True if it was."""
+        with self._lock:
+            session = self._session(session_id)
+            worker = session.worker
+            if not worker.queue or worker.queue[0][1] is not session:
+                return False
+            self._interrupt(worker, _stop_message())
+            return True
+
+    def events(self, session_id, since, wait=SERVER_POLL_SECONDS):
+        """Events numbered after since; waits up to wait seconds for the first one."""
+        deadline = time.monotonic() + wait
+        with self._lock:
+            while True:
+                session = self._session(session_id)
+                events = [event for event in session.events if event["seq"] > since]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0 or not self._running:
+                    return events
+                self._lock.wait(remaining)
+
+    def stats(self):
+        """What each worker and session costs, for /api/stats."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "server_memory": _process_memory(os.getpid()),
+                "workers": [
+                    {
+                        "pid": worker.kernel.pid,
+                        "memory": _process_memory(worker.kernel.pid),
+                        "sessions": worker.session_count,
+                        "queued": len(worker.queue),
+                    }
+                    for worker in self.workers
+                ],
+                "sessions": [
+                    {
+                        "id": session.id,
+                        "runs": session.runs,
+                        "cpu_seconds": round(session.cpu_seconds, 3),
+                        "idle_seconds": round(now - session.last_active),
+                    }
+                    for session in self.sessions.values()
+                ],
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+        self._pump_thread.join(timeout=2)
+        for worker in self.workers:
+            worker.kernel.shutdown()
+
+    # -- the pump thread: kernel replies into session events --
+
+    def _emit(self, session, event_type, **fields):
+        fields.update(seq=session.next_seq, type=event_type)
+        session.next_seq += 1
+        session.events.append(fields)
+
+    def _pump(self):
+        last_sweep = time.monotonic()
+        while self._running:
+            conns = {worker.kernel.conn: worker for worker in self.workers}
+            try:
+                ready = wait_for_connections(list(conns), timeout=0.25)
+            except OSError:
+                ready = []
+            with self._lock:
+                for conn in ready:
+                    worker = conns[conn]
+                    for msg in worker.kernel.poll():
+                        self._dispatch(worker, msg)
+                self._check_workers()
+                if time.monotonic() - last_sweep > 60:
+                    last_sweep = time.monotonic()
+                    self._close_idle_sessions()
+                self._lock.notify_all()
+
+    def _dispatch(self, worker, msg):
+        entry = next((entry for entry in worker.queue if entry[0] == msg["id"]), None)
+        if entry is None:
+            return  # e.g. a drop_session reply
+        _job_id, session, kind, _op, _fields = entry
+        if msg["op"] == "input_request":
+            worker.kernel.answer(msg["id"], None)  # no way to ask over HTTP: input() gets EOF
+            return
+        if msg["op"] == "stream":
+            self._emit(session, "output", text=msg["data"])
+            return
+        worker.queue.remove(entry)
+        worker.started = time.monotonic()
+        worker.stopping = None
+        if worker.stop_message is not None:
+            self._emit(session, "output", text=f"{worker.stop_message}\n")
+            worker.stop_message = None
+        session.cpu_seconds += msg.get("cpu", 0.0)
+        if kind == "explain" and msg["printed"].strip():
+            self._emit(session, "output", text="\n--- Printed output during explanation ---\n" + msg["printed"])
+        self._emit(session, "done", kind=kind, error=msg.get("error"))
+
+    def _interrupt(self, worker, message):
+        if worker.stopping is None:
+            worker.stopping = time.monotonic()
+            worker.stop_message = message
+            worker.kernel.interrupt(worker.queue[0][0])
+
+    def _check_workers(self):
+        """Enforce the time limit; replace kernels that died or ignored Stop."""
+        now = time.monotonic()
+        for worker in self.workers:
+            if not worker.queue:
+                continue
+            if self.time_limit and now - worker.started > self.time_limit:
+                self._interrupt(worker, _stop_message(self.time_limit))
+            stuck = worker.stopping is not None and now - worker.stopping > STOP_GRACE_MS / 1000
+            if stuck or not worker.kernel.is_alive():
+                self._restart_worker(worker)
+
+    def _restart_worker(self, worker):
+        """
+        Replace a kernel that died or ignored Stop. Only the session whose
+        code was running is told; the jobs queued behind it are sent to the
+        new kernel.
+        """
+        worker.kernel.shutdown()
+        worker.kernel = Kernel()
+        if worker.stopping is not None:
+            text = "[The code would not stop, so Python was restarted - your variables were cleared]\n"
+        else:
+            text = "[Python was restarted - your variables were cleared]\n"
+        worker.stopping = worker.stop_message = None
+        worker.started = time.monotonic()
+        (_job_id, session, kind, _op, _fields), *waiting = worker.queue
+        worker.queue.clear()
+        self._emit(session, "done", kind=kind, error="restarted")
+        self._emit(session, "output", text=text)
+        for entry in waiting:
+            entry[0] = worker.kernel.submit(entry[3], **entry[4])
+            worker.queue.append(entry)
+
+    def _close_idle_sessions(self):
+        now = time.monotonic()
+        for session in list(self.sessions.values()):
+            if now - session.last_active > SERVER_IDLE_SECONDS and not any(
+                entry[1] is session for entry in session.worker.queue
+            ):
+                self.sessions.pop(session.id)
+                session.worker.session_count -= 1
+                session.worker.kernel.submit("drop_session", name=session.id)
+
+
+def _process_memory(pid):
+    """Resident memory of a process in bytes (Linux), or None."""
+    return _proc_status_bytes(pid, "VmRSS")
+
+
+def _session_request_handler():
+    """
+    The request handler class for --serve. It is built on demand so the
+    HTTP modules are only imported by the server.
+    """
+    import json
+    import urllib.parse
+    from http.server import BaseHTTPRequestHandler
+
+    class _SessionRequestHandler(BaseHTTPRequestHandler):
+        """
+        JSON API over SessionServer (self.server.tutor), plus the browser client:
+
+            POST   /api/sessions                  -> {"session": id}
+            DELETE /api/sessions/ID
+            POST   /api/sessions/ID/run           {"code": ...} -> {"job": n}
+            POST   /api/sessions/ID/explain       {"code": ...} -> {"job": n}
+            POST   /api/sessions/ID/reset
+            POST   /api/sessions/ID/stop          -> {"stopped": bool}
+            GET    /api/sessions/ID/events?since=N   (long poll) -> {"events": [...]}
+            GET    /api/stats
+        """
+
+        server_version = "CodeTutor"
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            parts = url.path.strip("/").split("/")
+            tutor = self.server.tutor
+            if url.path == "/":
+                self._reply(200, _CLIENT_PAGE.encode(), "text/html; charset=utf-8")
+            elif parts == ["api", "stats"]:
+                self._reply_json(200, tutor.stats())
+            elif len(parts) == 4 and parts[:2] == ["api", "sessions"] and parts[3] == "events":
+                query = urllib.parse.parse_qs(url.query)
+                since = int(query.get("since", ["0"])[0])
+                self._with_session(lambda: {"events": tutor.events(parts[2], since)})
+            else:
+                self._reply_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            parts = urllib.parse.urlsplit(self.path).path.strip("/").split("/")
+            tutor = self.server.tutor
+            body = self._read_json()
+            if body is None:
+                return
+            if parts == ["api", "sessions"]:
+                self._reply_json(200, {"session": tutor.create_session()})
+            elif len(parts) == 4 and parts[:2] == ["api", "sessions"]:
+                session_id, action = parts[2], parts[3]
+                if action in ("run", "explain", "reset"):
+                    self._with_session(
+                        lambda: {"job": tutor.submit(session_id, action, str(body.get("code", "")))}
+                    )
+                elif action == "stop":
+                    self._with_session(lambda: {"stopped": tutor.stop(session_id)})
+                else:
+                    self._reply_json(404, {"error": "not found"})
+            else:
+                self._reply_json(404, {"error": "not found"})
+
+        def do_DELETE(self):
+            parts = urllib.parse.urlsplit(self.path).path.strip("/").split("/")
+            if len(parts) == 3 and parts[:2] == ["api", "sessions"]:
+                self.server.tutor.close_session(parts[2])
+                self._reply_json(200, {})
+            else:
+                self._reply_json(404, {"error": "not found"})
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > SERVER_MAX_BODY:
+                self._reply_json(413, {"error": "request too large"})
+                return None
+            try:
+                return json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._reply_json(400, {"error": "bad JSON"})
+                return None
+
+        def _with_session(self, action):
+            try:
+                self._reply_json(200, action())
+            except KeyError:
+                self._reply_json(404, {"error": "no such session"})
+
+        def _reply_json(self, status, data):
+            self._reply(status, json.dumps(data).encode(), "application/json")
+
+        def _reply(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # long polls would flood the terminal
+
+    return _SessionRequestHandler
+
+
+# The thin browser client served at /
+_CLIENT_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Code Tutor</title>
+<style>
+ body { font-family: sans-serif; margin: 1em; }
+ textarea, pre { width: 100%; box-sizing: border-box; font: 14px Consolas, monospace; }
+ textarea { height: 14em; }
+ pre { height: 18em; overflow: auto; background: #f5f5f5; padding: 4px; white-space: pre-wrap; }
+ #status { color: #555; }
+</style></head>
+<body>
+<h3>Code Tutor</h3>
+<textarea id="code" spellcheck="false">count = 0
+for i in range(1, 5):
+    count += i
+print(count)
+</textarea>
+<p>
+ <button onclick="send('run')">Run</button>
+ <button onclick="send('explain')">Explain Step-by-Step</button>
+ <button onclick="send('stop')">Stop</button>
+ <button onclick="send('reset')">Reset Env</button>
+ <button onclick="out.textContent = ''">Clear Output</button>
+ <span id="status"></span>
+</p>
+<pre id="out"></pre>
+<script>
+const out = document.getElementById("out");
+const status = document.getElementById("status");
+let session = sessionStorage.getItem("tutor-session");
+let since = 0;
+
+async function api(method, path, body) {
+  const response = await fetch(path, {method, body: body && JSON.stringify(body)});
+  return [response.status, await response.json()];
+}
+
+async function newSession() {
+  const [, data] = await api("POST", "/api/sessions", {});
+  session = data.session;
+  since = 0;
+  sessionStorage.setItem("tutor-session", session);
+}
+
+async function send(action) {
+  const code = document.getElementById("code").value;
+  if (action === "run" || action === "explain") {
+    const label = action === "run" ? "Run" : "Step-by-step";
+    out.textContent += `--- ${label} at ${new Date().toLocaleTimeString()} ---\\n`;
+  }
+  status.textContent = action === "stop" ? "Stopping..." : "Working...";
+  await api("POST", `/api/sessions/${session}/${action}`, {code});
+}
+
+async function poll() {
+  for (;;) {
+    try {
+      const [code, data] = await api("GET", `/api/sessions/${session}/events?since=${since}`);
+      if (code === 404) { await newSession(); continue; }
+      for (const event of data.events) {
+        since = event.seq;
+        if (event.type === "output") out.textContent += event.text;
+        if (event.type === "done") {
+          out.textContent += event.kind === "reset" ? "[Environment reset]\\n\\n" : "\\n";
+          status.textContent = "Done at " + new Date().toLocaleTimeString();
+        }
+      }
+      out.scrollTop = out.scrollHeight;
+    } catch (e) {
+      await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+  }
+}
+
+(async () => { if (!session) await newSession(); poll(); })();
+</script>
+</body></html>
+"""
+
+
+def _serve_main(args):
+    tutor = SessionServer(workers=args.jobs, time_limit=args.timeout)
+    from http.server import ThreadingHTTPServer
+
+    httpd = ThreadingHTTPServer((args.host, args.port), _session_request_handler())
+    httpd.daemon_threads = True
+    httpd.tutor = tutor
+    host, port = httpd.server_address[:2]
+    print(f"Code Tutor server on http://{host}:{port}/ with {len(tutor.workers)} kernel(s)")
+    print("Anyone who can reach this address can run code on this machine. Ctrl+C to stop.")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        tutor.shutdown()
+    return 0
+
+
+# ---------------- STARTUP PROFILE ----------------
+
+def _process_age():
+    """Seconds since this process was started (Linux), or None."""
+    try:
+        with open("/proc/self/stat") as f:
+            # the command name may contain spaces, so count fields after ")"
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfile:
+    """Time-to-first-paint breakdown for --startup-profile."""
+
+    def __init__(self):
+        now = time.perf_counter()
+        age = _process_age()
+        self.marks = []  # (phase, perf_counter at its end)
+        if age is not None and now - age < _IMPORTS_STARTED:
+            self.marks.append(("process start", now - age))
+            self.marks.append(("python startup + compiling this file", _IMPORTS_STARTED))
+        else:
+            self.marks.append(("process start", _IMPORTS_STARTED))
+        self.marks.append(("imports", _IMPORTS_DONE))
+        self.marks.append(("module setup + arguments", now))
+
+    def mark(self, phase):
+        self.marks.append((phase, time.perf_counter()))
+
+    def report(self):
+        started = self.marks[0][1]
+        lines = [f"{'phase':40} {'ms':>8} {'total ms':>9}"]
+        for (_, previous), (phase, at) in zip(self.marks, self.marks[1:]):
+            lines.append(f"{phase:40} {(at - previous) * 1000:>8.1f} {(at - started) * 1000:>9.1f}")
+        painted = dict(self.marks).get("first paint")
+        if painted is not None:
+            lines.append(f"\nTime to first paint: {(painted - started) * 1000:.0f} ms")
+        lines.append(f"Ready: {(self.marks[-1][1] - started) * 1000:.0f} ms")
+        return "\n".join(lines)
+
+
+def main():
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Code Tutor - a tiny Python notebook for learners.")
+    parser.add_argument("--batch", metavar="PATH",
+                        help="run every .py file in PATH (or one file) without a window")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="kernel processes for --batch or --serve (default: one per core)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="seconds allowed per submission in --batch (default: 10) "
+                             f"or per run in --serve (default: {SERVER_TIME_LIMIT})")
+    parser.add_argument("--explain", action="store_true",
+                        help="also record the step-by-step explanation in --batch")
+    parser.add_argument("--report", metavar="FILE",
+                        help="write the --batch results to FILE (.json or .csv)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time the run/trace/format/output paths and print a report")
+    parser.add_argument("--benchmark-out", metavar="FILE",
+                        help="save --benchmark results as JSON (a baseline for --compare)")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare --benchmark results with a saved baseline")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="timing repetitions per --benchmark measurement; --compare needs 5 or more "
+                             "to report a regression (default: 5)")
+    parser.add_argument("--serve", action="store_true",
+                        help="host many sessions in one process for a browser client (classroom mode)")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address for --serve (default: 127.0.0.1; use 0.0.0.0 for the whole lab)")
+    parser.add_argument("--port", type=int, default=8765,
+                        help="port for --serve (default: 8765)")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="open the window, print how long each startup phase took, then quit")
+    args = parser.parse_args()
+
+    if args.batch:
+        if args.timeout is None:
+            args.timeout = 10.0
+        sys.exit(_batch_main(args))
+    if args.serve:
+        if args.timeout is None:
+            args.timeout = SERVER_TIME_LIMIT
+        sys.exit(_serve_main(args))
+    if args.benchmark:
+        sys.exit(_benchmark_main(args))
+
+    startup = StartupProfile() if args.startup_profile else None
+    root = tk.Tk()
+    if startup is not None:
+        startup.mark("Tk root window")
+    app = MiniNotebookApp(root, startup=startup)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
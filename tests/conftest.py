@@ -0,0 +1,52 @@
+import marshal
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+# code_tutor.py is a single script, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Kernels keep caches and autosaves under ~/.code_tutor: not the real one
+os.environ["HOME"] = tempfile.mkdtemp(prefix="code_tutor_tests_")
+
+
+class KernelClient:
+    """A kernel and what its jobs printed, for tests that drive one like the app does."""
+
+    def __init__(self, kernel):
+        self.kernel = kernel
+
+    def finish(self, job_id, answers=(), timeout=30):
+        """Wait for a job's reply: (what it printed, the reply). input() gets answers, then EOF."""
+        import code_tutor
+        answers = list(answers)
+        printed = []
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            code_tutor.wait_for_connections([self.kernel.conn], timeout=0.05)
+            for msg in self.kernel.poll():
+                if msg["id"] != job_id:
+                    continue
+                if msg["op"] == "stream":
+                    printed.append(msg["data"])
+                elif msg["op"] == "input_request":
+                    self.kernel.answer(job_id, answers.pop(0) if answers else None)
+                elif msg["op"] != "started":
+                    return "".join(printed), msg
+        raise AssertionError(f"job {job_id} did not finish in {timeout} s")
+
+    def run(self, source, answers=(), budgets=None, op="exec", **fields):
+        code = marshal.dumps(compile(source, "<string>", "exec"))
+        job_id = self.kernel.submit(op, code=code, source=source, budgets=budgets, **fields)
+        return self.finish(job_id, answers)
+
+
+@pytest.fixture
+def kernel():
+    from code_tutor import Kernel
+    client = KernelClient(Kernel())
+    yield client
+    client.kernel.shutdown()
@@ -0,0 +1,80 @@
+import csv
+import json
+
+import pytest
+
+from code_tutor import run_batch, write_batch_report
+
+SUBMISSIONS = {
+    "good.py": ("print('hello')\nprint(6 * 7)\n", "hello\n42  \n\n"),
+    "wrong.py": ("print('hello')\nprint(6 * 9)\n", "hello\n42\n"),
+    "crash.py": ("print('before')\n1 / 0\n", "before\n"),
+    "broken.py": ("print('unclosed'\n", None),
+    "quits.py": ("import sys\nprint('bye')\nsys.exit(3)\n", "bye\n"),
+    "done.py": ("import sys\nprint('bye')\nsys.exit()\n", "bye\n"),
+    "says.py": ("import sys\nsys.exit('no more')\n", None),
+    "asks.py": ("name = input('Name? ')\nprint('Hi', name)\ninput()\n", None),
+    "forever.py": ("while True:\n    pass\n", None),
+}
+
+
+@pytest.fixture(scope="module")
+def results(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("submissions")
+    for name, (source, expected) in SUBMISSIONS.items():
+        (folder / name).write_text(source)
+        if expected is not None:
+            (folder / name).with_suffix(".expected").write_text(expected)
+    (folder / "asks.in").write_text("Ada\n")
+    ran = run_batch(sorted(folder.glob("*.py")), jobs=2, timeout=2.0)
+    return {result["file"].rsplit("/", 1)[-1]: result for result in ran}
+
+
+def test_output_is_graded_against_the_expected_file(results):
+    assert results["good.py"]["status"] == "ok"
+    assert results["good.py"]["passed"]  # trailing spaces and blank lines don't count
+    assert results["wrong.py"]["status"] == "ok"
+    assert not results["wrong.py"]["passed"]
+    assert "passed" not in results["forever.py"]
+
+
+def test_errors_fail_even_when_the_output_matches(results):
+    assert results["crash.py"]["status"] == "error"
+    assert "ZeroDivisionError" in results["crash.py"]["error"]
+    assert results["crash.py"]["output"].startswith("before\n")
+    assert not results["crash.py"]["passed"]
+    assert results["broken.py"]["status"] == "syntax-error"
+
+
+def test_a_non_zero_exit_code_is_its_own_status(results):
+    assert results["quits.py"]["status"] == "exit"
+    assert results["quits.py"]["exit_code"] == 3
+    assert not results["quits.py"]["passed"]
+    assert results["done.py"]["status"] == "ok"
+    assert results["done.py"]["exit_code"] == 0
+    assert results["done.py"]["passed"]
+    assert results["says.py"]["exit_code"] == 1
+    assert results["says.py"]["output"] == "no more\n"
+
+
+def test_input_reads_the_in_file_then_gets_eof(results):
+    asks = results["asks.py"]
+    assert asks["output"].startswith("Name? Hi Ada\n")
+    assert asks["status"] == "error"
+    assert "EOFError" in asks["error"]
+
+
+def test_a_run_past_the_time_limit_times_out(results):
+    assert results["forever.py"]["status"] == "timeout"
+
+
+def test_reports_carry_the_exit_code(results, tmp_path):
+    write_batch_report(list(results.values()), str(tmp_path / "report.json"))
+    write_batch_report(list(results.values()), str(tmp_path / "report.csv"))
+    report = json.loads((tmp_path / "report.json").read_text())
+    report = {r["file"].rsplit("/", 1)[-1]: r for r in report}
+    assert report["quits.py"]["exit_code"] == 3
+    with open(tmp_path / "report.csv", newline="") as f:
+        rows = {row["file"].rsplit("/", 1)[-1]: row for row in csv.DictReader(f)}
+    assert rows["quits.py"]["status"] == "exit"
+    assert rows["quits.py"]["exit_code"] == "3"
@@ -0,0 +1,50 @@
+import pytest
+
+from code_tutor import RUN_BUDGETS, _budget_message
+
+RUNAWAYS = {
+    "cpu_seconds": (1, "while True:\n    pass\n"),
+    "memory": (64 * 1024 * 1024, "hoard = bytearray(512 * 1024 * 1024)\n"),
+    "output": (1000, "while True:\n    print('spam')\n"),
+    "recursion": (50, "def down(n):\n    return down(n + 1)\n\ndown(0)\n"),
+}
+
+
+@pytest.mark.parametrize("budget", sorted(RUNAWAYS))
+def test_a_budget_stops_the_run_and_says_why(kernel, budget):
+    limit, source = RUNAWAYS[budget]
+    printed, reply = kernel.run(source, budgets={budget: limit})
+    assert reply["usage"]["budget"] == budget
+    assert f"[Stopped: {_budget_message(budget, limit)}]" in reply["error"]
+    assert "code_tutor.py" not in reply["error"]
+
+    # the limits are lifted again for the next run
+    printed, reply = kernel.run("print(len(bytearray(128 * 1024 * 1024)))\nprint('x' * 2000)")
+    assert reply["error"] is None
+    assert reply["usage"]["budget"] is None
+    assert printed.startswith("134217728\n")
+
+
+def test_output_stops_at_the_budget(kernel):
+    printed, reply = kernel.run("while True:\n    print('spam')\n", budgets={"output": 1000})
+    assert len(printed) < 2000
+    assert printed.startswith("spam\n")
+
+
+def test_the_environment_survives_a_budget(kernel):
+    kernel.run("total = 0\nwhile True:\n    total += 1\n", budgets={"cpu_seconds": 1})
+    printed, _ = kernel.run("print(total > 0)")
+    assert printed == "True\n"
+
+
+def test_except_exception_cant_swallow_a_budget(kernel):
+    source = "while True:\n    try:\n        print('again')\n    except Exception:\n        pass\n"
+    _, reply = kernel.run(source, budgets={"output": 1000})
+    assert reply["usage"]["budget"] == "output"
+
+
+def test_the_default_budgets_let_ordinary_code_run(kernel):
+    printed, reply = kernel.run("print(sum(range(10 ** 6)))", budgets=RUN_BUDGETS)
+    assert reply["error"] is None
+    assert printed == "499999500000\n"
+    assert reply["usage"]["peak_rss"] > 0
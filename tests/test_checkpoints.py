@@ -0,0 +1,49 @@
+import pytest
+
+from code_tutor import CHECKPOINTS_SUPPORTED
+
+pytestmark = pytest.mark.skipif(not CHECKPOINTS_SUPPORTED, reason="checkpoints need Linux")
+
+
+def checkpoint(kernel, label):
+    _, reply = kernel.finish(kernel.kernel.submit("checkpoint", label=label))
+    return reply["checkpoint"]
+
+
+def restore(kernel, checkpoint_id):
+    _, reply = kernel.finish(kernel.kernel.submit("restore", checkpoint=checkpoint_id))
+    assert "error" not in reply
+    return reply
+
+
+def test_restore_rolls_the_environment_back(kernel):
+    kernel.run("numbers = [1, 2]\nname = 'Ada'")
+    first = checkpoint(kernel, "first")
+    kernel.run("numbers.append(3)\nname = 'Grace'\nextra = True")
+    old_pid = kernel.kernel.pid
+
+    reply = restore(kernel, first)
+    assert reply["restored"] == first
+    assert kernel.kernel.pid != old_pid
+    assert kernel.kernel.is_alive()
+    printed, reply = kernel.run("print(numbers, name, 'extra' in globals())")
+    assert printed == "[1, 2] Ada False\n"
+
+
+def test_a_checkpoint_can_be_restored_again(kernel):
+    kernel.run("x = 1")
+    first = checkpoint(kernel, "x is 1")
+    second = checkpoint(kernel, "also x is 1")
+    for value in (2, 3):
+        kernel.run(f"x = {value}")
+        reply = restore(kernel, first)
+        assert [c["id"] for c in reply["checkpoints"]] == [first, second]
+        printed, _ = kernel.run("print(x)")
+        assert printed == "1\n"
+
+
+def test_restoring_a_missing_checkpoint_says_so(kernel):
+    _, reply = kernel.finish(kernel.kernel.submit("restore", checkpoint=99))
+    assert reply["error"] == "That checkpoint is gone"
+    printed, _ = kernel.run("print('still here')")
+    assert printed == "still here\n"
@@ -0,0 +1,57 @@
+import pickle
+import random
+
+from code_tutor import TRACE_KEYFRAME_INTERVAL, ColumnarTrace
+
+
+def random_steps(count, seed=1):
+    rng = random.Random(seed)
+    names = [f"v{i}" for i in range(8)]
+    steps = []
+    for _ in range(count):
+        changes = []
+        for name in rng.sample(names, rng.randint(0, 3)):
+            changes.append((name, None if rng.random() < 0.2 else str(rng.randint(0, 50))))
+        steps.append((rng.randint(1, 30), tuple(changes)))
+    return steps
+
+
+def test_locals_at_matches_replaying_every_step():
+    steps = random_steps(3 * TRACE_KEYFRAME_INTERVAL + 17)
+    trace = ColumnarTrace()
+    expected = []
+    order = {}  # name -> when it first appeared, which is locals_at's order
+    state = {}
+    for lineno, changes in steps:
+        trace.append(lineno, changes)
+        for name, rep in changes:
+            order.setdefault(name, len(order))
+            if rep is None:
+                state.pop(name, None)
+            else:
+                state[name] = rep
+        expected.append(sorted(state.items(), key=lambda item: order[item[0]]))
+
+    assert len(trace) == len(steps)
+    for step in range(len(steps)):
+        assert trace.locals_at(step) == expected[step], step
+    assert list(trace.lines) == [lineno for lineno, _changes in steps]
+
+
+def test_repeated_text_is_stored_once():
+    trace = ColumnarTrace()
+    for _ in range(1000):
+        trace.append(1, (("x", "'the same long value'"),))
+    assert trace.reprs == ["'the same long value'"]
+    assert trace.names == ["x"]
+
+
+def test_message_round_trip():
+    trace = ColumnarTrace()
+    for lineno, changes in random_steps(TRACE_KEYFRAME_INTERVAL + 5, seed=2):
+        trace.append(lineno, changes)
+    trace.append(0, ())  # the program's end state
+    copy = ColumnarTrace.from_message(pickle.loads(pickle.dumps(trace.to_message())))
+    assert len(copy) == len(trace)
+    for step in (0, TRACE_KEYFRAME_INTERVAL - 1, TRACE_KEYFRAME_INTERVAL, len(trace) - 1):
+        assert copy.locals_at(step) == trace.locals_at(step)
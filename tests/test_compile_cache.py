@@ -0,0 +1,37 @@
+from code_tutor import CompileCache
+
+
+def test_same_source_is_compiled_once():
+    cache = CompileCache()
+    first = cache.compile("x = 1\n")
+    assert cache.compile("x = 1\n") is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_mode_and_filename_are_part_of_the_key():
+    cache = CompileCache()
+    as_exec = cache.compile("1 + 1")
+    assert cache.compile("1 + 1", mode="eval") is not as_exec
+    assert cache.compile("1 + 1", filename="<other>") is not as_exec
+    assert cache.misses == 3
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = CompileCache(maxsize=2)
+    a = cache.compile("a = 1")
+    cache.compile("b = 2")
+    cache.compile("a = 1")  # a is now the most recently used
+    cache.compile("c = 3")  # so b goes
+    assert cache.compile("a = 1") is a
+    misses = cache.misses
+    cache.compile("b = 2")
+    assert cache.misses == misses + 1
+
+
+def test_add_prefills_the_cache():
+    cache = CompileCache()
+    code = compile("y = 2", "<string>", "exec")
+    cache.add("y = 2", code)
+    assert cache.compile("y = 2") is code
+    assert cache.prefilled == 1
+    assert "Compiled while typing: 1" in cache.stats()
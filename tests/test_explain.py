@@ -0,0 +1,64 @@
+import pytest
+
+from code_tutor import WIDE_NAMESPACE, NamespaceDiff, bounded_repr
+
+
+@pytest.mark.parametrize("value", [
+    [1, "two", (3,), {4: None}],
+    {"a": [1, 2], "b": frozenset()},
+    "it's",
+    'say "hi"',
+    set(),
+    3.5,
+])
+def test_short_values_match_repr(value):
+    assert bounded_repr(value) == repr(value)
+
+
+def test_long_values_are_cut():
+    rep = bounded_repr(list(range(1_000_000)), limit=20)
+    assert rep == repr(list(range(1_000_000)))[:17] + "..."
+
+
+def test_cut_string_keeps_the_quote_repr_would_pick():
+    assert bounded_repr("it's " * 100, limit=12).startswith('"')
+    assert bounded_repr("plain " * 100, limit=12).startswith("'")
+
+
+def test_self_containing_list():
+    value = [1]
+    value.append(value)
+    assert bounded_repr(value) == "[1, [...]]"
+
+
+def test_unreprable_value():
+    class Broken:
+        def __repr__(self):
+            raise RuntimeError
+
+    assert bounded_repr(Broken()) == "<unreprable Broken>"
+
+
+@pytest.mark.parametrize("size", [3, WIDE_NAMESPACE + 10])
+def test_namespace_diff_reports_only_changes(size):
+    diff = NamespaceDiff()
+    namespace = {f"v{i}": i for i in range(size)}
+    namespace["items"] = [1]
+    scope = object()
+    assert len(diff.changes(namespace, scope)) == size + 1
+    assert diff.changes(namespace, scope) == ()
+
+    namespace["v0"] = "changed"
+    namespace["items"].append(2)
+    namespace["new"] = None
+    assert sorted(diff.changes(namespace, scope)) == [
+        ("items", "[1, 2]"), ("new", "None"), ("v0", "'changed'"),
+    ]
+
+    del namespace["new"]
+    assert diff.changes(namespace, scope) == (("new", None),)
+
+
+def test_namespace_diff_skips_dunders():
+    assert NamespaceDiff().changes({"__builtins__": {}, "x": 1}) == (("x", "1"),)
+
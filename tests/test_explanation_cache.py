@@ -0,0 +1,57 @@
+import os
+
+from code_tutor import ExplanationCache, _KernelWorker
+
+RUNAWAY = "def f(n):\n    return f(n + 1)\nf(0)\n"
+
+
+def traced_worker(directory):
+    """A kernel worker's tracing half, run in this process."""
+    worker = _KernelWorker.__new__(_KernelWorker)
+    worker.explain_cache = ExplanationCache(str(directory))
+    worker._usage = {}
+    return worker
+
+
+def test_entries_round_trip(tmp_path):
+    cache = ExplanationCache(str(tmp_path))
+    key = cache.key("explain", "x = 1\n", 100)
+    assert not cache.has(key)
+    cache.put(key, {"explanation": "Step 1"})
+    assert cache.has(key)
+    assert cache.get(key) == {"explanation": "Step 1"}
+    assert cache.key("explain", "x = 1", 100) == key  # Tk's trailing newline doesn't matter
+    assert cache.key("trace", "x = 1\n", 100) != key
+
+
+def test_a_trace_is_cached(tmp_path):
+    worker = traced_worker(tmp_path)
+    source = "x = 1\ny = x + 1\n"
+    first = worker._trace(source, compile(source, "<string>", "exec"), 100)
+    assert not first.get("cached")
+    assert worker._trace(source, compile(source, "<string>", "exec"), 100)["cached"]
+
+
+def test_a_budget_trip_is_not_cached(tmp_path):
+    worker = traced_worker(tmp_path)
+    stopped = worker._trace(RUNAWAY, compile(RUNAWAY, "<string>", "exec"), 1000, {"recursion": 50})
+    assert "[Stopped:" in stopped["printed"]
+    assert stopped["interrupted"]
+    assert not os.listdir(tmp_path)
+
+    explanation = []
+    worker._explain(
+        RUNAWAY, compile(RUNAWAY, "<string>", "exec"), 1000, _Lines(explanation), {"recursion": 50}
+    )
+    assert not os.listdir(tmp_path)
+
+    unlimited = worker._trace(RUNAWAY, compile(RUNAWAY, "<string>", "exec"), 1000)
+    assert "[Stopped:" not in unlimited["printed"]
+
+
+class _Lines:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def write(self, text):
+        self.lines.append(text)
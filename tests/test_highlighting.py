@@ -0,0 +1,43 @@
+from code_tutor import lex_python_line
+
+
+def tagged(line, state=None):
+    spans, state = lex_python_line(line, state)
+    return [(tag, line[start:end]) for tag, start, end in spans], state
+
+
+def test_keywords_builtins_and_definitions():
+    spans, state = tagged("def greet(name): return len(name)")
+    assert spans == [
+        ("KEYWORD", "def"), ("DEFINITION", "greet"), ("KEYWORD", "return"), ("BUILTIN", "len"),
+    ]
+    assert state is None
+
+
+def test_strings_and_comments():
+    spans, _state = tagged("x = 'a # b' # real comment")
+    assert spans == [("STRING", "'a # b'"), ("COMMENT", "# real comment")]
+
+
+def test_escaped_quote_stays_inside_the_string():
+    spans, _state = tagged(r'print("say \"hi\"")')
+    assert spans == [("BUILTIN", "print"), ("STRING", r'"say \"hi\""')]
+
+
+def test_triple_quoted_string_carries_over_lines():
+    spans, state = tagged('text = """first')
+    assert spans == [("STRING", '"""first')]
+    assert state == '"""'
+    spans, state = tagged("still inside", state)
+    assert spans == [("STRING", "still inside")]
+    assert state == '"""'
+    spans, state = tagged('end""" if True else None', state)
+    assert spans == [("STRING", 'end"""'), ("KEYWORD", "if"), ("KEYWORD", "True"),
+                     ("KEYWORD", "else"), ("KEYWORD", "None")]
+    assert state is None
+
+
+def test_triple_quoted_string_closed_on_the_same_line():
+    spans, state = tagged("s = '''one''' + str(2)")
+    assert spans == [("STRING", "'''one'''"), ("BUILTIN", "str")]
+    assert state is None
@@ -0,0 +1,109 @@
+import pytest
+
+from code_tutor import IncrementalRunner
+
+
+class _Stream:
+    """Stands in for the kernel's output stream: the runner only counts what was printed."""
+
+    chars_written = 0
+
+
+def run_twice(source):
+    runner = IncrementalRunner()
+    env = {}
+    runner.run(source, env, _Stream())
+    counts = runner.run(source, env, _Stream())
+    return env, counts
+
+
+def normal_run(source):
+    env = {}
+    exec(source, env)
+    return env
+
+
+@pytest.mark.parametrize("source, name", [
+    ("a = [1]\nb = a\nb.append(2)\n", "a"),
+    ("a = [1]\nf = a.append\nf(2)\n", "a"),
+    ("a = [[0]]\ninner = a[0]\ninner.append(1)\n", "a"),
+    ("acc = []\nadd = lambda v: acc.append(v)\nadd(1)\nsz = len(acc)\n", "acc"),
+    ("acc = []\nops = {'add': lambda v: acc.append(v)}\nops['add'](1)\n", "acc"),
+    ("acc = []\ndef add(v):\n    acc.append(v)\nadd(1)\n", "acc"),
+])
+def test_changes_through_another_name_match_a_normal_run(source, name):
+    env, _counts = run_twice(source)
+    assert env[name] == normal_run(source)[name]
+
+
+def test_lambda_results_match_a_normal_run():
+    source = "acc = []\nadd = lambda v: acc.append(v)\nadd(1)\nsz = len(acc)\n"
+    env, _counts = run_twice(source)
+    assert (env["acc"], env["sz"]) == ([1], 1)
+
+
+def test_unchanged_statements_are_reused():
+    env, counts = run_twice("x = [1, 2]\ny = sum(x)\nz = y * 2\n")
+    assert counts == (0, 3)
+    assert env["z"] == 6
+
+
+def test_edit_reruns_only_what_depends_on_it():
+    runner = IncrementalRunner()
+    env = {}
+    runner.run("x = 1\ny = 10\nz = x + 1\n", env, _Stream())
+    ran, reused = runner.run("x = 2\ny = 10\nz = x + 1\n", env, _Stream())
+    assert (ran, reused) == (2, 1)
+    assert env["z"] == 3
+
+
+def test_removing_the_change_in_place_restores_the_value():
+    runner = IncrementalRunner()
+    env = {}
+    runner.run("a = [1]\nb = a\nb.append(2)\n", env, _Stream())
+    runner.run("a = [1]\nb = a\n", env, _Stream())
+    assert env["a"] == [1]
+
+
+def test_forget_reruns_everything():
+    runner = IncrementalRunner()
+    env = {}
+    runner.run("x = [1]\n", env, _Stream())
+    runner.forget()
+    assert runner.run("x = [1]\n", env, _Stream()) == (1, 0)
+
+
+def test_augmented_assignment_runs_again_each_time():
+    runner = IncrementalRunner()
+    env = {}
+    runner.run("clicks = 0\n", env, _Stream())
+    runner.run("clicks += 1\n", env, _Stream())
+    runner.run("clicks += 1\n", env, _Stream())
+    assert env["clicks"] == 2
+
+
+def comparable(env):
+    return {
+        name: repr(value) for name, value in env.items()
+        if not name.startswith("__") and not callable(value)
+    }
+
+
+@pytest.mark.parametrize("buffers", [
+    ["a = [1, 2]\nb = a\n", "a = [1, 2]\nb.append(3)\nb = a\n"],
+    ["a = [1, 2]\nb = a\n", "a = [1, 2]\nd = b\nd.append(3)\n"],
+    ["a = [[0]]\nfirst = a[0]\n", "a = [[0]]\nfirst.append(1)\nfirst = a[0]\n"],
+    ["a = [1]\nf = a.append\n", "a = [1]\nf(2)\n", "a = [1]\n"],
+    ["acc = []\nadd = lambda v: acc.append(v)\n", "acc = []\nadd(1)\nsz = len(acc)\n"],
+    ["d = {'k': []}\nitems = d['k']\n", "d = {'k': []}\nitems.append(1)\n", "d = {'k': []}\n"],
+    ["x = 1\ny = [x]\n", "x = 2\ny = [x]\n", "x = 1\ny = [x]\ny.append(x)\n"],
+    ["clicks = 0\n", "clicks += 1\n", "clicks += 1\n", "clicks = 0\nclicks += 1\n"],
+    ["def grow(v):\n    v.append(0)\nbox = []\n", "box = []\ngrow(box)\n", "box = []\n"],
+])
+def test_edited_buffers_match_plain_exec(buffers):
+    runner = IncrementalRunner()
+    incremental, plain = {}, {}
+    for source in buffers:
+        runner.run(source, incremental, _Stream())
+        exec(source, plain)
+        assert comparable(incremental) == comparable(plain), source
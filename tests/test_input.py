@@ -0,0 +1,35 @@
+def test_input_is_answered_by_the_app(kernel):
+    printed, reply = kernel.run(
+        "name = input('Name? ')\nage = int(input('Age? '))\nprint(name, age + 1)",
+        answers=["Ada", "36"],
+    )
+    assert reply["error"] is None
+    assert printed == "Name? Age? Ada 37\n"
+
+
+def test_no_answer_is_end_of_file(kernel):
+    printed, reply = kernel.run(
+        "lines = []\n"
+        "while True:\n"
+        "    try:\n"
+        "        lines.append(input())\n"
+        "    except EOFError:\n"
+        "        break\n"
+        "print(lines)",
+        answers=["one", "two"],
+    )
+    assert reply["error"] is None
+    assert printed == "['one', 'two']\n"
+
+
+def test_an_unhandled_eof_is_a_normal_error(kernel):
+    printed, reply = kernel.run("input('? ')")
+    assert "EOFError: EOF when reading a line" in reply["error"]
+    printed, reply = kernel.run("print('the kernel carries on')")
+    assert printed == "the kernel carries on\n"
+
+
+def test_explanations_dont_wait_for_input(kernel):
+    source = "word = input()\nprint(word * 2)\n"
+    _, reply = kernel.run(source, op="explain", max_steps=100)
+    assert "EOFError: input() can only be answered during Run" in reply["printed"]
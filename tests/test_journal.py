@@ -0,0 +1,89 @@
+import json
+import random
+import time
+
+import pytest
+
+import code_tutor
+from code_tutor import JournalWriter, _text_diff, replay_journal
+
+
+def apply(old, diff):
+    at, cut, inserted = diff
+    return old[:at] + inserted + old[at + cut:]
+
+
+@pytest.mark.parametrize("old, new", [
+    ("", "abc"),
+    ("abc", ""),
+    ("hello world", "hello, world"),
+    ("aa", "aaa"),
+    ("aaa", "aa"),
+    ("same", "same"),
+    ("x = 1\ny = 2\n", "x = 1\nz = 3\ny = 2\n"),
+])
+def test_text_diff_rebuilds_the_new_text(old, new):
+    assert apply(old, _text_diff(old, new)) == new
+
+
+def test_text_diff_is_small_for_a_small_edit():
+    old = "line\n" * 1000
+    new = old[:2500] + "edit" + old[2500:]
+    assert _text_diff(old, new) == (2500, 0, "edit")
+
+
+def test_text_diff_random_edits():
+    rng = random.Random(3)
+    for _ in range(200):
+        old = "".join(rng.choice("ab\n") for _ in range(rng.randint(0, 20)))
+        new = "".join(rng.choice("ab\n") for _ in range(rng.randint(0, 20)))
+        assert apply(old, _text_diff(old, new)) == new
+
+
+def write_records(path, *records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+
+
+def test_replay_applies_diffs_to_the_snapshot(tmp_path):
+    path = tmp_path / "editor.journal"
+    write_records(path, ["S", "print(1)\n"], ["D", 6, 1, "42"], ["D", 0, 0, "# hi\n"])
+    assert replay_journal(path) == "# hi\nprint(42)\n"
+
+
+def test_replay_stops_at_a_torn_last_line(tmp_path):
+    path = tmp_path / "editor.journal"
+    write_records(path, ["S", "abc"], ["D", 3, 0, "d"])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('["D", 4, 0, "e')  # the app died while writing this one
+    assert replay_journal(path) == "abcd"
+
+
+def test_replay_without_a_journal(tmp_path):
+    assert replay_journal(tmp_path / "missing.journal") is None
+
+
+def test_writer_round_trip_with_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(code_tutor, "AUTOSAVE_COMPACT_RECORDS", 3)
+    path = str(tmp_path / "editor.journal")
+    writer = JournalWriter(path)
+    assert writer.enabled
+    text = ""
+    for i in range(10):
+        text += f"line {i}\n"
+        writer.save(text)
+        time.sleep(0.01)  # let the writer record each edit on its own
+    writer.close()
+    assert replay_journal(path) == text
+    with open(path, encoding="utf-8") as f:
+        assert len(f.read().splitlines()) <= 4  # a snapshot and at most 3 diffs
+
+
+def test_second_writer_leaves_the_journal_alone(tmp_path):
+    pytest.importorskip("fcntl")
+    path = str(tmp_path / "editor.journal")
+    first = JournalWriter(path)
+    second = JournalWriter(path)
+    try:
+        assert first.enabled and not second.enabled
+    finally:
+        first.close()
@@ -0,0 +1,69 @@
+from code_tutor import format_kid_style, kid_style_formatter
+
+CODE = ["total = 0", "for i in range(2):", "    total += i"]
+STEPS = [
+    (1, ()),
+    (2, (("total", "0"),)),
+    (3, (("i", "0"),)),
+    (2, ()),
+    (3, (("i", "1"),)),
+    (2, (("total", "1"),)),
+]
+FINAL = ()
+
+
+def test_kid_style_explanation():
+    text = "\n".join(format_kid_style(STEPS, FINAL, CODE))
+    assert text.startswith("We are going to walk through your code one step at a time.")
+    assert "Step 1: We run this line:\n    total = 0\n  After this step:\n    • total is now 0" in text
+    assert "Step 2: We set up a loop:" in text
+    assert text.count("We set up a loop") == 1  # the loop header is only explained once
+    assert "• total goes from 0 to 1" in text
+    assert "Step 5" not in text
+
+
+def test_formatter_streams_each_step_when_the_next_arrives():
+    formatter = kid_style_formatter(CODE)
+    assert next(formatter) == []
+    first = formatter.send(STEPS[0])
+    assert first == ["We are going to walk through your code one step at a time."]
+    second = formatter.send(STEPS[1])
+    assert second[0] == "\nStep 1: We run this line:\n    total = 0"
+
+
+def test_streaming_gives_the_same_lines_as_formatting_at_the_end():
+    formatter = kid_style_formatter(CODE)
+    next(formatter)
+    streamed = []
+    for step in STEPS:
+        streamed.extend(formatter.send(step))
+    streamed.extend(formatter.send((None, FINAL)))
+    assert streamed == format_kid_style(STEPS, FINAL, CODE)
+
+
+def test_last_step_comes_out_with_the_final_changes():
+    formatter = kid_style_formatter(["x = 1"])
+    next(formatter)
+    assert formatter.send((1, ())) == ["We are going to walk through your code one step at a time."]
+    assert formatter.send((None, (("x", "1"),))) == [
+        "\nStep 1: We run this line:\n    x = 1", "  After this step:", "    • x is now 1",
+    ]
+
+
+def test_while_loops_and_removed_names():
+    code = ["n = 2", "while n:", "    n -= 1", "del n"]
+    steps = [
+        (1, ()), (2, (("n", "2"),)), (3, ()), (2, (("n", "1"),)), (3, ()), (2, (("n", "0"),)), (4, ()),
+    ]
+    text = "\n".join(format_kid_style(steps, (("n", None),), code))
+    assert text.count("We set up a while-loop") == 1
+    assert "• n goes from 2 to 1" in text
+    assert "• n used to be 0 here" in text
+
+
+def test_functions_are_left_out_and_quiet_steps_show_context():
+    code = ["def greet():", "    pass", "name = 'Ada'", "print(name)"]
+    steps = [(1, ()), (3, (("greet", "<function greet at 0x1>"),)), (4, (("name", "'Ada'"),))]
+    text = "\n".join(format_kid_style(steps, (), code))
+    assert "greet" not in text.replace("def greet():", "")
+    assert "Step 3: We run this line:\n    print(name)\n  Here we have: name is 'Ada'" in text
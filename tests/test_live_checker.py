@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from code_tutor import CompileCache, LiveChecker
+
+
+@pytest.fixture
+def checker():
+    return LiveChecker(CompileCache())
+
+
+def test_clean_code_fills_the_compile_cache(checker):
+    source = "x = 1\nprint(x)\n"
+    result = checker.check(1, source)
+    assert result.version == 1
+    assert result.error is None
+    assert result.undefined == []
+    checker.compile_cache.compile(source)
+    assert checker.compile_cache.hits == 1
+
+
+def test_syntax_error_is_located(checker):
+    result = checker.check(1, "x = 1\ny = (\n")
+    line, _start, _end, message = result.error
+    assert line == 2
+    assert message
+
+
+def test_compile_time_error_is_reported(checker):
+    result = checker.check(1, "x = 1\nreturn x\n")
+    assert result.error[0] == 2
+
+
+def test_undefined_names_are_underlined(checker):
+    result = checker.check(1, "total = 0\nprint(totl)\n")
+    assert result.undefined == [(2, 6, 10)]
+
+
+def test_names_known_to_the_kernel_are_not_undefined(checker):
+    assert checker.check(1, "print(answer)\n", known_names={"answer"}).undefined == []
+
+
+def test_names_bound_later_count_as_defined(checker):
+    source = "def f():\n    return helper()\n\ndef helper():\n    return 1\n"
+    assert checker.check(1, source).undefined == []
+
+
+def test_star_import_turns_off_undefined_names(checker):
+    assert checker.check(1, "from math import *\nprint(tau)\n").undefined == ()
+
+
+def test_unchanged_blocks_keep_their_line_numbers_right(checker):
+    checker.check(1, "a = 1\nprint(b)\n")
+    result = checker.check(2, "a = 1\n\n\nprint(b)\n")
+    assert result.undefined == [(4, 6, 7)]
+
+
+def test_fixing_an_error_reuses_the_blocks_below(checker):
+    checker.check(1, "x = (\ny = 2\nprint(z)\n")
+    result = checker.check(2, "x = 1\ny = 2\nprint(z)\n")
+    assert result.error is None
+    assert result.undefined == [(3, 6, 7)]
+
+
+def test_background_check_reports_the_newest_version(checker):
+    checker.submit(1, "x = (\n")
+    checker.submit(2, "x = 1\n")
+    deadline = time.monotonic() + 5
+    result = None
+    while time.monotonic() < deadline:
+        result = checker.poll() or result
+        if result is not None and result.version == 2:
+            break
+        time.sleep(0.01)
+    assert result.version == 2
+    assert result.error is None
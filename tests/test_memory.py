@@ -0,0 +1,67 @@
+import sys
+import time
+
+from code_tutor import deep_size
+
+
+def test_numbers_and_strings_are_their_own_size():
+    assert deep_size(12345) == (sys.getsizeof(12345, 0), [], True)
+    assert deep_size("text")[0] == sys.getsizeof("text", 0)
+
+
+def test_containers_count_what_they_hold():
+    values = [str(i) * 100 for i in range(10)]
+    total, parts, complete = deep_size(values)
+    assert complete
+    assert total == sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+    assert len(parts) == 10
+
+
+def test_biggest_parts_come_first():
+    value = {"small": "x", "big": "y" * 10_000}
+    _total, parts, _complete = deep_size(value)
+    assert parts[0][0] == "'big'"
+    assert parts[0][1] >= 10_000
+
+
+def test_shared_objects_count_once():
+    shared = "z" * 1000
+    once = deep_size([shared])[0]
+    twice = deep_size([shared, shared])[0]
+    assert twice - once == sys.getsizeof([shared, shared]) - sys.getsizeof([shared])
+
+
+def test_attributes_and_cycles():
+    class Node:
+        pass
+
+    node = Node()
+    node.payload = "p" * 500
+    node.self = node
+    total, parts, complete = deep_size(node)
+    assert complete
+    assert total >= 500
+    assert [label for label, _size in parts] == [".payload"]
+
+
+def test_budget_gives_a_lower_bound():
+    value = [[i] for i in range(1000)]
+    total, _parts, complete = deep_size(value, budget=100)
+    assert not complete
+    assert total < deep_size(value)[0]
+
+
+def test_budget_holds_inside_one_huge_member():
+    started = time.perf_counter()
+    total, _parts, complete = deep_size([[list(range(2_000_000))]], budget=100)
+    assert not complete
+    assert time.perf_counter() - started < 1
+    assert total > 0
+
+
+def test_huge_dict_keys_are_labelled_cheaply():
+    key = tuple(range(3_000_000))
+    started = time.perf_counter()
+    _total, parts, _complete = deep_size({key: 1}, budget=100)
+    assert time.perf_counter() - started < 1
+    assert len(parts[0][0]) <= 40
@@ -0,0 +1,38 @@
+import pytest
+
+from code_tutor import SpoolFile
+
+
+@pytest.fixture
+def spool():
+    spool = SpoolFile()
+    yield spool
+    spool.close()
+
+
+def test_lines_come_back_by_number(spool):
+    spool.append("first\nsec")
+    spool.append("ond\nthird")
+    assert spool.line_count == 3
+    assert spool.get_lines(0, 3) == "first\nsecond\nthird"
+    assert spool.get_lines(1, 2) == "second"
+    assert spool.get_lines(2, 99) == "third"
+    assert spool.get_lines(5, 9) == ""
+
+
+def test_appends_after_reading_are_seen(spool):
+    spool.append("a\n")
+    assert spool.get_lines(0, 1) == "a"
+    spool.append("b\n" * 10_000)
+    assert spool.line_count == 10_002
+    assert spool.get_lines(10_000, 10_002) == "b\n"
+
+
+def test_text_outside_ascii(spool):
+    spool.append("héllo wörld\n→ done\n")
+    assert spool.get_lines(0, 2) == "héllo wörld\n→ done"
+
+
+def test_empty_spool(spool):
+    assert spool.line_count == 1
+    assert spool.get_lines(0, 1) == ""
@@ -0,0 +1,81 @@
+import marshal
+import time
+
+from code_tutor import SessionServer, _format_user_traceback, _stop_message
+
+LOOP = "count = 0\nwhile True:\n    count += 1\n"
+
+
+def wait_until_started(kernel, job_id):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if any(msg["op"] == "started" for msg in kernel.kernel.poll() if msg["id"] == job_id):
+            return
+        time.sleep(0.01)
+    raise AssertionError("the job never started")
+
+
+def test_stop_keeps_the_environment(kernel):
+    job_id = kernel.kernel.submit(
+        "exec", code=marshal.dumps(compile(LOOP, "<string>", "exec")), announce_start=True
+    )
+    wait_until_started(kernel, job_id)
+    time.sleep(0.1)
+    kernel.kernel.interrupt(job_id)
+    printed, reply = kernel.finish(job_id)
+    assert "KeyboardInterrupt" in reply["error"]
+    assert "count" in reply["names"]
+    printed, _ = kernel.run("print(count > 0)")
+    assert printed == "True\n"
+
+
+def test_a_stop_meant_for_a_finished_job_is_ignored(kernel):
+    printed, _ = kernel.run("x = 1")
+    kernel.kernel.interrupt(1)  # that job is over
+    printed, reply = kernel.run("import time\ntime.sleep(0.3)\nprint(x)")
+    assert reply["error"] is None
+    assert printed == "1\n"
+
+
+def test_tracebacks_start_at_the_users_code(kernel):
+    printed, reply = kernel.run("def half(n):\n    return n / 0\n\nhalf(4)\n")
+    assert reply["error"] == printed
+    assert "code_tutor.py" not in printed
+    assert printed.startswith("Traceback (most recent call last):\n  File \"<string>\", line 4")
+    assert printed.endswith("ZeroDivisionError: division by zero\n")
+
+
+def test_tracebacks_keep_chained_exceptions():
+    def users_code():
+        try:
+            {}["key"]
+        except KeyError as e:
+            raise ValueError("no key") from e
+
+    try:
+        users_code()
+    except ValueError as e:
+        text = _format_user_traceback(e)
+    # this test file is not code_tutor.py, so its frames stay
+    assert "KeyError: 'key'" in text
+    assert "direct cause" in text
+    assert "ValueError: no key" in text
+
+
+def test_the_server_says_why_a_run_was_stopped():
+    server = SessionServer(workers=1, time_limit=1)
+    try:
+        session = server.create_session()
+        server.submit(session, "run", LOOP)
+        events, seen = [], 0
+        deadline = time.monotonic() + 30
+        while not any(event["type"] == "done" for event in events):
+            assert time.monotonic() < deadline, events
+            new = server.events(session, seen, wait=1)
+            events += new
+            seen = new[-1]["seq"] if new else seen
+        output = "".join(event["text"] for event in events if event["type"] == "output")
+        assert _stop_message(1) in output
+        assert "code_tutor.py" not in output
+    finally:
+        server.shutdown()
@@ -0,0 +1,67 @@
+from code_tutor import WATCH_PAGE, NamespaceDiff, _KernelWorker
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+
+def watching(env):
+    """A kernel worker's Variables-panel half, run in this process."""
+    worker = _KernelWorker.__new__(_KernelWorker)
+    worker.env = env
+    worker._watch = NamespaceDiff()
+    return worker
+
+
+def test_watch_sends_only_what_changed():
+    worker = watching({"__builtins__": {}, "count": 1, "empty": [], "items": [1, 2]})
+    assert sorted(worker.op_watch({"full": True})["changes"]) == [
+        ("count", "int", "1", False),
+        ("empty", "list", "[]", False),
+        ("items", "list", "[1, 2]", True),
+    ]
+    assert worker.op_watch({})["changes"] == []
+
+    worker.env["count"] = 2
+    worker.env["items"].append(3)
+    del worker.env["empty"]
+    assert sorted(worker.op_watch({})["changes"]) == [
+        ("count", "int", "2", False),
+        ("empty", None, None, False),
+        ("items", "list", "[1, 2, 3]", True),
+    ]
+
+
+def test_full_starts_over():
+    worker = watching({"x": 1})
+    worker.op_watch({"full": True})
+    assert worker.op_watch({"full": True})["changes"] == [("x", "int", "1", False)]
+
+
+def test_items_come_in_pages():
+    worker = watching({"numbers": list(range(WATCH_PAGE + 5))})
+    first = worker.op_watch_items({"path": ["numbers"], "start": 0})
+    assert len(first["items"]) == WATCH_PAGE
+    assert first["items"][0] == ("[0]", "int", "0", False)
+    assert first["more"]
+    rest = worker.op_watch_items({"path": ["numbers"], "start": WATCH_PAGE})
+    labels = [label for label, *_ in rest["items"]]
+    assert labels == [f"[{i}]" for i in range(WATCH_PAGE, WATCH_PAGE + 5)]
+    assert not rest["more"]
+    assert rest["path"] == ["numbers"] and rest["start"] == WATCH_PAGE
+
+
+def test_items_follow_a_path_into_nested_values():
+    worker = watching({"scores": {"ada": [Point(1, 2)]}})
+    [(label, type_name, _rep, openable)] = worker.op_watch_items({"path": ["scores"], "start": 0})["items"]
+    assert (label, type_name, openable) == ("'ada'", "list", True)
+    point = worker.op_watch_items({"path": ["scores", 0, 0], "start": 0})["items"]
+    assert point == [("x", "int", "1", False), ("y", "int", "2", False)]
+
+
+def test_a_path_that_went_away_gives_no_items():
+    worker = watching({"items": [1]})
+    for path in (["gone"], ["items", 5]):
+        reply = worker.op_watch_items({"path": path, "start": 0})
+        assert reply["items"] == [] and not reply["more"]